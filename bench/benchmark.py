@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_synthetic_tree
+
+# times every PMSSM plot type on synthetic trees (see bench/synthetic.py) and records the peak memory, usage:
+#   python3 bench/benchmark.py --sizes 1e4 1e5 1e6 --output bench.jsonl
+#   python3 bench/benchmark.py --sizes 1e6 --baseline bench.jsonl
+# With a baseline, plots that became slower or bigger than the tolerance allows are listed and the exit code is 1, so a campaign can be held back
+
+# benchmark cases: name, PMSSM method and its arguments
+cases = [
+    ("impact1D", "impact1D", {"drawstring": "g"}),
+    ("impact1D_logy", "impact1D", {"drawstring": "g", "xaxisDrawConfig": {"1Dlogy": True}}),
+    ("quantile1D", "quantile1D", {"drawstring": "g"}),
+    ("quantile2D", "quantile2D", {"drawstring": "abs(chi10):g", "quantile": 0.5}),
+    ("quantile2D_all", "quantile2D", {"drawstring": "abs(chi10):g", "quantile": [0.5, 0.75, 0.9, 0.99]}),
+    ("quantile2D_tdigest", "quantile2D", {"drawstring": "abs(chi10):g", "quantile": [0.5, 0.75, 0.9, 0.99], "compression": 100}),
+]
+
+
+def _peak_rss():
+    # maximum resident set size of this process in bytes. Linux reports kilobytes, macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _measure(tree, plotType, kwargs):
+    """
+    Makes one plot in a fresh process and returns the time it took and the peak memory of the process, before and after the plot
+    """
+    from ROOT import TFile, gROOT
+    from pmssm import PMSSM, particleDrawConfig_TeV
+    gROOT.SetBatch(True)
+    outdir = tempfile.mkdtemp(prefix="pmssm_bench_")
+    try:
+        rootfile = TFile(tree["treefile"])
+        pmssm = PMSSM(intree=rootfile.Get(tree["treename"]), outdir=outdir, particleConfig=particleDrawConfig_TeV, friendAnalysis=tree["friendAnalysis"])
+        before = _peak_rss()
+        start = time.perf_counter()
+        getattr(pmssm, plotType)(**kwargs)
+        seconds = time.perf_counter() - start
+        return {"seconds": seconds, "peak_rss": _peak_rss(), "rss_before": before}
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+
+def run_benchmarks(sizes, datadir, repeat=3, selected=None, seed=1):
+    """
+    Returns one result per case and size: the fastest of repeat runs and the largest peak memory. Every run is made in a new process, so that the peak memory
+    belongs to that plot alone and no run profits from the memory of another
+    @param sizes: list of numbers of points of the synthetic trees
+    @param datadir: directory in which the synthetic trees are kept between runs
+    @param repeat: number of runs per case
+    @param selected: list of case names to run. Default is all
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for entries in sizes:
+        tree = make_synthetic_tree(datadir, entries, seed)
+        for name, plotType, kwargs in cases:
+            if selected and name not in selected:
+                continue
+            runs = []
+            for _ in range(repeat):
+                with context.Pool(1) as pool:
+                    runs.append(pool.apply(_measure, (tree, plotType, kwargs)))
+            result = {"case": name, "entries": entries, "seconds": min(run["seconds"] for run in runs), "peak_rss": max(run["peak_rss"] for run in runs),
+                      "rss_before": max(run["rss_before"] for run in runs), "repeat": repeat, "time": time.time()}
+            print("%-20s %10d points %8.3f s %8.1f MB peak (%.1f MB before the plot)" % (name, entries, result["seconds"], result["peak_rss"] / 1024**2, result["rss_before"] / 1024**2))
+            results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, memoryTolerance=0.1):
+    """
+    Returns the regressions of results against a baseline, as messages: cases whose time grew by more than tolerance, or whose peak memory grew by more than memoryTolerance,
+    relative to the baseline result of the same case and size. If the baseline holds several results of a case and size, the last one is compared with
+    """
+    reference = {(result["case"], result["entries"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = reference.get((result["case"], result["entries"]))
+        if old is None:
+            continue
+        if result["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append("%s with %d points took %.3f s instead of %.3f s" % (result["case"], result["entries"], result["seconds"], old["seconds"]))
+        if result["peak_rss"] > old["peak_rss"] * (1 + memoryTolerance):
+            regressions.append("%s with %d points needed %.1f MB instead of %.1f MB" % (result["case"], result["entries"], result["peak_rss"] / 1024**2, old["peak_rss"] / 1024**2))
+    return regressions
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the PMSSM plot types on synthetic trees")
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e4, 1e5, 1e6], help="numbers of points of the synthetic trees, from 1e4 to 1e8")
+    parser.add_argument("--datadir", default="bench_data", help="directory in which the synthetic trees are written and reused")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest is kept")
+    parser.add_argument("--cases", nargs="*", help="cases to run, default all: " + ", ".join(case[0] for case in cases))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON lines file the results are appended to")
+    parser.add_argument("--baseline", help="JSON lines file of earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase of the time")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="allowed relative increase of the peak memory")
+    args = parser.parse_args()
+
+    results = run_benchmarks([int(size) for size in args.sizes], args.datadir, args.repeat, args.cases, args.seed)
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    if args.baseline:
+        regressions = compare(results, read_results(args.baseline), args.tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print("Regression:", regression)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,166 @@
+import os
+import re
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.constraints import theconstraints, zscore, branchnames, vary_signal_strength
+from utils.expressions import referenced_branches
+
+# writes synthetic MCMC trees with the branch schema of the pMSSM scan, so that the plots can be made and timed without the real trees,
+# usage: python3 bench/synthetic.py <output directory> <number of points> [seed]
+# The values are drawn from a counter based random number generator keyed by (seed, entry, stream), so every branch of an entry can be recomputed on its own:
+# the friend tree is written in a second pass over the same entries and still belongs to the same points. The distributions are only roughly physical,
+# light coloured sparticles being excluded more often than heavy ones, which is enough for the plots to look like the real ones and to exercise the same code
+
+# tree and friend tree names and file name of the cms_sus_20_001 likelihoods, as PMSSM expects them by default
+treename = "mcmc"
+friendname = "cms_sus_20_001"
+friendfile = "sus_20_001_likelihood.root"
+
+masses = ["chi10", "chi20", "chi1pm", "g", "t1", "t2", "b1", "lcsp"]
+
+_declarations = """
+namespace synthetic {
+// splitmix64 of (seed, entry, stream), uniform in (0,1)
+inline double uniform(ULong64_t seed, ULong64_t entry, ULong64_t stream) {
+    ULong64_t z = seed * 0x9E3779B97F4A7C15ULL + entry * 0xBF58476D1CE4E5B9ULL + stream * 0x94D049BB133111EBULL + 0x9E3779B97F4A7C15ULL;
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+    z = z ^ (z >> 31);
+    return ((z >> 11) + 0.5) / 9007199254740992.;
+}
+inline double normal(ULong64_t seed, ULong64_t entry, ULong64_t stream) {
+    return std::sqrt(-2 * std::log(uniform(seed, entry, 2 * stream))) * std::cos(2 * M_PI * uniform(seed, entry, 2 * stream + 1));
+}
+// component k of a random unit vector of four components, the neutralino mixing
+inline double mixing(ULong64_t seed, ULong64_t entry, int k) {
+    double n[4], norm = 0;
+    for (int i = 0; i < 4; i++) { n[i] = normal(seed, entry, 100 + i); norm += n[i] * n[i]; }
+    return n[k] / std::sqrt(norm);
+}
+}
+"""
+
+
+def schema():
+    """
+    Returns the branches the plots read: everything referenced by the constraints, z-scores and z-score branches of utils/constraints.py, with their signal strength variants,
+    the masses drawn by the plotmakers and the total cross section
+    """
+    expressions = list(theconstraints.values()) + list(zscore.values())
+    expressions += [vary_signal_strength(expression, variation) for expression in list(expressions) for variation in ["up", "down"]]
+    for key in branchnames:
+        expressions += list(branchnames[key].values())
+    branches = referenced_branches(expressions)
+    return masses + [branch for branch in branches + ["xsec_tot_pb"] if branch not in masses]
+
+
+def _signal_strength(text):
+    """
+    Signal strength of a branch name suffix, e.g. 1.5 for "150s", "15s", "mu1p5f" or "mu1p5s", 0 for "0s" or "mu0p0s"
+    """
+    match = re.fullmatch(r"mu(\d)p(\d)[fs]", text)
+    if match:
+        return int(match.group(1)) + int(match.group(2)) / 10.
+    return {"100s": 1., "150s": 1.5, "050s": 0.5, "0s": 0., "15s": 1.5, "05s": 0.5}[text]
+
+
+def definitions(seed=1):
+    """
+    Returns the C++ expressions (for RDataFrame::Define) of every branch of schema(), in an order in which they can be defined. Raises an exception for branches whose
+    meaning is unknown, so that the generator is updated whenever the constraints start to read a new branch
+    """
+    def uniform(stream):
+        return "synthetic::uniform(%d, rdfentry_, %d)" % (seed, stream)
+
+    def normal(stream):
+        return "synthetic::normal(%d, rdfentry_, %d)" % (seed, stream)
+
+    defined = {
+        "PickProbability": "0.01 + 0.99 * " + uniform(1),
+        "chi10": "(%s < 0.5 ? -1. : 1.) * 2500 * %s" % (uniform(2), uniform(3)),
+        "chi20": "(%s < 0.5 ? -1. : 1.) * (std::abs(chi10) + 2500 * %s)" % (uniform(4), uniform(5)),
+        "chi1pm": "(chi10 < 0 ? -1. : 1.) * (std::abs(chi10) + 400 * std::pow(%s, 3))" % uniform(6),
+        "g": "std::abs(chi10) + (7000 - std::abs(chi10)) * " + uniform(7),
+        "t1": "std::abs(chi10) + (7000 - std::abs(chi10)) * " + uniform(8),
+        "t2": "t1 + 2000 * " + uniform(9),
+        "b1": "std::abs(chi10) + (7000 - std::abs(chi10)) * " + uniform(10),
+        "lcsp": "std::min(std::min(g, t1), b1)",
+        "xsec_tot_pb": "std::exp(8 - lcsp / 400 + %s)" % normal(11),
+        # how strongly the analyses exclude a point, large for light coloured sparticles
+        "synthetic_sensitivity": "std::exp(-lcsp / 1500)",
+    }
+    for k in range(1, 5):
+        defined["Re_N_1%d" % k] = "synthetic::mixing(%d, rdfentry_, %d)" % (seed, k - 1)
+
+    def logbf(analysis, mu):
+        # log Bayes factor of the signal hypothesis, zero for no signal. Every analysis has its own strength and fluctuation
+        key = zlib.crc32(analysis.encode())
+        return "(%g * (-%g * synthetic_sensitivity + 0.3 * %s))" % (mu, 1 + key % 4, normal(2 * 10**6 + key % 10**6))
+
+    for branch in schema():
+        if branch in defined:
+            continue
+        llhd = re.fullmatch(r"llhd_(.+?)_(mu\d+p\d+s|\d+s)", branch)
+        bf = re.fullmatch(r"bf_(.+?)_(mu\d+p\d+[fs])", branch)
+        z = re.fullmatch(r"Zsig_(.+?)(?:_(mu\d+p\d+f|15s|05s))?", branch)
+        if llhd:
+            background = "(-5 + %s)" % normal(10**6 + zlib.crc32(llhd.group(1).encode()) % 10**6)
+            defined[branch] = background + " + " + logbf(llhd.group(1), _signal_strength(llhd.group(2)))
+        elif bf:
+            defined[branch] = "std::exp(%s)" % logbf(bf.group(1), _signal_strength(bf.group(2)))
+        elif z:
+            # same convention as zscore in utils/constraints.py: positive for an excess, negative for an exclusion
+            value = logbf(z.group(1), _signal_strength(z.group(2)) if z.group(2) else 1.)
+            defined[branch] = "(%s > 0 ? 1. : -1.) * std::sqrt(2 * std::abs(%s))" % (value, value)
+        else:
+            raise Exception("No synthetic definition for branch " + branch + ", please add one to bench/synthetic.py")
+    return defined
+
+
+def synthetic_paths(outdir, entries, seed=1):
+    """
+    Returns the paths of the tree file and of its friend file for a number of points and a seed
+    """
+    base = os.path.join(outdir, "synthetic_%d_%d" % (entries, seed))
+    return base + ".root", base + "_" + friendfile
+
+
+def make_synthetic_tree(outdir, entries, seed=1, overwrite=False):
+    """
+    Writes a synthetic MCMC tree and its cms_sus_20_001 friend tree, unless they already exist. Returns a dictionary with the "treefile", the "treename" and the
+    "friendAnalysis" to pass to PMSSM
+    @param outdir: directory in which the files are written
+    @param entries: number of points, e.g. 10**4 to 10**8
+    @param seed: seed of the random numbers. The same entries and seed always give the same trees
+    @param overwrite: writes the files even if they exist
+    """
+    import ROOT
+    treefile, friendpath = synthetic_paths(outdir, entries, seed)
+    result = {"treefile": treefile, "treename": treename, "friendAnalysis": [{"treeName": friendname, "path": friendpath}]}
+    if not overwrite and os.path.exists(treefile) and os.path.exists(friendpath):
+        return result
+    os.makedirs(outdir, exist_ok=True)
+    ROOT.gInterpreter.Declare(_declarations)
+
+    defined = definitions(seed)
+    frame = ROOT.RDataFrame(entries)
+    for branch, expression in defined.items():
+        frame = frame.Define(branch, expression)
+    branches = schema()
+    # the main tree first, then the friend tree from a second pass over the same entries. Files are written under a temporary name and renamed
+    for path, name, selected in [(treefile, treename, [b for b in branches if friendname not in b]), (friendpath, friendname, [b for b in branches if friendname in b])]:
+        tmppath = path + "." + str(os.getpid()) + ".tmp.root"
+        frame.Snapshot(name, tmppath, ROOT.std.vector("string")(selected))
+        os.replace(tmppath, path)
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python3 bench/synthetic.py <output directory> <number of points> [seed]")
+        sys.exit(1)
+    made = make_synthetic_tree(sys.argv[1], int(float(sys.argv[2])), int(sys.argv[3]) if len(sys.argv) > 3 else 1)
+    print("wrote", made["treefile"], "and", made["friendAnalysis"][0]["path"])
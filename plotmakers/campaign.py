@@ -0,0 +1,45 @@
+import sys
+import shutil
+
+sys.path.append("/Users/dorukhan/Desktop/cern/pmssm/")
+
+from pmssm import particleDrawConfig_TeV
+from utils.campaign import campaign_plots, run_campaign
+import config as pltconfig
+
+# makes the plots of all particles in pltconfig.campaignParticles in parallel, usage: python3 plotmakers/campaign.py [number of workers]
+
+root_file_path = "pmssmtree_11aug2023.root"
+tree_name = "mcmc"
+outdir = pltconfig.plotsdir
+
+deltaM = ["abs(chi1pm)-abs(chi10)","abs(chi20-chi10)","g-abs(chi10)","t1-abs(chi10)","b1-abs(chi10)","lcsp-abs(chi10)"]
+
+if __name__ == "__main__":
+    if pltconfig.refreshDir and not pltconfig.incrementalBuild:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+    tasks = campaign_plots(
+        particles = pltconfig.campaignParticles,
+        yaxisFor2D = pltconfig.yaxisFor2D,
+        quantiles2D = pltconfig.quantiles2D,
+        analysis = pltconfig.analysisName,
+        deltaMasses = deltaM,
+        )
+
+    failed = run_campaign(
+        tasks,
+        treefile = root_file_path,
+        treename = tree_name,
+        outdir = outdir,
+        nworkers = int(sys.argv[1]) if len(sys.argv) > 1 else None,
+        incremental = pltconfig.incrementalBuild,
+        particleConfig = particleDrawConfig_TeV,
+        canvasLabel = pltconfig.generalProperties,
+        defaultOutputFileFormat = pltconfig.outputFormats,
+        archive = pltconfig.archiveFile,
+        renderOnly = pltconfig.renderOnly,
+        headless = pltconfig.headless,
+        )
+    if failed:
+        sys.exit(1)
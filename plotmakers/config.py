@@ -47,8 +47,27 @@ lefttop = {
 
 yaxisFor2D =  ["abs(chi10)","abs(chi1pm)-abs(chi10)","abs(chi20-chi10)"]
 
+# particles of the full campaign made by plotmakers/campaign.py, each drawn on the x-axis of the 1D plots and of the 2D plots against yaxisFor2D
+campaignParticles = ["g","t1","t2","b1","lcsp","abs(chi10)","abs(chi20)","abs(chi1pm)","abs(chi1pm)-abs(chi10)","abs(chi20-chi10)"]
+
+quantiles2D = [0.5, 0.75, 0.9, 0.99]
+
 analysisName = "combined"
 
 plotsdir = "plots/"
 
-refreshDir = True
\ No newline at end of file
+# formats in which every plot is saved, all written from the same drawn canvas
+outputFormats = ["pdf"]
+
+# .npz file in which plotmakers/campaign.py stores the data of every plot (see utils/archive.py), None stores nothing.
+# With renderOnly the plots are drawn from this archive without reading the tree, e.g. after a style change
+archiveFile = None
+renderOnly = False
+# With headless the plots are only computed and stored in the archive, without loading ROOT if the tree is read from a column cache, to be drawn later with renderOnly
+headless = False
+
+refreshDir = True
+
+# plotmakers/campaign.py only remakes the plots whose tree files, draw configs, style settings or constraints changed since they were last made (see utils/build.py),
+# and keeps the other plots instead of refreshing the whole directory
+incrementalBuild = False
\ No newline at end of file
@@ -3,7 +3,7 @@ import shutil
 
 sys.path.append("/Users/dorukhan/Desktop/cern/pmssm/")
 
-from ROOT import *
+from ROOT import TFile
 from pmssm import PMSSM, particleDrawConfig_TeV
 import config as pltconfig
 
@@ -18,126 +18,53 @@ if pltconfig.refreshDir:
 
 
 
-root_file = TFile(root_file_path) # type: ignore
+root_file = TFile(root_file_path)
 intree = root_file.Get(tree_name)
 
 pmssm_plotter = PMSSM(
-    intree = intree, 
+    intree = intree,
     outdir = outdir,
-    particleDrawConfig= particleDrawConfig_TeV,
-    canvasStyle = pltconfig.generalProperties
+    particleConfig = particleDrawConfig_TeV,
+    canvasLabel = pltconfig.generalProperties
     )
 
-print("impact1D for: ", particleName, "\n\n")
-pmssm_plotter.impact1D(drawstring=particleName)
-
-impactPlots1DCanvasStyle = {
-    "legend":pltconfig.rightbottom["legend"].copy()
-}
-impactPlots1DCanvasStyle["legend"]["x1"] = 0.58
-impactPlots1DCanvasStyle["legend"]["x2"] = 0.78
-pmssm_plotter.impact1D(drawstring=particleName, xaxisDrawConfig={"1Dlogy":True},canvasStyle=impactPlots1DCanvasStyle)
-
-survivalPlots1DCanvasStyle = {
-    "legend":pltconfig.rightbottom["legend"].copy()
-}
-survivalPlots1DCanvasStyle["legend"]["x1"] = 0.58
-survivalPlots1DCanvasStyle["legend"]["x2"] = 0.78
-
-quantilePlots1DCanvasStyle = {
-    "legend":pltconfig.righttop["legend"].copy()
-}
-quantilePlots1DCanvasStyle["legend"]["x1"] = 0.75
-quantilePlots1DCanvasStyle["legend"]["x2"] = 0.85
+# all plots are registered first and then made together, reading the tree once instead of once per plot
+batch = pmssm_plotter.batch()
 
+print("impact1D for: ", particleName, "\n\n")
+batch.impact1D(drawstring=particleName)
+batch.impact1D(drawstring=particleName, xaxisDrawConfig={"1Dlogy":True})
 
 print("quantile 1D for: ", particleName, "\n\n")
-pmssm_plotter.quantilePlots1D(drawstring=particleName, canvasStyle=pltconfig.rightbottom)
-pmssm_plotter.quantilePlots1D(drawstring=particleName, xaxisDrawConfig={"1Dlogy":True}, canvasStyle=quantilePlots1DCanvasStyle)
+batch.quantile1D(drawstring=particleName)
+batch.quantile1D(drawstring=particleName, xaxisDrawConfig={"1Dlogy":True}, variant="variant2")
 
-print("survivalProbability1D for:",particleName, "\n\n")
-pmssm_plotter.survivalProbability1D(drawstring=particleName, canvasStyle=survivalPlots1DCanvasStyle)
-pmssm_plotter.survivalProbability1D(drawstring=particleName, xaxisDrawConfig={"1Dlogy":True} ,canvasStyle=survivalPlots1DCanvasStyle)
+# the former survivalProbability1D plots are not made, PMSSM has no 1D survival probability plot
 
-for ypar in pltconfig.yaxisFor2D:
-    print("survivalProbability2D for: ", ypar, particleName, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.survivalProbability2D(drawstring = ypar+":"+particleName,analysis=pltconfig.analysisName,contourSwitch=True, canvasStyle={"legend" :{"textColor":kWhite}})
-    else:
-        pmssm_plotter.survivalProbability2D(drawstring = ypar+":"+particleName,analysis=pltconfig.analysisName,contourSwitch=True)
-    print("0.5 quantile 2D for: ", ypar, particleName, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.5, canvasStyle={"legend" :{"textColor":kWhite}})
-    else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.5)
-    print("0.75 quantile 2D for: ", ypar, particleName, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.75, canvasStyle={"legend" :{"textColor":kWhite}})
-    else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.75)
+quantiles2D = [0.5, 0.75, 0.9, 0.99]
 
-    print("0.9 quantile 2D for: ", ypar, particleName, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.9, canvasStyle={"legend" :{"textColor":kWhite}})
-    else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.9)
-    print("0.99 quantile 2D for: ", ypar, particleName, "\n\n")
+# every quantile2D call computes all quantiles from one fill and saves one plot per quantile
+for ypar in pltconfig.yaxisFor2D:
+    print("survival2D for: ", ypar, particleName, "\n\n")
+    batch.survival2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName)
+    print(quantiles2D, "quantile 2D for: ", ypar, particleName, "\n\n")
     if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.99, canvasStyle={"legend" :{"textColor":kWhite}})
+        batch.quantile2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = quantiles2D, variant="variant2")
     else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.99)
+        batch.quantile2D(drawstring=ypar+":"+particleName,analysis=pltconfig.analysisName, quantile = quantiles2D)
 
 deltaMParticle = "g-abs(chi10)"
 for ypar in pltconfig.yaxisFor2D:
-    print("survivalProbability2D for: ", ypar, deltaMParticle, "\n\n")
-    
-    canvasStyle2D = {
-            "legend":pltconfig.leftbottom["legend"].copy()
-        }
-    canvasStyle2D["legend"]["legendNColumns"] = 1
-    
-    if ypar != "abs(chi10)":
-        pmssm_plotter.survivalProbability2D(drawstring = ypar+":"+deltaMParticle,analysis=pltconfig.analysisName,contourSwitch=True, canvasStyle=canvasStyle2D)
-    else:
-        pmssm_plotter.survivalProbability2D(drawstring = ypar+":"+deltaMParticle,analysis=pltconfig.analysisName,contourSwitch=True)
-    print("0.5 quantile 2D for: ", ypar, deltaMParticle, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.5, canvasStyle=canvasStyle2D)
-    else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.5)
-    print("0.75 quantile 2D for: ", ypar, deltaMParticle, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.75, canvasStyle=canvasStyle2D)
-    else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.75)
-
-    print("0.9 quantile 2D for: ", ypar, deltaMParticle, "\n\n")
-    if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.9, canvasStyle=canvasStyle2D)
-    else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.9)
-    print("0.99 quantile 2D for: ", ypar, deltaMParticle, "\n\n")
+    print("survival2D for: ", ypar, deltaMParticle, "\n\n")
+    batch.survival2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName,loc="leftBottom")
+    print(quantiles2D, "quantile 2D for: ", ypar, deltaMParticle, "\n\n")
     if ypar != "abs(chi10)":
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.99, canvasStyle=canvasStyle2D)
+        batch.quantile2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = quantiles2D, variant="variant2")
     else:
-        pmssm_plotter.quantilePlots2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = 0.99)
-
-
-
-survivalProbability2DCanvasStyle = {
-    "legend":pltconfig.rightbottom["legend"].copy()
-}
-survivalProbability2DCanvasStyle["legend"]["x1"] = 0.37
-survivalProbability2DCanvasStyle["legend"]["x2"] = 0.79
-survivalProbability2DCanvasStyle["legend"]["y2"] = 0.37
-survivalProbability2DCanvasStyle["legend"]["y1"] = 0.17
-    
-# survivalProbability2DanvasStyle["legend"]["x2"] = 0.85
-
-pmssm_plotter.survivalProbability2D(drawstring = deltaMParticle+":"+particleName,analysis=pltconfig.analysisName,contourSwitch=True, canvasStyle=survivalProbability2DCanvasStyle)
+        batch.quantile2D(drawstring=ypar+":"+deltaMParticle,analysis=pltconfig.analysisName, quantile = quantiles2D)
 
+batch.survival2D(drawstring=deltaMParticle+":"+particleName,analysis=pltconfig.analysisName,loc="rightBottom")
+batch.quantile2D(drawstring=deltaMParticle+":"+particleName,analysis=pltconfig.analysisName, quantile = quantiles2D)
 
-pmssm_plotter.quantilePlots2D(drawstring=deltaMParticle+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.5)
-pmssm_plotter.quantilePlots2D(drawstring=deltaMParticle+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.75)
-pmssm_plotter.quantilePlots2D(drawstring=deltaMParticle+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.9,)
-pmssm_plotter.quantilePlots2D(drawstring=deltaMParticle+":"+particleName,analysis=pltconfig.analysisName, quantile = 0.99)
+npasses = batch.execute()
+print("made all plots for", particleName, "in", npasses, "pass(es) over the tree")
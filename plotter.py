@@ -1,9 +1,15 @@
 ## Dorukhan Boncukçu
 ## 02/05/2024
 ## This styling is for CMS plots. It uses cmsstyle library 0.3.0 version.
-import cmsstyle as CMS
-from ROOT import *
 from collections.abc import Iterable
+import os
+from utils.instrument import stage
+from utils.build import record_output
+from utils.colors import kWhite
+
+# cmsstyle and ROOT are imported by the methods that draw, and not at import, so that ROOT is only loaded when a canvas is made.
+# palette of the canvases that are made, see setPalette
+ColorPalette = None
 
 class Plotter:
     def __init__(self,canvasSettings:dict = {},canvasLabel:dict = {"energy" : 13,"extraText" : "Preliminary","lumi" : "(137-139)"},):
@@ -18,7 +24,7 @@ class Plotter:
             nameXaxis = canvasSettings.get("nameXaxis",""),
             nameYaxis = canvasSettings.get("nameYaxis",""),
             canvName = canvasSettings.get("canvName",None),
-            square = canvasSettings.get("square",CMS.kSquare),
+            square = canvasSettings.get("square"),
             iPos = canvasSettings.get("iPos",11),
             extraSpace = canvasSettings.get("extraSpace",0.01),
             with_z_axis = canvasSettings.get("is3D",False),
@@ -32,6 +38,7 @@ class Plotter:
         '''
         Set the canvas labels for the plot.
         '''
+        import cmsstyle as CMS
         if canvasLabel.get("energy") is not None:
             CMS.SetEnergy(str(canvasLabel.get("energy")))
         if canvasLabel.get("extraText") is not None:
@@ -47,7 +54,7 @@ class Plotter:
         nameXaxis,
         nameYaxis,
         canvName = None,
-        square=CMS.kSquare,
+        square=None,
         iPos=11,
         extraSpace=0,
         with_z_axis=False,
@@ -62,7 +69,7 @@ class Plotter:
             y_max: Maximum value of the y-axis.
             nameXaxis: Label for the x-axis.
             nameYaxis: Label for the y-axis.
-            square: If True, canvas is square.
+            square: If True, canvas is square. Default is CMS.kSquare.
             iPos: Position of the CMS logo in the plot.
                 iPos=11 : top-left, left-aligned
                 iPos=33 : top-right, right-aligned
@@ -71,6 +78,9 @@ class Plotter:
                 mode generally : iPos = 10*(alignement 1/2/3) + position (1/2/3 = l/c/r)
             extraSpace: add extra space to the left margins to fit lable
         """
+        import cmsstyle as CMS
+        if square is None:
+            square = CMS.kSquare
         self.canvas = CMS.cmsCanvas(
             x_min = x_min,
             x_max = x_max,
@@ -90,6 +100,7 @@ class Plotter:
         '''
         Draw the object to the canvas.
         '''
+        import cmsstyle as CMS
         obj.Draw(option+ " same")
         CMS.UpdatePalettePosition(obj,self.canvas)
         # CMS.UpdatePad(self.canvas)
@@ -98,12 +109,14 @@ class Plotter:
         '''
         Update the palette position.
         '''
+        import cmsstyle as CMS
         CMS.UpdatePalettePosition(hist2D,self.canvas)
     
     def tuning(self,tuning:dict = {},hist=None):
         '''
         Tune the canvas.
         '''
+        import cmsstyle as CMS
 
         ## SetTitleOffset
         if (tuning.get("XaxisSetTitleOffset") is not None):
@@ -141,16 +154,32 @@ class Plotter:
             print("Canvas is not defined.")
         
     ## CANVAS ##
-    def SaveAs(self,path,redraw=False):
+    def SaveAs(self,path,redraw=False,formats=None):
         '''
-        Save the canvas.
+        Save the canvas. The file is written under a temporary name in the same directory and then renamed,
+        so that path is either the previous or the complete new plot, also when several processes write plots at the same time.
+        With a list of formats, e.g. ["pdf","png","root","C"], path is given without extension and one file per format is written
+        from the same drawn canvas, which is only closed after the last one.
         '''
-        if redraw:
-            CMS.CMS_lumi(self.canvas, self.canvasSettings.get("iPos",11), self.canvasSettings.get("scaleLumi",None))
-        CMS.SaveCanvas(self.canvas, path, close=True)
+        import cmsstyle as CMS
+        paths = [path] if formats is None else [path+"."+outputFormat for outputFormat in formats]
+        with stage("save", path=paths if formats is not None else path):
+            if redraw:
+                CMS.CMS_lumi(self.canvas, self.canvasSettings.get("iPos",11), self.canvasSettings.get("scaleLumi",None))
+            for index, path in enumerate(paths):
+                directory, filename = os.path.split(path)
+                tmppath = os.path.join(directory, "."+str(os.getpid())+"."+filename) # keeps the extension, which sets the output format
+                if index == 0:
+                    CMS.SaveCanvas(self.canvas, tmppath, close=False) # updates the pad once for all formats
+                else:
+                    self.canvas.SaveAs(tmppath)
+                os.replace(tmppath, path)
+                record_output(path)
+            self.canvas.Close()
     
     ## LEGEND ##
     def createLegend(self,x1,x2,y1,y2,textSize=0.02, columns=None, header=None):
+        import cmsstyle as CMS
         self.legend = CMS.cmsLeg(x1=x1,x2=x2,y1=y1,y2=y2,textSize = textSize, columns=columns)
         if header is not None:
             self.legend.SetHeader(header)
@@ -192,12 +221,24 @@ class Plotter:
     ## LEGEND ##
 
     ## Color Palette ##
+    @staticmethod
+    def setDefaultPalette(palette):
+        '''
+        Sets the palette of the canvases made from now on, without drawing anything: a palette, or a function without arguments returning it,
+        which is only called when the first canvas is made, e.g. to build a palette from the colors of ROOT without loading ROOT before.
+        '''
+        global ColorPalette
+        ColorPalette = palette
+
     @staticmethod
     def setPalette(palette = None):
+        global ColorPalette
         if palette is not None:
-            global ColorPalette
             ColorPalette = palette
+        if callable(ColorPalette):
+            ColorPalette = ColorPalette()
         if ColorPalette is not None:
+            from ROOT import gStyle
             if isinstance(ColorPalette, Iterable):
                 gStyle.SetPalette(len(ColorPalette),ColorPalette)
             else:
@@ -215,10 +256,24 @@ class Plotter:
             pass
     
     # utils
+    @staticmethod
+    def toROOT(obj):
+        '''
+        Returns the ROOT histogram of a histogram of the numpy backend (see utils/numpyhist.py), or obj itself if it is already a ROOT object.
+        Dictionaries and lists of histograms are converted entry by entry. The builders compute without ROOT, this is where their results become drawable.
+        '''
+        if isinstance(obj, dict):
+            return {key: Plotter.toROOT(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [Plotter.toROOT(value) for value in obj]
+        if hasattr(obj, "to_root"):
+            return obj.to_root()
+        return obj
     @staticmethod            
     def ScaleAxis(axis, scale_function):
         if axis.GetXbins().GetSize():
             # Variable bin sizes
+            from ROOT import TArrayD
             X = TArrayD(axis.GetXbins())
             for i in range(X.GetSize()):
                 X[i] = scale_function(X[i])
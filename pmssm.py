@@ -1,10 +1,21 @@
-from ROOT import *
 from utils.utils import *
+from utils.colors import kBlack, kOrange, kRed, kMagenta, kSolid, kDashed, kViridis
 import numpy as np
 from array import array
 import os
-from utils.plots import get_impact_plots, get_quantile_plot_1D, get_SP_plot_1D, get_SP_plot_2D, get_quantile_plot_2D, get_prior_CI, get_posterior_CI,sprobcontours
+from utils.plots import get_impact_plots, get_quantile_plot_1D, get_SP_plot_1D, get_SP_plot_2D, get_quantile_plot_2D, get_quantile_plots_2D, get_prior_CI, get_posterior_CI, contour_graphs
+from utils.constraints import sprobcontours, theconstraints, zscore, branchnames, vary_signal_strength, get_required_expressions
+from utils.columns import ColumnStore, build_column_cache
+from utils.weights import build_weight_columns, outdated
+from utils.batch import PlotBatch
+from utils.resultcache import ResultCache, using_result_cache, source_identity, file_identity
+from utils.archive import PlotArchive
+from utils.instrument import using_instrumentation, instrumented, annotate
+from utils.numpyhist import using_histogram_backend, backends
 import copy
+import inspect
+import functools
+import contextlib
 from plotter import Plotter
 
 particleDrawConfig_TeV = {
@@ -289,6 +300,24 @@ plot_settings = DotDict({
     }
 })
 
+# plot methods that can be registered in a PlotBatch, with the histogram builder type they read the tree through (see get_required_expressions in utils/plots.py)
+batchPlotTypes = {
+    "impact1D" : "impact",
+    "quantile1D" : "quantile1D",
+    "quantile2D" : "quantile2D",
+    "survival2D" : "survival2D",
+}
+
+def withSettings(method):
+    '''
+    Runs a plot method of PMSSM in the settingsContext of its object. It is applied outside of instrumented, so that the stage of the plot is recorded with the instrumentation of the object.
+    '''
+    @functools.wraps(method)
+    def wrapper(self,*args,**kwargs):
+        with self.settingsContext():
+            return method(self,*args,**kwargs)
+    return wrapper
+
 class PMSSM:
     def __init__(
         self,
@@ -296,12 +325,48 @@ class PMSSM:
         outdir : str,
         particleConfig : dict,
         canvasLabel :dict = {"energy" : "13","extraText" : "Preliminary","lumi" : "",},
-        defaultOutputFileFormat : str = "pdf",
+        defaultOutputFileFormat : str|list = "pdf",
         friendAnalysis : list[dict] = [{"treeName":"cms_sus_20_001","path":"sus_20_001_likelihood.root"}],
         globalSettings : dict = {
             "logEps": 1e-5,
-        }
+        },
+        columnCache : str|None = None,
+        resultCache : str|None = None,
+        instrumentation : str|None = None,
+        histogramBackend : str = "root",
+        archive : str|None = None,
+        renderOnly : bool = False,
+        headless : bool = False
         ):
+        """
+        Parameters:
+        defaultOutputFileFormat : str|list
+            Format or list of formats, e.g. ["pdf","png"], in which the plots are saved. All formats of a plot are written
+            from the same drawn canvas, so every further format only costs writing the file (see Plotter.SaveAs).
+        columnCache : str|None
+            Directory of a columnar cache of intree and its friends (see utils/columns.py). If it exists, it is used
+            instead of intree, which can then be None, and ROOT files are not read at all. Otherwise it is created from intree.
+            The per-point weights of every analysis are precomputed once into its "weights" subdirectory (see utils/weights.py).
+        resultCache : str|None
+            Directory in which the computed histograms and quantile maps are stored (see utils/resultcache.py). Plots that were
+            made before from the same files, with the same drawstring, binning and constraints, are then only redrawn, e.g. after a style change.
+        instrumentation : str|None
+            JSON lines file to which the wall time, CPU time, entries read and peak memory of every stage of the plot methods are appended
+            (see utils/instrument.py): the histogram builders, the fill and quantile computations and the writing of the plots.
+        histogramBackend : str
+            "root" fills ROOT histograms, "numpy" computes the histograms in numpy arrays (see utils/numpyhist.py), without ROOT,
+            and converts them to ROOT histograms only to draw them (see Plotter.toROOT). Like resultCache and instrumentation,
+            it only applies while the plots of this object are made (see settingsContext), so several objects can use different ones.
+        archive : str|None
+            .npz file in which the histograms, quantile grids and credible region contours of every plot are stored under its createName key
+            (see utils/archive.py), to restyle, combine or check plots later without the tree. The plots are then computed with the numpy backend.
+            The file is written by saveArchive, at the end of a batch and at exit.
+        renderOnly : bool
+            Draws the plots from archive instead of computing them. The tree is not opened, so intree can be None.
+        headless : bool
+            Computes the data of the plots, which are stored in archive and resultCache, without drawing them. ROOT is then not loaded at all
+            if the tree is read from columnCache, e.g. in batch workers. The plots are drawn later, e.g. with renderOnly from the archive.
+        """
         
         if outdir[-1]!="/":
                 outdir+="/"
@@ -314,20 +379,143 @@ class PMSSM:
         self.outputFormat = defaultOutputFileFormat
         self.canvasLabel = canvasLabel
         self.globalSettings = globalSettings
-        self.add_friends(self.intree,friendAnalysis)
+        self.archive = PlotArchive(archive) if archive is not None else None
+        self.renderOnly = renderOnly
+        self.headless = headless
+        if renderOnly and headless:
+            raise Exception("Plots are either only rendered from the archive (renderOnly) or only computed (headless), not both")
+        if renderOnly:
+            if archive is None:
+                raise Exception("Plots can only be rendered from an archive, please give the archive file")
+        elif columnCache is not None and ColumnStore.exists(columnCache):
+            self.intree = ColumnStore(columnCache)
+        else:
+            self.add_friends(self.intree,friendAnalysis)
+            if columnCache is not None:
+                self.intree = self.createColumnCache(columnCache,friendAnalysis)
+        if columnCache is not None and not renderOnly:
+            self.addWeightColumns(os.path.join(columnCache,"weights"))
+        # the builders only use these while a plot of this object is made, see settingsContext
+        self.resultCache = ResultCache(resultCache) if resultCache is not None else None
+        self.instrumentation = instrumentation
+        # only numpy histograms keep the style settings of the builders, so they can be archived
+        self.histogramBackend = "numpy" if archive is not None else histogramBackend
+        if self.histogramBackend not in backends:
+            raise Exception("Unknown histogram backend " + str(histogramBackend) + ", possible backends are " + " and ".join(backends))
         
-        Plotter.setPalette(self.createSurvivalPlotPalette())
+        # the palette is built from the colors of ROOT when the first canvas is made, so that ROOT is not loaded before
+        Plotter.setDefaultPalette(self.createSurvivalPlotPalette)
+    
+    @functools.cached_property
+    def survivalPalette(self):
+        return self.createSurvivalPlotPalette()
+    
+    @contextlib.contextmanager
+    def settingsContext(self):
+        '''
+        Context in which the histogram builders use the result cache, instrumentation and histogram backend of this object. These are settings of utils/resultcache.py,
+        utils/instrument.py and utils/numpyhist.py that are restored when it ends, so PMSSM objects with different settings do not change each other's.
+        The plot methods and PlotBatch.execute run in it.
+        '''
+        with using_result_cache(self.resultCache), using_instrumentation(self.instrumentation), using_histogram_backend(self.histogramBackend):
+            yield
     
     @staticmethod
     def add_friends(intree,friendAnalysis):
-        
+        from ROOT import TFile
         for friend in friendAnalysis:
             friendTreeName = friend["treeName"]
             friendTreePath = friend["path"]
             intree.AddFriend(friendTreeName,TFile(friendTreePath))
     
+    def getCachedExpressions(self):
+        '''
+        Expressions whose branches go into the column cache: the particle draw strings, all constraints and z-scores,
+        including their +-50% signal strength variants, and the z-score branches.
+        '''
+        expressions = [key for key in self.particelConfig.keys() if key != "defaults"]
+        for key in theconstraints:
+            expressions.append(theconstraints[key])
+        for key in zscore:
+            expressions.append(zscore[key])
+        for expression in list(expressions):
+            expressions.append(vary_signal_strength(expression,"up"))
+            expressions.append(vary_signal_strength(expression,"down"))
+        for key in branchnames:
+            expressions += list(branchnames[key].values())
+        return expressions
+
+    def createColumnCache(self,cachedir:str,friendAnalysis:list[dict]=[]):
+        metadata = {"friends": friendAnalysis}
+        if self.intree.GetCurrentFile():
+            metadata["file"] = self.intree.GetCurrentFile().GetName()
+            metadata["tree"] = self.intree.GetName()
+        return build_column_cache(self.intree,cachedir,self.getCachedExpressions(),metadata=metadata)
+
+    def addWeightColumns(self,weightdir:str,analyses:list[str]|None=None):
+        '''
+        Attaches the precomputed prior, posterior and z-score columns to the column cache, computing them first if weightdir does not exist yet or was written by an earlier version of build_weight_columns.
+        '''
+        weights = ColumnStore(weightdir) if ColumnStore.exists(weightdir) else None
+        if weights is not None and outdated(weights):
+            print("Weight columns in",weightdir,"were written by an earlier version, computing them again")
+            weights = None
+        if weights is None and analyses is not None:
+            weights = build_weight_columns(self.intree,weightdir,analyses=analyses)
+        elif weights is None:
+            weights = build_weight_columns(self.intree,weightdir)
+        self.intree.add_friend(weights)
+
+    def batch(self,maxbytes:int=4*1024**3):
+        '''
+        Returns a PlotBatch (see utils/batch.py) in which plots of this object can be registered and then made together,
+        reading the tree in as few passes as the memory budget maxbytes allows instead of once per plot.
+        '''
+        return PlotBatch(self,maxbytes)
+
+    def getRequiredExpressions(self,plotType:str,drawstring:str,analysis:str="combined",moreconstraints:list=[],moreconstraints_prior:bool=False,**kwargs):
+        '''
+        Expressions the plot method plotType reads from the tree for the given arguments. Other arguments (binning, style) do not change what is read.
+        '''
+        if plotType not in batchPlotTypes:
+            raise Exception("Plot type "+plotType+" can not be batched, possible types are "+", ".join(batchPlotTypes.keys()))
+        return get_required_expressions(batchPlotTypes[plotType],analysis,drawstring,moreconstraints,moreconstraints_prior)
+
+    def getDependencies(self,plotType:str,**kwargs):
+        '''
+        Everything the plots of the plot method plotType depend on for the given arguments, as a JSON serialisable dictionary (see utils/build.py):
+        the files of the tree and its friends, the draw configs of the particles on the axes, the style settings, the expressions read from the tree,
+        all arguments with their defaults and the settings of this object. The source is None if the tree can not be identified, e.g. if it only lives in memory.
+        '''
+        arguments = inspect.signature(getattr(self,plotType)).bind(**kwargs)
+        arguments.apply_defaults()
+        arguments = dict(arguments.arguments)
+        
+        particleNames = arguments["drawstring"].split(":")[::-1]
+        particles = [self.getParticleConfig(particleNames[0],arguments.get("xaxisDrawConfig"))]
+        if len(particleNames) > 1:
+            particles.append(self.getParticleConfig(particleNames[1],arguments.get("yaxisDrawConfig")))
+        
+        settings = plot_settings[plotType]
+        style = {"legend": settings.get("legend")}
+        if "variant" in settings and "variant" in arguments:
+            if arguments.get("customVariant") is not None:
+                style["variant"] = self.getCustomVariant(arguments["customVariant"],plotType,basedOn=arguments["variant"])
+            else:
+                style["variant"] = settings["variant"][arguments["variant"]]
+        
+        return {
+            "source": {"archive": file_identity(self.archive.path)} if self.renderOnly else source_identity(self.intree),
+            "particles": particles,
+            "style": style,
+            "expressions": self.getRequiredExpressions(plotType,**kwargs),
+            "arguments": arguments,
+            "settings": {"canvasLabel": self.canvasLabel, "globalSettings": self.globalSettings, "outputFormat": self.outputFormat, "headless": self.headless},
+        }
+
     @staticmethod
     def createSurvivalPlotPalette():
+        from ROOT import TColor
         custompalette = []
         cols = TColor.GetNumberOfColors()
         for i in range(cols):
@@ -381,6 +569,36 @@ class PMSSM:
         name = name.replace(")","")
         return  name
     
+    def archivedPlots(self,names:list,build):
+        '''
+        Data of the plots names, a list with one entry per name: read from the archive in render-only mode, otherwise computed by build(),
+        which returns this list, and stored in the archive if there is one. The archive file is written by saveArchive.
+        '''
+        if self.renderOnly:
+            return [self.archive.load(name) for name in names]
+        data = build()
+        if self.archive is not None:
+            for name, entry in zip(names,data):
+                self.archive.store(name,entry)
+        return data
+    
+    def saveArchive(self):
+        '''
+        Writes the data of the plots made since the last save into the archive file. Every save rewrites the whole compressed file, so the plot methods only collect
+        the data: PlotBatch.execute saves once at the end, and data that are not saved otherwise are saved when the program exits.
+        '''
+        if self.archive is not None:
+            self.archive.save()
+    
+    def getOutputFormats(self,outputFormat:str|list|None=None):
+        '''
+        List of the formats in which a plot is saved: outputFormat if given, otherwise defaultOutputFileFormat.
+        Plotter.SaveAs writes all of them from the same drawn canvas.
+        '''
+        if outputFormat is None:
+            outputFormat = self.outputFormat
+        return [outputFormat] if isinstance(outputFormat,str) else list(outputFormat)
+    
     def setGlobalSettings(self,settings:dict):
         for key in settings.keys():
             self.globalSettings[key] = settings[key]
@@ -411,6 +629,7 @@ class PMSSM:
             The lower limit of the x-axis, the upper limit of the x-axis,
             the lower limit of the y-axis, and the upper limit of the y-axis
         """
+        from ROOT import TH1, TGraph
         if isinstance(obj, TH1):
             xmin = obj.GetXaxis().GetXmin()
             xmax = obj.GetXaxis().GetXmax()
@@ -448,6 +667,8 @@ class PMSSM:
     #  ##          ##       ##     ##      ##      ##    ##        ##          ##      ##          ##       ##    ## #
     #  ##          #######  #########      ##       ######         ##          ##      ##          #######   ######  #
     ##################################################################################################################
+    @withSettings
+    @instrumented("impact1D", "drawstring", "analysis")
     def impact1D(
         self,
         drawstring : str, 
@@ -456,8 +677,19 @@ class PMSSM:
         moreconstraints_prior : bool =False,
         xaxisDrawConfig : dict = None,
         customVariant : dict|None = None,
-        variant : str = "variant1"
+        variant : str = "variant1",
+        bootstrap : int = 0,
+        outputFormat : str|list|None = None
         ):
+        """
+        Parameters:
+        bootstrap : int
+            Number of Poisson bootstrap replicas of the points from which the 68% uncertainty band of the nominal posterior is drawn (see utils/bootstrap.py).
+            All replicas are filled in the same pass over the tree as the histograms, but every selected point gets a multiplicity per replica,
+            so the fill takes about 10 ns per point and replica more, e.g. 20 s for 200 replicas of 10 million points. 0 draws no band.
+        outputFormat : str|list|None
+            Format or list of formats of the saved plot, see getOutputFormats.
+        """
         
         if customVariant is not None:
             styleSettings = self.getCustomVariant(customVariant, "impact1D", basedOn=variant)
@@ -468,8 +700,9 @@ class PMSSM:
         xaxisDrawConfig = self.getParticleConfig(xaxisParticleName,xaxisDrawConfig)
         
         name = self.createName(xaxisDrawConfig = xaxisDrawConfig ,analysis = analysis, plotType = "impact1D")
+        annotate(plot = name)
         
-        impact_plots = get_impact_plots(
+        impact_plots, = self.archivedPlots([name], lambda: [get_impact_plots(
             localtree = self.intree,
             analysis = analysis,
             hname = name,
@@ -480,7 +713,11 @@ class PMSSM:
             _logx = xaxisDrawConfig.get("logScale", False),
             drawstring = drawstring,
             moreconstraints = moreconstraints,
-            moreconstraints_prior = moreconstraints_prior)
+            moreconstraints_prior = moreconstraints_prior,
+            bootstrap = bootstrap)])
+        if self.headless:
+            return
+        impact_plots = Plotter.toROOT(impact_plots)
                 
         for key in impact_plots:
             hist = impact_plots[key]
@@ -517,6 +754,8 @@ class PMSSM:
         p.SetLog(logx = xaxisDrawConfig.get("logScale", False), logy=xaxisDrawConfig.get("1Dlogy", False))
         
         impact_plots["prior"].Draw("hist same")
+        if "posterior_band" in impact_plots:
+            impact_plots["posterior_band"].Draw("E2 same")
         impact_plots["posterior"].Draw("histsame")
         impact_plots["posterior_up"].Draw("histsame")
         impact_plots["posterior_down"].Draw("histsame")
@@ -532,12 +771,16 @@ class PMSSM:
         p.addEntryToLegend(impact_plots["posterior"],"posterior (#sigma = #sigma_{nominal} )")
         p.addEntryToLegend(impact_plots["posterior_up"],"posterior (#sigma = 1.5#times#sigma_{nominal} )")
         p.addEntryToLegend(impact_plots["posterior_down"],"posterior (#sigma =0.5#times#sigma_{nominal} )")
+        if "posterior_band" in impact_plots:
+            p.addEntryToLegend(impact_plots["posterior_band"],"posterior 68% bootstrap band","f")
         
         if (styleSettings.get("fillWhiteLegend",True)):
             p.fillWhiteLegend()
         
-        p.SaveAs(self.outdir+name+"."+self.outputFormat)
+        p.SaveAs(self.outdir+name, formats=self.getOutputFormats(outputFormat))
     
+    @withSettings
+    @instrumented("quantile1D", "drawstring", "analysis")
     def quantile1D(
         self,
         drawstring : str, 
@@ -551,8 +794,15 @@ class PMSSM:
         moreconstraints : list = [], 
         xaxisDrawConfig : dict = None,
         customVariant : dict|None = None,
-        variant : str = "variant1"
+        variant : str = "variant1",
+        compression : float|None = None,
+        outputFormat : str|list|None = None
         ):
+        """
+        Parameters:
+        outputFormat : str|list|None
+            Format or list of formats of the saved plot, see getOutputFormats.
+        """
         
         if customVariant is not None:
             styleSettings = self.getCustomVariant(customVariant, "quantile1D", basedOn=variant)
@@ -563,8 +813,9 @@ class PMSSM:
         xaxisDrawConfig = self.getParticleConfig(xaxisParticleName,xaxisDrawConfig)
         
         name = self.createName(xaxisDrawConfig = xaxisDrawConfig ,analysis = analysis, plotType = "quantile1D")
+        annotate(plot = name)
         
-        quantiles_hists = get_quantile_plot_1D(
+        quantiles_hists, = self.archivedPlots([name], lambda: [get_quantile_plot_1D(
             localtree = self.intree,
             analysis = analysis,
             hname = name,
@@ -576,9 +827,12 @@ class PMSSM:
             drawstring = drawstring,
             moreconstraints = moreconstraints,
             quantiles = [float(i) for i in quantiles.keys()],
-            _logy = xaxisDrawConfig.get("1Dlogy", False)
-        )
-        
+            _logy = xaxisDrawConfig.get("1Dlogy", False),
+            compression = compression
+        )])
+        if self.headless:
+            return
+        quantiles_hists = Plotter.toROOT(quantiles_hists)
         
         for key in quantiles_hists:
             hist = quantiles_hists[key]
@@ -643,20 +897,33 @@ class PMSSM:
         if (styleSettings.get("fillWhiteLegend",True)):
             p.fillWhiteLegend()
         
-        p.SaveAs(self.outdir+name+"."+self.outputFormat)
+        p.SaveAs(self.outdir+name, formats=self.getOutputFormats(outputFormat))
 
+    @withSettings
+    @instrumented("quantile2D", "drawstring", "analysis")
     def quantile2D(
         self,
         drawstring : str,
-        quantile : float,
+        quantile : float|list,
         analysis : str = "combined",
         moreconstraints : list = [], 
         moreconstraints_prior : bool =False,
         xaxisDrawConfig : dict = None,
         yaxisDrawConfig : dict = None,
         customVariant : dict|None = None,
-        variant : str = "variant1"
+        variant : str = "variant1",
+        compression : float|None = None,
+        outputFormat : str|list|None = None,
+        resolution : int|None = None
         ):
+        """
+        Parameters:
+        outputFormat : str|list|None
+            Format or list of formats of the saved plot, see getOutputFormats.
+        resolution : int|None
+            Computes the quantiles from sparse histograms of the Bayes factor with this many bins per decade, kept only for the occupied bins of the plot
+            (see utils/sparsequantiles.py), so that fine grids such as 200x200 need little memory. None computes exact quantiles, or t-digests with compression.
+        """
         
         if customVariant is not None:
             styleSettings = self.getCustomVariant(customVariant, "quantile2D", basedOn=variant)
@@ -668,13 +935,16 @@ class PMSSM:
         xaxisDrawConfig = self.getParticleConfig(xaxisParticleName,xaxisDrawConfig)
         yaxisDrawConfig = self.getParticleConfig(yaxisParticleName,yaxisDrawConfig)
         
-        name = self.createName(xaxisDrawConfig = xaxisDrawConfig ,analysis = analysis, plotType = "quantile2D")
+        # all quantiles are computed from the same pass over the tree, and saved in one file each
+        quantiles = quantile if type(quantile) in [list, tuple] else [quantile]
+        names = [self.createName(xaxisDrawConfig = xaxisDrawConfig, yaxisDrawConfig = yaxisDrawConfig, analysis = analysis, plotType = "quantile2D_"+str(int(100 * quantile))) for quantile in quantiles]
+        annotate(plot = names)
         
-        hist = get_quantile_plot_2D(
+        hists = self.archivedPlots(names, lambda: get_quantile_plots_2D(
             localtree = self.intree,
-            quantile=quantile,
+            quantiles = quantiles,
             analysis = analysis,
-            hname = name,
+            hnames = names,
             xtitle = xaxisDrawConfig["title"] + " ["+xaxisDrawConfig["unit"]+"]",
             xbins = xaxisDrawConfig["nbin"],
             xlow = xaxisDrawConfig["min"],
@@ -687,14 +957,150 @@ class PMSSM:
             _logy = yaxisDrawConfig.get("logScale",False),
             drawstring = drawstring,
             moreconstraints = moreconstraints,
-            moreconstraints_prior = moreconstraints_prior)
+            moreconstraints_prior = moreconstraints_prior,
+            compression = compression,
+            resolution = resolution))
+        if self.headless:
+            return
+        hists = Plotter.toROOT(hists)
+        
+        for quantile, name, hist in zip(quantiles, names, hists):
+            if not xaxisDrawConfig.get("logScale", False):
+                Plotter.scaleXaxis(hist,scaleFactor=xaxisDrawConfig.get("linearScale"))
+            if not yaxisDrawConfig.get("logScale", False):
+                Plotter.scaleYaxis(hist,scaleFactor=yaxisDrawConfig.get("linearScale"))
+        
+
+            axis_range = {
+                "xmin": xaxisDrawConfig["min"]/xaxisDrawConfig.get("linearScale",1.0),
+                "xmax": xaxisDrawConfig["max"]/xaxisDrawConfig.get("linearScale",1.0),
+                "ymin": yaxisDrawConfig["min"]/yaxisDrawConfig.get("linearScale",1.0),
+                "ymax": yaxisDrawConfig["max"]/yaxisDrawConfig.get("linearScale",1.0)
+            }
+            if xaxisDrawConfig.get("logScale", False):
+                for key in ["xmin","xmax"]:
+                    if axis_range[key] == 0:
+                        axis_range[key] = self.globalSettings.setdefault("logEps",1e-5)
                 
+                    axis_range[key] = np.log10(axis_range[key])
+            if yaxisDrawConfig.get("logScale", False):
+                for key in ["ymin","ymax"]:
+                    if axis_range[key] == 0:
+                        axis_range[key] = self.globalSettings.setdefault("logEps",1e-5)
+                    axis_range[key] = np.log10(axis_range[key])
+                    
+            p = Plotter(
+                canvasSettings={
+                    **axis_range,
+                    "nameXaxis": xaxisDrawConfig["title"]+ " ["+xaxisDrawConfig["unit"]+"]",
+                    "nameYaxis": yaxisDrawConfig["title"]+ " ["+yaxisDrawConfig["unit"]+"]",
+                    "canvName": f"canvas_{name}",
+                    "extraSpace": 0.04,
+                    "iPos": 0,
+                    "is3D": True,
+                    })
+        
+            p.SetLog(logx = xaxisDrawConfig.get("logScale", False), logy=yaxisDrawConfig.get("logScale", False))
+        
+            p.tuning(tuning=styleSettings,hist=hist)
+            p.setPalette(kViridis)
+            hist.SetContour(999)
+        
+            hist.GetZaxis().SetTitle(str(int(100 * quantile)) + "th Percentile Bayes Factor")
+            p.Draw2D(hist)
+            p.createLegend(**plot_settings.quantile2D.legend[styleSettings.get("loc","rightBottom")],header=analysis.upper())
+            if styleSettings.get("whiteColorLegend",True):
+                p.whiteColorLegend()
+        
+            if (styleSettings.get("fillWhiteLegend",True)):
+                p.fillWhiteLegend()
+        
+            p.SaveAs(self.outdir+name, formats=self.getOutputFormats(outputFormat))
+    
+
+    @withSettings
+    @instrumented("survival2D", "drawstring", "analysis")
+    def survival2D(
+        self,
+        drawstring : str,
+        analysis : str = "combined",
+        moreconstraints : list = [], 
+        moreconstraints_prior : bool =False,
+        xaxisDrawConfig : dict = None,
+        yaxisDrawConfig : dict = None,
+        contours : bool = True,
+        intervals : list = [0.1, 0.67, 0.95],
+        contourcolors : list = [kRed, kRed + 2, kMagenta],
+        loc : str = "rightTop",
+        outputFormat : str|list|None = None
+        ):
+        """
+        Parameters:
+        contours : bool
+            Draws the prior (solid) and posterior (dashed) highest density credible regions over the survival probability.
+            Their contours are computed as point lists without a pad (see get_credible_regions in utils/plots.py) and only made into graphs to be drawn,
+            so the plot can be made in a batch or in the worker processes of a campaign like the other plots.
+        intervals : list
+            Credibility intervals of the regions, in increasing order.
+        contourcolors : list
+            Colors of the contours, from the largest region to the smallest one.
+        loc : str
+            Position of the legend, a key of plot_settings.survival2D.legend.
+        outputFormat : str|list|None
+            Format or list of formats of the saved plot, see getOutputFormats.
+        """
+        
+        yaxisParticleName, xaxisParticleName = drawstring.split(":")
+        
+        xaxisDrawConfig = self.getParticleConfig(xaxisParticleName,xaxisDrawConfig)
+        yaxisDrawConfig = self.getParticleConfig(yaxisParticleName,yaxisDrawConfig)
+        
+        name = self.createName(xaxisDrawConfig = xaxisDrawConfig, yaxisDrawConfig = yaxisDrawConfig, analysis = analysis, plotType = "contours_survival2D" if contours else "survival2D")
+        annotate(plot = name)
+        
+        binning = {
+            "xbins": xaxisDrawConfig["nbin"],
+            "xlow": xaxisDrawConfig["min"],
+            "xup": xaxisDrawConfig["max"],
+            "ybins": yaxisDrawConfig["nbin"],
+            "ylow": yaxisDrawConfig["min"],
+            "yup": yaxisDrawConfig["max"],
+            "_logx": xaxisDrawConfig.get("logScale",False),
+            "_logy": yaxisDrawConfig.get("logScale",False),
+        }
+        def build():
+            plot = {"survival": get_SP_plot_2D(
+                localtree = self.intree,
+                analysis = analysis,
+                hname = name,
+                xtitle = xaxisDrawConfig["title"] + " ["+xaxisDrawConfig["unit"]+"]",
+                ytitle = yaxisDrawConfig["title"] + " ["+yaxisDrawConfig["unit"]+"]",
+                drawstring = drawstring,
+                moreconstraints = moreconstraints,
+                moreconstraints_prior = moreconstraints_prior,
+                **binning)}
+            if contours:
+                plot["prior_CI"] = get_prior_CI(self.intree, hname = name + "_priorcontours", drawstring = drawstring, moreconstraints = moreconstraints,
+                                                intervals = intervals, graphs = False, **binning)
+                plot["posterior_CI"] = get_posterior_CI(self.intree, analysis = analysis, hname = name + "_posteriorcontours", drawstring = drawstring,
+                                                        moreconstraints = moreconstraints, intervals = intervals, graphs = False, **binning)
+            return [plot]
+        
+        plot, = self.archivedPlots([name], build)
+        if self.headless:
+            return
+        hist = Plotter.toROOT(plot["survival"])
+        if contours:
+            prior_regions = plot["prior_CI"]
+            posterior_regions = plot["posterior_CI"]
+        
+        xscale = 1.0 if xaxisDrawConfig.get("logScale", False) else xaxisDrawConfig.get("linearScale",1.0)
+        yscale = 1.0 if yaxisDrawConfig.get("logScale", False) else yaxisDrawConfig.get("linearScale",1.0)
         if not xaxisDrawConfig.get("logScale", False):
-            Plotter.scaleXaxis(hist,scaleFactor=xaxisDrawConfig.get("linearScale"))
+            Plotter.scaleXaxis(hist,scaleFactor=xscale)
         if not yaxisDrawConfig.get("logScale", False):
-            Plotter.scaleYaxis(hist,scaleFactor=yaxisDrawConfig.get("linearScale"))
+            Plotter.scaleYaxis(hist,scaleFactor=yscale)
         
-
         axis_range = {
             "xmin": xaxisDrawConfig["min"]/xaxisDrawConfig.get("linearScale",1.0),
             "xmax": xaxisDrawConfig["max"]/xaxisDrawConfig.get("linearScale",1.0),
@@ -705,39 +1111,44 @@ class PMSSM:
             for key in ["xmin","xmax"]:
                 if axis_range[key] == 0:
                     axis_range[key] = self.globalSettings.setdefault("logEps",1e-5)
-                
                 axis_range[key] = np.log10(axis_range[key])
         if yaxisDrawConfig.get("logScale", False):
             for key in ["ymin","ymax"]:
                 if axis_range[key] == 0:
                     axis_range[key] = self.globalSettings.setdefault("logEps",1e-5)
                 axis_range[key] = np.log10(axis_range[key])
-                    
+        
         p = Plotter(
             canvasSettings={
                 **axis_range,
                 "nameXaxis": xaxisDrawConfig["title"]+ " ["+xaxisDrawConfig["unit"]+"]",
                 "nameYaxis": yaxisDrawConfig["title"]+ " ["+yaxisDrawConfig["unit"]+"]",
                 "canvName": f"canvas_{name}",
-                "extraSpace": 0.04,
+                "extraSpace": 0.02,
                 "iPos": 0,
                 "is3D": True,
                 })
         
         p.SetLog(logx = xaxisDrawConfig.get("logScale", False), logy=yaxisDrawConfig.get("logScale", False))
+        p.tuning(tuning={"ZaxisSetMaxDigits":3,"ZaxisSetTitleOffset":1.28,"YaxisSetTitleOffset":1.1,"XaxisSetTitleOffset":1,"XaxisSetMaxDigits":2,"SetBottomMargin":0.02},hist=hist)
+        p.setPalette(self.survivalPalette)
         
-        p.tuning(tuning=styleSettings,hist=hist)
-        p.setPalette(kViridis)
-        hist.SetContour(999)
-        
-        hist.GetZaxis().SetTitle(str(int(100 * quantile)) + "th Percentile Bayes Factor")
+        hist.GetZaxis().SetTitle("Survival Probability")
         p.Draw2D(hist)
-        p.createLegend(**plot_settings.quantile2D.legend[styleSettings.get("loc","rightBottom")],header=analysis.upper())
-        if styleSettings.get("whiteColorLegend",True):
-            p.whiteColorLegend()
+        p.createLegend(**plot_settings.survival2D.legend[loc],header=analysis.upper(),columns=2)
         
-        if (styleSettings.get("fillWhiteLegend",True)):
-            p.fillWhiteLegend()
+        if contours:
+            # the graphs are only made here, and kept until the plot is saved
+            prior_graphs = contour_graphs(prior_regions, contourcolors, [kSolid] * len(intervals), xscale, yscale)
+            posterior_graphs = contour_graphs(posterior_regions, contourcolors, [kDashed] * len(intervals), xscale, yscale)
+            for graphs in [prior_graphs, posterior_graphs]:
+                for interval in graphs:
+                    for cont in graphs[interval]:
+                        cont.Draw("same")
+            for interval in prior_graphs:
+                if len(prior_graphs[interval])>0:
+                    p.addEntryToLegend(prior_graphs[interval][0],str(int(100*(interval)))+"%  prior CI","l")
+                if len(posterior_graphs[interval])>0:
+                    p.addEntryToLegend(posterior_graphs[interval][0],str(int(100*(interval)))+"% posterior CI","l")
         
-        p.SaveAs(self.outdir+name+"."+self.outputFormat)
-    
\ No newline at end of file
+        p.SaveAs(self.outdir+name, redraw=True, formats=self.getOutputFormats(outputFormat))
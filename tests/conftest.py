@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from utils.expressions import compile_expression
+
+
+class Leaf:
+    def __init__(self, typename):
+        self.typename = typename
+
+    def GetTypeName(self):
+        return self.typename
+
+
+class ArraySource:
+    """
+    A tree of numpy arrays, read as utils.fill.read_columns reads a tree. Its branches are Double_t, or of the type given in typenames
+    """
+    def __init__(self, arrays, typenames={}):
+        self.arrays = {name: np.asarray(values, dtype=np.float64) for name, values in arrays.items()}
+        self.typenames = typenames
+        self.entries = len(next(iter(self.arrays.values())))
+
+    def GetEntries(self):
+        return self.entries
+
+    def identity(self):
+        return None
+
+    def GetLeaf(self, name):
+        return Leaf(self.typenames.get(name, "Double_t")) if name in self.arrays else None
+
+    def read_columns(self, expressions, firstentry=0, nentries=None, chunksize=1000):
+        lastentry = self.entries if nentries is None else min(firstentry + nentries, self.entries)
+        for start in range(firstentry, lastentry, chunksize):
+            stop = min(start + chunksize, lastentry)
+            yield [compile_expression(expression).evaluate({name: values[start:stop] for name, values in self.arrays.items()}, stop - start) for expression in expressions]
+
+
+@pytest.fixture
+def array_source():
+    return ArraySource
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+from utils.archive import PlotArchive
+from utils.binning import Binning
+from utils.numpyhist import NumpyHist
+
+
+def make_hist():
+    hist = NumpyHist("h", "title", [Binning(3, 0., 3.), Binning(edges=[1., 2., 5.])])
+    hist.sumw[...] = np.arange(20.).reshape(4, 5)
+    hist.sumw2[...] = 2 * hist.sumw
+    hist.entries = 7.
+    hist.SetLineColor(632)
+    hist.GetXaxis().SetTitle("m [TeV]")
+    hist.GetZaxis().SetRangeUser(0., 1.)
+    return hist
+
+
+def check_hist(hist):
+    assert hist.name == "h" and hist.title == "title"
+    assert hist.axes[0].binning == Binning(3, 0., 3.)
+    assert np.array_equal(hist.axes[1].binning.edges, [1., 2., 5.])
+    assert np.array_equal(hist.sumw, np.arange(20.).reshape(4, 5))
+    assert np.array_equal(hist.sumw2, 2 * np.arange(20.).reshape(4, 5))
+    assert hist.entries == 7.
+    assert hist.calls == [("SetLineColor", (632,))]
+    assert hist.GetXaxis().calls == [("SetTitle", ("m [TeV]",))]
+    assert hist.GetZaxis().calls == [("SetRangeUser", (0., 1.))]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "plots.npz")
+    archive = PlotArchive(path)
+    archive.store("plot", {"hist": make_hist(), "contours": [(np.array([1., 2.]), np.array([3., 4.]))], "levels": (0.5, 2), "label": None})
+    check_hist(archive.load("plot")["hist"])  # also before it is saved
+    archive.save()
+
+    data = PlotArchive(path).load("plot")
+    check_hist(data["hist"])
+    x, y = data["contours"][0]
+    assert np.array_equal(x, [1., 2.]) and np.array_equal(y, [3., 4.])
+    assert data["levels"] == (0.5, 2) and data["label"] is None
+
+
+def test_entries_are_saved_once(tmp_path):
+    path = str(tmp_path / "plots.npz")
+    archive = PlotArchive(path)
+    archive.store("a", make_hist())
+    archive.store("b", np.arange(3.))
+    assert not os.path.exists(path)
+    archive.save()
+
+    # saving replaces the entries of the same names and keeps the others
+    archive = PlotArchive(path)
+    archive.store("b", np.arange(4.))
+    archive.save()
+    archive = PlotArchive(path)
+    assert archive.names() == ["a", "b"]
+    check_hist(archive.load("a"))
+    assert np.array_equal(archive.load("b"), np.arange(4.))
+
+
+def test_entries_taken_by_another_archive(tmp_path):
+    worker, main = PlotArchive(str(tmp_path / "worker.npz")), PlotArchive(str(tmp_path / "main.npz"))
+    worker.autosave = False
+    worker.store("a", make_hist())
+    main.update(worker.take())
+    assert worker.names() == [] and main.names() == ["a"]
+    check_hist(main.load("a"))
@@ -0,0 +1,54 @@
+import math
+import numpy as np
+import pytest
+from utils.binning import Binning, binning
+from utils.utils import mkhistlogx, mkhistlogxy
+from utils.numpyhist import NumpyHist, using_histogram_backend
+
+cases = [(100, 10., 10000., True), (50, 0., 5., True), (20, 1E-5, 1E5, True), (33, 0.3, 0., True), (30, 0., 3000., False), (7, -1.5, 2.2, False)]
+
+
+def baseline_edges(nbins, xmin, xmax, logx):
+    # the bin edges mkhistlogx computed before, with TMath.Log10 and TMath.Power
+    if logx:
+        logxmin = 0 if xmin == 0 else math.log10(xmin)
+        logxmax = 0 if xmax == 0 else math.log10(xmax)
+    else:
+        logxmin, logxmax = xmin, xmax
+    binwidth = (logxmax - logxmin) / nbins
+    return [math.pow(10, logxmin + i * binwidth) if logx else xmin + i * binwidth for i in range(nbins + 1)]
+
+
+@pytest.mark.parametrize("nbins, low, up, log", cases)
+def test_edges_as_mkhistlogx(nbins, low, up, log):
+    np.testing.assert_array_max_ulp(Binning(nbins, low, up, log).edges, np.array(baseline_edges(nbins, low, up, log)), maxulp=1)
+
+
+def test_histograms_of_the_numpy_backend():
+    with using_histogram_backend("numpy"):
+        hist = mkhistlogx("h", "title", 100, 10., 10000.)
+        hist2D = mkhistlogxy("h2", "", 30, 0., 3000., 20, 1E-5, 1E5, False, True)
+    assert isinstance(hist, NumpyHist) and hist.sumw.shape == (102,)
+    np.testing.assert_array_max_ulp(hist.GetXaxis().binning.edges, np.array(baseline_edges(100, 10., 10000., True)), maxulp=1)
+    assert hist2D.sumw.shape == (22, 32)
+    assert hist2D.GetYaxis().binning is binning(20, 1E-5, 1E5, True)
+
+
+def test_find_bins_as_taxis():
+    axis = Binning(4, 0., 2.)
+    # a value on an edge belongs to the bin above it, the upper edge to the overflow
+    assert np.array_equal(axis.find_bins([-0.1, 0., 0.25, 0.5, 1.99, 2., np.inf]), [0, 1, 1, 2, 4, 5, 5])
+    assert np.array_equal(axis.centres(), [0.25, 0.75, 1.25, 1.75])
+
+
+def test_equality_and_variable_edges():
+    assert Binning(10, 0, 1) == Binning(10, 0., 1.) and hash(Binning(10, 0, 1)) == hash(Binning(10, 0., 1.))
+    assert Binning(10, 0., 1.) != Binning(10, 0., 1., log=True)
+    variable = Binning(edges=[0., 1., 5.])
+    assert variable.nbins == 2 and variable.low == 0. and variable.up == 5.
+    assert variable == Binning(edges=(0, 1, 5))
+    assert not variable.edges.flags.writeable
+    with pytest.raises(Exception):
+        Binning(edges=[0., 2., 1.])
+    with pytest.raises(Exception):
+        Binning(0, 0., 1.)
@@ -0,0 +1,48 @@
+import numpy as np
+from utils.bootstrap import poisson_multiplicities, BootstrapAccumulator, fill_bands, _poisson_cdf, _splitmix64
+from utils.mapreduce import accumulate
+from utils.numpyhist import NumpyHist
+from utils.binning import Binning
+
+
+def reference_multiplicities(seed, entries, replicas):
+    # one hash and one binary search per multiplicity
+    with np.errstate(over="ignore"):
+        z = (np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(0x9E3779B97F4A7C15)
+             + entries.astype(np.uint64)[None, :] * np.uint64(0xBF58476D1CE4E5B9) + replicas.astype(np.uint64)[:, None] * np.uint64(0x94D049BB133111EB))
+        u = ((_splitmix64(z) >> np.uint64(11)).astype(np.float64) + 0.5) / 9007199254740992.
+    return np.searchsorted(_poisson_cdf, u, side="right")
+
+
+def test_multiplicities():
+    entries, replicas = np.arange(100000), np.arange(20)
+    multiplicities = poisson_multiplicities(3, entries, replicas)
+    assert np.array_equal(multiplicities, reference_multiplicities(3, entries, replicas))
+    assert abs(multiplicities.mean() - 1.) < 0.01 and abs(multiplicities.var() - 1.) < 0.01
+    # the same for any subset of the entries and replicas
+    assert np.array_equal(poisson_multiplicities(3, entries[500:700], replicas[5:8]), multiplicities[5:8, 500:700])
+    assert not np.array_equal(poisson_multiplicities(4, entries, replicas), multiplicities)
+
+
+def test_replicas_do_not_depend_on_chunks(array_source):
+    rng = np.random.default_rng(1)
+    source = array_source({"x": rng.uniform(0, 1, 1000), "w": rng.uniform(0, 2, 1000) * (rng.uniform(0, 1, 1000) > 0.3)})
+    edges = [np.linspace(0, 1, 6)]
+    whole, = accumulate(source, [BootstrapAccumulator(["x"], edges, "w", replicas=50)])
+    chunked, = accumulate(source, [BootstrapAccumulator(["x"], edges, "w", replicas=50)], chunksize=77)
+    assert np.allclose(whole.replicated, chunked.replicated)
+    assert np.allclose(whole.replicated.mean(axis=0), whole.sumw, rtol=0.1)
+
+
+def test_band_of_a_normalised_histogram(array_source):
+    rng = np.random.default_rng(2)
+    source = array_source({"x": rng.uniform(0, 1, 5000), "w": np.ones(5000)})
+    hist, band = NumpyHist("h", "", [Binning(5, 0., 1.)]), NumpyHist("band", "", [Binning(5, 0., 1.)])
+    totals = fill_bands(source, "x", ["w"], [hist], [(band, 0, None)], replicas=100)
+    assert totals == [5000.]
+    assert np.array_equal(hist.sumw[1:-1], np.bincount(np.floor(source.arrays["x"] * 5).astype(int), minlength=5))
+    # the band is centred on the normalised histogram, with about the binomial error of a bin
+    assert np.allclose(band.sumw[1:-1], hist.sumw[1:-1] / 5000, atol=0.01)
+    errors = np.sqrt(band.sumw2[1:-1]) / np.sqrt(0.2 * 0.8 / 5000)
+    assert abs(errors.mean() - 1.) < 0.2 and np.all((errors > 0.5) & (errors < 1.5))
+    assert band.entries == 100
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from utils.columns import ColumnStore, build_column_cache, build_expression_columns, MemoryColumns
+from utils.expressions import compile_expression
+from utils.fill import read_columns
+
+
+@pytest.fixture
+def source(array_source):
+    rng = np.random.default_rng(5)
+    n = 1000
+    return array_source({"g": rng.uniform(0, 7000, n).astype(np.float32), "chi10": rng.uniform(-1000, 1000, n), "PickProbability": rng.uniform(0.1, 1, n),
+                         "nLSP": rng.integers(0, 3, n), "unused": np.zeros(n)}, typenames={"g": "Float_t", "nLSP": "Int_t"})
+
+
+expressions = ["g", "abs(chi10)", "g-abs(chi10)", "(1/PickProbability)*(nLSP==1)"]
+
+
+def evaluated(source, expression):
+    return compile_expression(expression).evaluate(source.arrays, source.GetEntries())
+
+
+def test_round_trip(tmp_path, source):
+    cachedir = str(tmp_path / "columns")
+    assert not ColumnStore.exists(cachedir)
+    store = build_column_cache(source, cachedir, expressions + ["notabranch"], metadata={"file": "tree.root"}, chunksize=300)
+    assert ColumnStore.exists(cachedir)
+    # only the referenced branches, in the type of the tree. g holds values of single precision, as a Float_t branch
+    assert sorted(store.branches) == ["PickProbability", "chi10", "g", "nLSP"]
+    assert store.column("g").dtype == np.float32 and store.column("nLSP").dtype == np.int32 and store.column("chi10").dtype == np.float64
+    assert store.manifest["metadata"] == {"file": "tree.root"}
+
+    store = ColumnStore(cachedir)
+    assert store.GetEntries() == 1000
+    for expression, values in zip(expressions, np.concatenate([np.array(chunk) for chunk in read_columns(store, expressions, chunksize=128)], axis=1)):
+        assert np.array_equal(values, evaluated(source, expression)), expression
+    assert np.array_equal(store.evaluate("abs(chi10)", 10, 20), np.abs(source.arrays["chi10"][10:20]))
+
+
+def test_precomputed_expressions(tmp_path, source):
+    store = build_column_cache(source, str(tmp_path / "columns"), expressions)
+    friend = build_expression_columns(store, str(tmp_path / "weights"), {"prior": "(1/PickProbability)*(nLSP==1)"}, dtypes={"prior": np.float32})
+    store.add_friend(friend)
+    assert np.array_equal(store.lookup("(1/PickProbability)*(nLSP==1)"), friend.column("prior"))
+    assert store.lookup("g") is None
+    assert np.array_equal(store.evaluate("(1/PickProbability)*(nLSP==1)"), friend.column("prior").astype(np.float64))
+    assert friend.manifest["metadata"]["source"] == store.cachedir
+
+
+def test_memory_columns(source):
+    columns = MemoryColumns(source, expressions, chunksize=300)
+    assert columns.GetEntries() == 1000
+    for expression, values in zip(expressions, next(columns.read_columns(expressions, chunksize=1000))):
+        assert np.array_equal(values, evaluated(source, expression))
+    with pytest.raises(Exception, match="not read into memory"):
+        next(columns.read_columns(["chi10"]))
@@ -0,0 +1,88 @@
+import sys
+import numpy as np
+from utils.credible import containment_thresholds, credible_contours
+from utils.plots import getThresholdForContainment, get_credible_regions
+from utils.numpyhist import NumpyHist, using_histogram_backend
+from utils.binning import Binning
+
+intervals = [0.1, 0.67, 0.95]
+
+
+def baseline_thresholds(hist, intervals):
+    # getThresholdForContainment as it was, bin by bin with GetBinContent
+    contents = []
+    thresholds = []
+    total = 0
+    for xbin in range(hist.GetNbinsX() + 1):
+        for ybin in range(hist.GetNbinsY() + 1):
+            val = hist.sumw[ybin, xbin]
+            if val >= 0:
+                contents.append(val)
+                total += val
+    contents.sort(reverse=True)
+    threshold = 0
+    intervalix = 0
+    for val in contents:
+        threshold += val
+        if threshold >= intervals[intervalix] * total:
+            thresholds.append(val)
+            intervalix += 1
+            if intervalix == len(intervals):
+                break
+    thresholds.sort()
+    return thresholds
+
+
+def density(seed, nx=40, ny=30):
+    rng = np.random.default_rng(seed)
+    hist = NumpyHist("density", "", [Binning(nx, 0., 1.), Binning(ny, 0., 1.)])
+    x, y = rng.normal(0.5, 0.15, 20000), rng.normal(0.4, 0.2, 20000)
+    inside = (x > 0) & (x < 1) & (y > 0) & (y < 1)  # the former thresholds also counted the underflow bins
+    weights = rng.exponential(1., 20000)
+    hist.sumw[1:-1, 1:-1] = np.histogram2d(y[inside], x[inside], bins=[ny, nx], range=[[0, 1], [0, 1]], weights=weights[inside])[0]
+    return hist
+
+
+def test_thresholds_as_before():
+    for seed in range(5):
+        hist = density(seed)
+        assert getThresholdForContainment(hist, intervals) == baseline_thresholds(hist, intervals)
+        assert np.array_equal(containment_thresholds(hist.sumw[1:-1, 1:-1], intervals), baseline_thresholds(hist, intervals))
+
+
+def test_thresholds_ignore_negative_bins():
+    values = np.array([[4., -10.], [3., 2.], [1., 0.]])
+    assert np.array_equal(containment_thresholds(values, [0.4, 0.7, 1.]), [1., 3., 4.])
+    assert np.array_equal(containment_thresholds(np.zeros((0, 3)), intervals), np.zeros(3))
+
+
+def test_contours_of_a_gaussian():
+    # the highest density region of probability p of a 2D standard normal density is the disk of radius sqrt(-2 ln(1-p))
+    centres = (np.arange(200) + 0.5) / 200 * 10 - 5
+    x, y = np.meshgrid(centres, centres)
+    values = np.exp(-(x * x + y * y) / 2)
+    regions = credible_contours(values, centres, centres, intervals, smoothed=False)
+    assert list(regions) == intervals[::-1]
+    for interval, lines in regions.items():
+        assert len(lines) == 1
+        xs, ys = lines[0]
+        assert xs[0] == xs[-1] and ys[0] == ys[-1]  # closed
+        assert np.allclose(np.hypot(xs, ys), np.sqrt(-2 * np.log(1 - interval)), rtol=0.03), interval
+
+
+def test_contours_of_an_empty_density():
+    regions = credible_contours(np.zeros((10, 10)), np.arange(10.), np.arange(10.), intervals)
+    assert all(lines == [] for lines in regions.values())
+
+
+def test_credible_regions_without_root(array_source):
+    rng = np.random.default_rng(3)
+    source = array_source({"x": rng.normal(0, 1, 50000), "y": rng.normal(0, 1, 50000), "w": np.ones(50000)})
+    with using_histogram_backend("numpy"):
+        regions = get_credible_regions(source, "density", 50, -5, 5, 50, -5, 5, False, False, "y:x", "(w)", intervals)
+    for interval, lines in regions.items():
+        assert len(lines) == 1
+        xs, ys = lines[0]
+        # drawn on the smoothed density of bins of width 0.2, so only about at the radius of the region
+        assert abs(np.hypot(xs, ys).mean() / np.sqrt(-2 * np.log(1 - interval)) - 1) < 0.25, interval
+    assert "ROOT" not in sys.modules
@@ -0,0 +1,64 @@
+import numpy as np
+from utils.expressions import compile_expression, product_factors, referenced_branches, ExpressionCache
+from utils.constraints import zscore, theconstraints
+
+# Bayes factors at which the protected operations of TTreeFormula matter: 1 (log B = 0), 0 (clamped to 1E-5 by the z-score expressions), and one below and above 1
+bayesfactors = np.array([1., 0., 0.5, 2.])
+
+
+def evaluate(expression, **columns):
+    n = len(next(iter(columns.values()))) if columns else 1
+    return compile_expression(expression).evaluate(columns, n)
+
+
+def test_division_by_zero_is_zero():
+    a = np.array([1., -2., 0., 3.])
+    b = np.array([0., 0., 0., 2.])
+    assert np.array_equal(evaluate("a/b", a=a, b=b), [0., 0., 0., 1.5])
+    assert np.array_equal(evaluate("1/(b-b)", b=b), np.zeros(4))
+
+
+def test_log_and_sqrt_outside_of_their_domain():
+    x = np.array([-1., 0., 1., np.e])
+    assert np.allclose(evaluate("log(x)", x=x), [0., 0., 0., 1.])
+    assert np.allclose(evaluate("log10(x)", x=x * 10), [0., 0., 1., np.log10(10 * np.e)])
+    assert np.allclose(evaluate("sqrt(x)", x=x), [1., 0., 1., np.sqrt(np.e)])
+    # the TMath functions are not protected in TTreeFormula either
+    assert evaluate("TMath::Log(x)", x=np.array([0.]))[0] == -np.inf
+
+
+def test_zscore_cut_as_ttreeformula():
+    for analysis, expression in zscore.items():
+        # the z-score of the Bayes factor as a branch of its own
+        expression = expression.replace(theconstraints[analysis], "bf")
+        z = evaluate(expression, bf=bayesfactors)
+        # TTreeFormula: log B = 0 gives 0/0 = 0, which survives the cut. TMath::Log(0) is -inf and inf/-inf is NaN, which does not
+        assert np.allclose(z, [0., np.nan, -np.sqrt(2 * np.log(2.)), np.sqrt(2 * np.log(2.))], equal_nan=True), analysis
+        assert np.array_equal(evaluate("(" + expression + ">-1.64)", bf=bayesfactors), [1., 0., 1., 1.]), analysis
+
+
+def test_zscore_of_stored_bayes_factor():
+    # the stored Bayes factors are clamped to 1E-5
+    expression = zscore["cms_sus_21_006"]
+    z = evaluate(expression, bf_cms_sus_21_006_mu1p0f=bayesfactors)
+    assert np.allclose(z, [0., -np.sqrt(2 * np.log(1E5)), -np.sqrt(2 * np.log(2.)), np.sqrt(2 * np.log(2.))])
+
+
+def test_operators_and_functions():
+    x = np.array([1., 2., 3.])
+    y = np.array([3., 2., 1.])
+    assert np.array_equal(evaluate("x>1 && y>1", x=x, y=y), [0., 1., 0.])
+    assert np.array_equal(evaluate("x>2 || !(y>1)", x=x, y=y), [0., 0., 1.])
+    assert np.allclose(evaluate("-x**2+abs(y-3)*2", x=x, y=y), [-1., -2., -5.])
+    assert np.allclose(evaluate("max(x,y)*TMath::Exp(0)", x=x, y=y), [3., 2., 3.])
+    assert np.array_equal(evaluate("(1)", x=x), np.ones(3))
+
+
+def test_product_factors_and_cache():
+    assert product_factors("(1/PickProbability)*(1)*(exp(a))") == ["(1/PickProbability)", "(1)", "(exp(a))"]
+    assert product_factors("a+b*c") == ["a+b*c"]
+    columns = {"a": np.array([0., 1.]), "PickProbability": np.array([0.5, 0.25])}
+    cache = ExpressionCache()
+    result = cache.evaluate("(1/PickProbability)*(exp(a))", lambda branch: columns[branch], 2, key=(0, 2))
+    assert np.allclose(result, [2., 4. * np.e])
+    assert ("(1/PickProbability)", (0, 2)) in cache.arrays
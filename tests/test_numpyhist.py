@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from utils.numpyhist import NumpyHist, using_histogram_backend, histogram_backend, set_histogram_backend
+from utils.binning import Binning
+
+
+def filled(name="h", seed=0):
+    rng = np.random.default_rng(seed)
+    hist = NumpyHist(name, "", [Binning(4, 0., 2.), Binning(3, -1., 2.)])
+    x, y, w = rng.uniform(-0.5, 2.5, 1000), rng.uniform(-1.5, 2.5, 1000), rng.exponential(1., 1000)
+    hist.FillN(1000, x, y, w)
+    return hist, x, y, w
+
+
+def test_fill_as_th2():
+    hist, x, y, w = filled()
+    # the bins including the underflow and overflow, as hist_array of a TH2: [ybin, xbin]
+    xedges, yedges = np.r_[-np.inf, np.linspace(0., 2., 5), np.inf], np.r_[-np.inf, np.linspace(-1., 2., 4), np.inf]
+    assert np.allclose(hist.sumw, np.histogram2d(y, x, bins=[yedges, xedges], weights=w)[0])
+    assert np.allclose(hist.sumw2, np.histogram2d(y, x, bins=[yedges, xedges], weights=w * w)[0])
+    assert hist.GetEntries() == 1000 and hist.GetNbinsX() == 4 and hist.GetNbinsY() == 3 and hist.GetNbinsZ() == 1
+    assert hist.ClassName() == "TH2F" and hist.GetDimension() == 2
+
+
+def test_scale_and_divide():
+    numerator, _, _, _ = filled("n", 1)
+    denominator, _, _, _ = filled("d", 2)
+    denominator.sumw[1, 1] = denominator.sumw2[1, 1] = 0.
+    expected = numerator.Clone()
+    numerator.Scale(2.)
+    assert np.allclose(numerator.sumw, 2 * expected.sumw) and np.allclose(numerator.sumw2, 4 * expected.sumw2)
+
+    c1, e1, c2, e2 = numerator.sumw, numerator.sumw2, denominator.sumw, denominator.sumw2
+    ratio = numerator.Clone("ratio")
+    ratio.Divide(denominator)
+    filled_bins = c2 != 0
+    c1, e1, c2, e2 = c1[filled_bins], e1[filled_bins], c2[filled_bins], e2[filled_bins]
+    # TH1::Divide of independent histograms
+    assert np.allclose(ratio.sumw[filled_bins], c1 / c2)
+    assert np.allclose(ratio.sumw2[filled_bins], (e1 * c2 ** 2 + e2 * c1 ** 2) / c2 ** 4)
+    assert ratio.sumw[1, 1] == 0. and ratio.sumw2[1, 1] == 0.
+    assert ratio.GetName() == "ratio" and numerator.GetName() == "n"
+
+
+def test_clone_is_independent():
+    hist, _, _, _ = filled()
+    clone = hist.Clone()
+    clone.Scale(0.)
+    clone.SetLineColor(2)
+    assert hist.sumw.sum() > 0 and hist.calls == []
+
+
+def test_settings_are_recorded():
+    hist, _, _, _ = filled()
+    assert hist.GetMaximum() == hist.inside().max() and hist.GetMinimum() == hist.inside().min()
+    hist.SetMaximum(5.)
+    hist.SetMinimum(0.1)
+    hist.GetXaxis().SetTitle("x")
+    hist.GetZaxis().SetTitle("z")
+    assert hist.GetMaximum() == 5. and hist.GetMinimum() == 0.1
+    assert hist.calls == [("SetMaximum", (5.,)), ("SetMinimum", (0.1,))]
+    assert hist.GetXaxis().calls == [("SetTitle", ("x",))] and hist.GetZaxis().calls == [("SetTitle", ("z",))]
+    assert hist.GetXaxis().GetBinLowEdge(2) == 0.5 and hist.GetXaxis().GetXmax() == 2.
+    with pytest.raises(AttributeError):
+        hist.Integral()
+
+
+def test_backend_context():
+    assert histogram_backend() == "root"
+    with using_histogram_backend("numpy"):
+        assert histogram_backend() == "numpy"
+        with pytest.raises(Exception):
+            with using_histogram_backend("numpy"):
+                raise Exception("failed plot")
+        assert histogram_backend() == "numpy"
+    assert histogram_backend() == "root"
+    with pytest.raises(Exception, match="Unknown histogram backend"):
+        set_histogram_backend("cupy")
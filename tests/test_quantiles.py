@@ -0,0 +1,54 @@
+import numpy as np
+from utils.quantiles import weighted_quantiles
+from utils.mapreduce import QuantileAccumulator
+from utils.tdigest import TDigestAccumulator
+from utils.sparsequantiles import SparseQuantileAccumulator
+
+
+def test_weighted_quantiles():
+    cells = np.array([0, 0, 0, 2])
+    values = np.array([3., 1., 2., 5.])
+    weights = np.array([1., 1., 1., 1.])
+    result = weighted_quantiles(cells, values, weights, 3, [0.5, 1.])
+    assert np.array_equal(result, [[2., 3.], [np.nan, np.nan], [5., 5.]], equal_nan=True)
+
+
+def test_weighted_quantiles_after_a_cell_of_large_weight():
+    # the cumulative weight of the first cell is far above the precision of the weights of the second
+    cells = np.array([0, 0, 1, 1, 1])
+    values = np.array([1., 2., 1., 2., 3.])
+    weights = np.array([1E17, 3E17, 1., 1., 1.])
+    result = weighted_quantiles(cells, values, weights, 2, [0.2, 0.5, 1.])
+    assert np.array_equal(result, [[1., 2., 2.], [1., 2., 3.]])
+
+
+def test_digest_quantiles_after_a_cell_of_large_weight():
+    acc = TDigestAccumulator(["x"], [np.linspace(0, 2, 3)], "v", "w", 100)
+    acc.fill({"x": np.array([0.5, 0.5, 1.5, 1.5, 1.5]), "v": np.array([1., 2., 1., 2., 3.]), "w": np.array([1E17, 3E17, 1., 1., 1.])})
+    assert np.allclose(acc.quantiles([0.5])[2], [2.])
+
+
+def test_sparse_quantiles_after_a_cell_of_large_weight():
+    acc = SparseQuantileAccumulator(["x"], [np.linspace(0, 2, 3)], "v", "w", resolution=100)
+    acc.fill({"x": np.array([0.5, 0.5, 1.5, 1.5, 1.5]), "v": np.array([1., 2., 1., 10., 100.]), "w": np.array([1E17, 3E17, 1., 1., 1.])})
+    # the median falls in the middle of the value bin of 10
+    assert np.allclose(acc.quantiles([0.5])[2], [10 ** 1.005])
+
+
+def test_weighted_quantiles_without_positive_weight():
+    result = weighted_quantiles(np.array([0, 1]), np.array([1., 2.]), np.array([0., -1.]), 3, [0.5, 0.9])
+    assert result.shape == (3, 2)
+    assert np.isnan(result).all()
+
+
+def test_quantile_accumulator_without_selected_points():
+    acc = QuantileAccumulator(["x", "y"], [np.linspace(0, 1, 3), np.linspace(0, 1, 3)], "v", "w")
+    acc.fill({"x": np.array([0.2, 0.7]), "y": np.array([0.3, 0.6]), "v": np.array([1., 2.]), "w": np.zeros(2)})
+    assert np.isnan(acc.quantiles([0.5])).all()
+
+
+def test_digest_and_sparse_quantiles_without_selected_points():
+    columns = {"x": np.array([0.2, 0.7]), "v": np.array([1., 2.]), "w": np.zeros(2)}
+    for acc in [TDigestAccumulator(["x"], [np.linspace(0, 1, 3)], "v", "w", 100), SparseQuantileAccumulator(["x"], [np.linspace(0, 1, 3)], "v", "w")]:
+        acc.fill(columns)
+        assert np.isnan(acc.quantiles([0.5, 0.9])).all()
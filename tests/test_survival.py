@@ -0,0 +1,34 @@
+import numpy as np
+from utils.survival import zscores, zcut, SurvivalAccumulator
+from utils.expressions import compile_expression
+from utils.constraints import zscore, theconstraints
+from utils.numpyhist import NumpyHist
+from utils.binning import Binning
+
+bayesfactors = np.array([1., 1E-5, 0.5, 2., 0.1, 30.])
+
+
+def test_zscores_as_expressions():
+    for analysis, expression in zscore.items():
+        expression = expression.replace(theconstraints[analysis], "bf")
+        expected = compile_expression(expression).evaluate({"bf": bayesfactors}, len(bayesfactors))
+        assert np.allclose(zscores(bayesfactors), expected), analysis
+
+
+def test_bayes_factor_of_one_survives():
+    assert zscores(np.array([1.]))[0] == 0.
+    assert zscores(np.array([1.]))[0] > zcut
+
+
+def test_survival_accumulator_fills_cut_weights():
+    n = len(bayesfactors)
+    columns = {"x": np.arange(n) + 0.5, "prior": np.ones(n), "w": np.full(n, 2.), "bf": bayesfactors}
+    survived = compile_expression("(" + zscore["cms_sus_21_006"].replace(theconstraints["cms_sus_21_006"], "bf") + ">-1.64)").evaluate(columns, n)
+    acc = SurvivalAccumulator(["x"], [np.arange(n + 1.)], "prior", "w", ["bf"])
+    acc.fill(columns)
+    prior, posterior = [NumpyHist("h%d" % i, "", [Binning(n, 0., n)]) for i in range(2)]
+    acc.fill_hists(0, [prior, posterior])
+    assert np.array_equal(prior.sumw[1:-1], np.ones(n))
+    assert np.array_equal(posterior.sumw[1:-1], 2 * survived)
+    assert np.array_equal(posterior.sumw2[1:-1], 4 * survived)
+    assert posterior.entries == np.count_nonzero(survived)
@@ -0,0 +1,33 @@
+import json
+import os
+import numpy as np
+import pytest
+from utils.weights import build_weight_columns, outdated
+from utils.columns import ColumnStore
+
+
+def test_survival_flags_and_version(tmp_path, array_source):
+    bayesfactors = np.array([1., 0., 0.5, 2.])
+    source = array_source({"PickProbability": np.full(4, 0.5), "bf_cms_sus_21_006_mu1p0f": bayesfactors,
+                           "bf_cms_sus_21_006_mu1p5f": bayesfactors, "bf_cms_sus_21_006_mu0p5f": bayesfactors})
+    weights = build_weight_columns(source, str(tmp_path / "weights"), analyses=["cms_sus_21_006"], chunksize=3)
+    assert np.array_equal(weights.column("cms_sus_21_006__survived"), [1, 0, 1, 1])
+    assert np.allclose(weights.column("cms_sus_21_006__zscore"), [0., -np.sqrt(2 * np.log(1E5)), -np.sqrt(2 * np.log(2.)), np.sqrt(2 * np.log(2.))])
+    assert weights.column("cms_sus_21_006__posterior").dtype == np.float64
+    assert not outdated(weights)
+
+    # a store written before the weight columns had a version
+    manifest = os.path.join(weights.cachedir, "manifest.json")
+    with open(manifest) as f:
+        content = json.load(f)
+    del content["metadata"]["weights"]
+    with open(manifest, "w") as f:
+        json.dump(content, f)
+    assert outdated(ColumnStore(weights.cachedir))
+
+
+def test_missing_branches_warn(tmp_path, array_source):
+    source = array_source({"PickProbability": np.ones(2)})
+    with pytest.warns(UserWarning, match="cms_sus_21_006"):
+        weights = build_weight_columns(source, str(tmp_path / "weights"), analyses=["cms_sus_21_006"])
+    assert weights.branches == []
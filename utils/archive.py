@@ -0,0 +1,164 @@
+import os
+import json
+import atexit
+import array
+import numbers
+import numpy as np
+from utils.binning import Binning
+from utils.numpyhist import NumpyHist
+
+# archive of the data of the plots: the histograms, quantile grids and credible region contours the builders of utils/plots.py return, stored under the
+# createName key of the plot in one compressed .npz file, so plots can be restyled, combined or checked without going back to the tree (see PMSSM renderOnly).
+# Histograms are stored as NumpyHist (see utils/numpyhist.py): their bins, binnings and the style settings the builders made, which are replayed when they are drawn.
+# An entry is a JSON layout of the data, in which every numpy array is replaced by its index in the list of arrays of the entry
+
+
+def _encode(obj, arrays):
+    if isinstance(obj, NumpyHist):
+        return {"hist": {"name": obj.name, "title": obj.title, "binnings": [_encode_binning(axis.binning) for axis in obj.axes],
+                         "sumw": _encode(obj.sumw, arrays), "sumw2": _encode(obj.sumw2, arrays), "entries": _encode(obj.entries, arrays),
+                         "calls": _encode_calls(obj.calls, arrays),
+                         "axes": [[index, _encode_calls(axis.calls, arrays)] for index, axis in list(enumerate(obj.axes)) + list(getattr(obj, "extra_axes", {}).items())]}}
+    if isinstance(obj, array.array):
+        obj = np.array(obj)
+    if isinstance(obj, np.ndarray):
+        arrays.append(obj)
+        return {"array": len(arrays) - 1}
+    if isinstance(obj, dict):
+        return {"dict": [[_encode(key, arrays), _encode(value, arrays)] for key, value in obj.items()]}
+    if isinstance(obj, (list, tuple)):
+        return {"list" if isinstance(obj, list) else "tuple": [_encode(item, arrays) for item in obj]}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if obj is None or isinstance(obj, (bool, str, float)):
+        return obj
+    if isinstance(obj, numbers.Integral):
+        return int(obj)  # also colors and styles of ROOT
+    raise Exception("Can not archive " + type(obj).__name__ + ", plots are archived with the numpy histogram backend")
+
+
+def _encode_calls(calls, arrays):
+    return [[name, _encode(list(args), arrays)] for name, args in calls]
+
+
+def _encode_binning(binning):
+    if binning is None:
+        return None
+    if binning.variable:
+        return {"edges": binning.edges.tolist()}
+    return {"nbins": binning.nbins, "low": binning.low, "up": binning.up, "log": binning.log}
+
+
+def _decode(layout, arrays):
+    if not isinstance(layout, dict):
+        return layout
+    if "hist" in layout:
+        layout = layout["hist"]
+        hist = NumpyHist(layout["name"], layout["title"], [_decode_binning(binning) for binning in layout["binnings"]])
+        hist.sumw = _decode(layout["sumw"], arrays)
+        hist.sumw2 = _decode(layout["sumw2"], arrays)
+        hist.entries = layout["entries"]
+        hist.calls = _decode_calls(layout["calls"], arrays)
+        for index, calls in layout["axes"]:
+            axis = hist.axes[index] if index < len(hist.axes) else hist._extra_axis(index)
+            axis.calls = _decode_calls(calls, arrays)
+        return hist
+    if "array" in layout:
+        return arrays[layout["array"]]
+    if "dict" in layout:
+        return {_decode(key, arrays): _decode(value, arrays) for key, value in layout["dict"]}
+    if "list" in layout:
+        return [_decode(item, arrays) for item in layout["list"]]
+    return tuple(_decode(item, arrays) for item in layout["tuple"])
+
+
+def _decode_calls(calls, arrays):
+    return [(name, tuple(_decode(args, arrays))) for name, args in calls]
+
+
+def _decode_binning(binning):
+    return None if binning is None else Binning(**binning)
+
+
+class PlotArchive:
+    """
+    Data of plots stored under their names in one .npz file. Entries are collected with store and written with save, which replaces the entries of the same names
+    and keeps the others. Every save rewrites the whole compressed file, so entries are collected over many plots and saved once. The file is written under a temporary name and renamed, so readers always see a complete archive
+    """
+    def __init__(self, path):
+        """
+        @param path: path of the .npz file, which is created by the first save
+        """
+        self.path = path
+        self.pending = {}
+        # entries that are not saved yet are saved when the program exits. The workers of a campaign send them to the main process instead, which saves them
+        self.autosave = True
+        atexit.register(self._save_at_exit)
+
+    def store(self, name, data):
+        """
+        Adds the data of the plot name, a histogram, a list or dictionary of histograms, arrays and numbers, e.g. the return value of a builder of utils/plots.py
+        """
+        arrays = []
+        layout = _encode(data, arrays)
+        self.pending[name] = (layout, arrays)
+
+    def take(self):
+        """
+        Returns the stored entries that are not saved yet and forgets them, e.g. to send them from a worker process to the process that saves the archive
+        """
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def update(self, entries):
+        """
+        Adds entries returned by take of another archive
+        """
+        self.pending.update(entries)
+
+    def names(self):
+        names = set(self.pending)
+        if os.path.exists(self.path):
+            with np.load(self.path) as stored:
+                names.update(key[:-len(".json")] for key in stored.files if key.endswith(".json"))
+        return sorted(names)
+
+    def load(self, name):
+        """
+        Returns the data of the plot name, with NumpyHist in place of the histograms
+        """
+        if name in self.pending:
+            layout, arrays = self.pending[name]
+            return _decode(layout, arrays)
+        try:
+            with np.load(self.path) as stored:
+                layout = json.loads(str(stored[name + ".json"]))
+                arrays = [stored[name + "." + str(index)] for index in range(layout["arrays"])]
+        except (OSError, KeyError):
+            raise Exception("Plot " + name + " is not in the archive " + self.path + ", it has to be made from the tree first")
+        return _decode(layout["data"], arrays)
+
+    def _save_at_exit(self):
+        if self.autosave:
+            self.save()
+
+    def save(self):
+        if not self.pending:
+            return
+        arrays = {}
+        if os.path.exists(self.path):
+            with np.load(self.path) as stored:
+                for key in stored.files:
+                    if key.rsplit(".", 1)[0] not in self.pending:
+                        arrays[key] = stored[key]
+        for name, (layout, entryarrays) in self.pending.items():
+            arrays[name + ".json"] = np.array(json.dumps({"data": layout, "arrays": len(entryarrays)}))
+            for index, entryarray in enumerate(entryarrays):
+                arrays[name + "." + str(index)] = entryarray
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmppath = self.path + "." + str(os.getpid()) + ".tmp.npz"
+        np.savez_compressed(tmppath, **arrays)
+        os.replace(tmppath, self.path)
+        self.pending = {}
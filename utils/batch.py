@@ -0,0 +1,96 @@
+from utils.columns import MemoryColumns
+from utils.instrument import stage
+from utils.build import recording_outputs
+
+
+class PlotBatch:
+    """
+    Plot requests of a PMSSM object that are made together. Every request is registered with the expressions it reads (variables, constraints, Bayes factors),
+    these are evaluated in as few passes over the tree as the memory budget allows, and the plots are then made from memory.
+    Requests with the same drawstring and constraints share all of their columns, and requests that only differ in binning or style read nothing extra.
+    Usage:
+        batch = pmssm_plotter.batch()
+        batch.impact1D(drawstring="g")
+        batch.quantile2D(drawstring="abs(chi10):g", quantile=[0.5, 0.9])
+        batch.execute()
+    """
+    def __init__(self, pmssm, maxbytes=4 * 1024**3):
+        """
+        @param pmssm: PMSSM object whose plot methods are called
+        @param maxbytes: memory available for the columns of one pass over the tree. Every expression takes 8 bytes per tree entry
+        """
+        self.pmssm = pmssm
+        self.maxbytes = maxbytes
+        self.requests = []
+        self.outputs = []
+
+    def add(self, plotType, **kwargs):
+        """
+        Registers a plot. Returns the batch, so that calls can be chained
+        @param plotType: name of the PMSSM method, e.g. "impact1D"
+        @param kwargs: arguments of the PMSSM method
+        """
+        expressions = self.pmssm.getRequiredExpressions(plotType, **kwargs)
+        self.requests.append((plotType, kwargs, expressions, len(self.requests)))
+        return self
+
+    def impact1D(self, **kwargs):
+        return self.add("impact1D", **kwargs)
+
+    def quantile1D(self, **kwargs):
+        return self.add("quantile1D", **kwargs)
+
+    def quantile2D(self, **kwargs):
+        return self.add("quantile2D", **kwargs)
+
+    def survival2D(self, **kwargs):
+        return self.add("survival2D", **kwargs)
+
+    def plan(self):
+        """
+        Groups the requests by the expressions they read, and packs the groups into passes over the tree (first fit, in the order the groups were registered) whose columns fit into maxbytes.
+        A group that alone needs more than maxbytes gets a pass of its own. Returns a list of (expressions, requests) tuples, one per pass
+        """
+        groups = {}
+        for request in self.requests:
+            groups.setdefault(frozenset(request[2]), []).append(request)
+        entrybytes = 8 * int(self.pmssm.intree.GetEntries())
+        passes = []
+        for requests in groups.values():
+            expressions = list(dict.fromkeys(expression for request in requests for expression in request[2]))
+            for expressions_pass, requests_pass in passes:
+                merged = set(expressions_pass).union(expressions)
+                if len(merged) * entrybytes <= self.maxbytes:
+                    expressions_pass.extend(expression for expression in expressions if expression not in expressions_pass)
+                    requests_pass.extend(requests)
+                    break
+            else:
+                passes.append((expressions, list(requests)))
+        return passes
+
+    def execute(self):
+        """
+        Makes all registered plots and clears the batch. Returns the number of passes over the tree that were needed.
+        The files written by every request are then in outputs, in the order the requests were registered.
+        Plots drawn from an archive (PMSSM renderOnly) read nothing from the tree, and the plots that are archived are saved in the archive once at the end
+        """
+        passes = self.plan() if not self.pmssm.renderOnly else [([], list(self.requests))]
+        source = self.pmssm.intree
+        archive = self.pmssm.archive
+        self.outputs = [[] for _ in self.requests]
+        try:
+            with self.pmssm.settingsContext():
+                for expressions, requests in passes:
+                    if not self.pmssm.renderOnly:
+                        with stage("batch_read", expressions=len(expressions), plots=len(requests)):
+                            self.pmssm.intree = MemoryColumns(source, expressions)
+                    for plotType, kwargs, _, index in requests:
+                        with recording_outputs() as outputs:
+                            getattr(self.pmssm, plotType)(**kwargs)
+                        self.outputs[index] = outputs
+        finally:
+            self.pmssm.intree = source
+            if archive is not None and archive.autosave:
+                archive.save()
+        self.requests = []
+        return len(passes) if not self.pmssm.renderOnly else 0
@@ -0,0 +1,84 @@
+import functools
+import numpy as np
+
+# binning of a histogram axis, shared by the ROOT histograms (see mkhist in utils/utils.py) and the numpy accumulators (see utils/mapreduce.py).
+# The edges are computed once with numpy. Binnings are immutable and hashable, so they can be part of cache keys and be reused by every histogram of a plot
+
+
+class Binning:
+    """
+    nbins bins of equal width between low and up, on a linear or a log10 scale, or bins of variable width between explicit edges
+    """
+    def __init__(self, nbins=None, low=None, up=None, log=False, edges=None):
+        """
+        @param nbins: number of bins
+        @param low: lower edge of the first bin
+        @param up: upper edge of the last bin
+        @param log: bins of equal width in log10(x). As always in mkhistlogx, a low or up of 0 stands for log10(x) = 0, i.e. x = 1
+        @param edges: list of the increasing bin edges, for bins of variable width, instead of nbins, low, up and log
+        """
+        if edges is not None:
+            edges = np.array(edges, dtype=np.float64)
+            if edges.ndim != 1 or len(edges) < 2 or np.any(np.diff(edges) <= 0):
+                raise Exception("Bin edges must be a list of at least two increasing numbers, got " + str(edges))
+            self.nbins, self.low, self.up, self.log = len(edges) - 1, float(edges[0]), float(edges[-1]), False
+            self.variable = True
+        else:
+            if nbins is None or low is None or up is None or int(nbins) < 1:
+                raise Exception("A binning needs a positive number of bins and its lower and upper edge")
+            self.nbins, self.low, self.up, self.log = int(nbins), float(low), float(up), bool(log)
+            self.variable = False
+            if self.log:
+                loglow = np.log10(self.low) if self.low != 0 else 0.
+                logup = np.log10(self.up) if self.up != 0 else 0.
+                edges = np.power(10., loglow + np.arange(self.nbins + 1) * ((logup - loglow) / self.nbins))
+            else:
+                edges = self.low + np.arange(self.nbins + 1) * ((self.up - self.low) / self.nbins)
+        edges.flags.writeable = False
+        self.edges = edges
+
+    def key(self):
+        """
+        Tuple identifying the binning, for comparisons and hashes
+        """
+        if self.variable:
+            return ("variable", tuple(self.edges.tolist()))
+        return ("log" if self.log else "linear", self.nbins, self.low, self.up)
+
+    def __eq__(self, other):
+        return isinstance(other, Binning) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        if self.variable:
+            return "Binning(edges=" + repr(self.edges.tolist()) + ")"
+        return "Binning(%d, %r, %r, log=%r)" % (self.nbins, self.low, self.up, self.log)
+
+    def centres(self):
+        """
+        Returns the centres of the bins, as TAxis::GetBinCenter
+        """
+        return (self.edges[1:] + self.edges[:-1]) / 2
+
+    def find_bins(self, values):
+        """
+        Vectorised TAxis::FindBin. Returns the ROOT bin number of every value: 0 for the underflow, nbins+1 for the overflow
+        """
+        return np.searchsorted(self.edges, values, side="right")
+
+    @staticmethod
+    def of_axis(axis):
+        """
+        Returns the binning of a ROOT axis
+        """
+        return Binning(edges=[axis.GetBinLowEdge(i) for i in range(1, axis.GetNbins() + 2)])
+
+
+@functools.lru_cache(maxsize=None)
+def binning(nbins, low, up, log=False):
+    """
+    Returns the shared Binning of nbins equal bins between low and up, so that the edges of a binning are computed once however many histograms use it
+    """
+    return Binning(nbins, low, up, log)
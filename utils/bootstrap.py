@@ -0,0 +1,153 @@
+import warnings
+import numpy as np
+from utils.fill import cached_histograms, split_drawstring, axis_edges
+from utils.mapreduce import HistogramAccumulator, accumulate
+from utils.histarrays import set_hist_state
+
+# statistical uncertainty bands of the histograms by the Poisson bootstrap: every replica weights each point once more with a Poisson(1) multiplicity,
+# so all replicas are filled from the same pass over the tree, as additional weights of the points that are read anyway.
+# The multiplicities are a function of (seed, entry, replica) only, as in bench/synthetic.py, so the replicas are the same however the tree is split into chunks or processes
+
+# cumulative probabilities of Poisson(1), P(k <= n) for n = 0..15. Larger multiplicities (probability below 1e-13) count as 16
+_poisson_cdf = np.cumsum(np.exp(-1.) / np.cumprod(np.concatenate([[1.], np.arange(1., 16.)])))
+# largest number of (replica, point) multiplicities drawn at once, bounding the memory of a fill to some hundred MB
+_blocksize = 2**22
+
+
+def _splitmix64(z):
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _uniform(z):
+    # uniform number in (0, 1) from the upper 53 bits of a hash
+    return ((z >> np.uint64(11)).astype(np.float64) + 0.5) / 9007199254740992.
+
+
+def _multiplicity_table(bits):
+    """
+    Returns the multiplicity of every value of the upper bits of a hash, or 255 where the hashes with these upper bits have different multiplicities.
+    The multiplicity grows with the hash, so it is the same for all of them if it is the same for the smallest and the largest
+    """
+    smallest = np.arange(2**bits, dtype=np.uint64) << np.uint64(64 - bits)
+    largest = smallest | np.uint64(2**(64 - bits) - 1)
+    low, high = np.searchsorted(_poisson_cdf, _uniform(smallest), side="right"), np.searchsorted(_poisson_cdf, _uniform(largest), side="right")
+    return np.where(low == high, low, 255).astype(np.uint8)
+
+
+# a lookup in this table replaces the binary search in _poisson_cdf for all but about 1 in 100000 multiplicities, with the same results
+_tablebits = 20
+_table = _multiplicity_table(_tablebits)
+
+
+def poisson_multiplicities(seed, entries, replicas):
+    """
+    Returns the Poisson(1) multiplicities of the entries in the replicas, of shape (len(replicas), len(entries)). One hash is computed per entry and replica,
+    so the cost grows with the number of replicas times the number of selected points, about 8 ns per multiplicity
+    @param seed: seed of the replicas
+    @param entries: array of tree entry numbers
+    @param replicas: array of replica numbers
+    """
+    with np.errstate(over="ignore"):
+        z = (np.full(1, seed, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(0x9E3779B97F4A7C15)
+             + np.asarray(entries, dtype=np.uint64)[None, :] * np.uint64(0xBF58476D1CE4E5B9)
+             + np.asarray(replicas, dtype=np.uint64)[:, None] * np.uint64(0x94D049BB133111EB))
+        z = _splitmix64(z)
+    multiplicities = _table[z >> np.uint64(64 - _tablebits)]
+    ambiguous = np.flatnonzero(multiplicities == 255)
+    multiplicities.flat[ambiguous] = np.searchsorted(_poisson_cdf, _uniform(z.flat[ambiguous]), side="right")
+    return multiplicities
+
+
+class BootstrapAccumulator(HistogramAccumulator):
+    """
+    HistogramAccumulator that also sums the weights of every cell in a number of Poisson bootstrap replicas
+    """
+    def __init__(self, variables, edges, weight, replicas=200, seed=1):
+        """
+        @param replicas: number of bootstrap replicas
+        @param seed: seed of the replicas. Accumulators with the same seed share the multiplicities of every point, so that ratios of them (e.g. survival probabilities) are taken replica by replica
+        """
+        HistogramAccumulator.__init__(self, variables, edges, weight)
+        self.replicas = replicas
+        self.seed = seed
+        self.replicated = np.zeros((replicas, len(self.sumw)))
+        self.offset = 0  # entry number of the next point that is filled
+
+    def seek(self, firstentry):
+        """
+        Sets the tree entry number of the first point of the next fill, see utils/mapreduce.py _fill
+        """
+        self.offset = firstentry
+
+    def fill(self, columns):
+        w = columns[self.weight]
+        entries = self.offset + np.arange(len(w))
+        self.offset += len(w)
+        HistogramAccumulator.fill(self, columns)
+        selected = w != 0
+        w, entries = w[selected], entries[selected]
+        cells = self.cells([columns[v][selected] for v in self.variables])
+        ncells = len(self.sumw)
+        block = max(1, _blocksize // max(1, len(w)))
+        for first in range(0, self.replicas, block):
+            replicas = np.arange(first, min(first + block, self.replicas))
+            weights = poisson_multiplicities(self.seed, entries, replicas) * w[None, :]
+            index = np.arange(len(replicas))[:, None] * ncells + cells[None, :]
+            self.replicated[first:first + len(replicas)] += np.bincount(index.ravel(), weights.ravel(), minlength=len(replicas) * ncells).reshape(len(replicas), ncells)
+
+    def merge(self, other):
+        HistogramAccumulator.merge(self, other)
+        self.replicated += other.replicated
+        return self
+
+    def replica_arrays(self):
+        """
+        Returns the summed weights of every replica, of shape (replicas,) + the shape of hist_array
+        """
+        return self.replicated.reshape((self.replicas,) + self.shape)
+
+
+def fill_bands(localtree, drawstring, weights, hists, bands, replicas=200, seed=1, probs=(0.16, 0.84)):
+    """
+    fill_histograms (see utils/fill.py) that in the same pass fills bootstrap uncertainty bands. A band histogram gets the middle of the central interval probs of the replicas as content
+    and its half width as error, to be drawn with the option "E2". Returns the summed weights, one per weight
+    @param weights: list of weight expressions, as in fill_histograms
+    @param hists: list of histograms, one per weight, as in fill_histograms
+    @param bands: list of (band histogram, numerator, denominator): the replicas of the band are those of the histogram of weight index numerator, divided by those of weight index denominator
+    bin by bin, or normalised to their total if denominator is None
+    @param replicas: number of bootstrap replicas
+    @param seed: seed of the replicas
+    @param probs: lower and upper quantile of the replicas that bound the band, by default the central 68%
+    """
+    variables = split_drawstring(drawstring)[::-1]  # TTree::Draw takes Y:X
+    reference = next(hist for hist in hists if hist is not None)
+    axes = [reference.GetXaxis(), reference.GetYaxis()]
+    edges = [axis_edges(axes[i]) for i in range(len(variables))]
+    replicated = sorted(set(index for band in bands for index in band[1:] if index is not None))
+
+    def compute():
+        accumulators = accumulate(localtree, [BootstrapAccumulator(variables, edges, weight, replicas, seed) if i in replicated else HistogramAccumulator(variables, edges, weight)
+                                              for i, weight in enumerate(weights)])
+        for acc, hist in zip(accumulators, hists):
+            if hist is not None:
+                acc.fill_hist(hist)
+        for band, numerator, denominator in bands:
+            values = accumulators[numerator].replica_arrays()
+            if denominator is None:
+                totals = values.reshape(replicas, -1).sum(axis=1)
+                values = values / np.where(totals > 0, totals, 1.).reshape((replicas,) + (1,) * (values.ndim - 1))
+            else:
+                prior = accumulators[denominator].replica_arrays()
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    values = np.where(prior > 0, values / prior, np.nan)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # bins without prior in any replica have no band
+                low, high = np.nan_to_num(np.nanquantile(values, probs, axis=0))
+            set_hist_state(band, (low + high) / 2, ((high - low) / 2) ** 2, replicas)
+        return [acc.total for acc in accumulators]
+
+    for band, numerator, denominator in bands:
+        band.Sumw2()  # also before a result cache hit, which restores the errors only into histograms with Sumw2
+    return cached_histograms(localtree, ["fill_bands", drawstring, weights, [band[1:] for band in bands], replicas, seed, list(probs)], list(hists) + [band[0] for band in bands], compute)
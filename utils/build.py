@@ -0,0 +1,97 @@
+import os
+import json
+import contextlib
+from utils.resultcache import ResultCache
+
+# incremental builds of a campaign (see utils/campaign.py): a manifest in the output directory records, for every plot task, a hash of everything its plots
+# depend on (see PMSSM.getDependencies: the tree and friend files, the particle draw configs, the style settings and the constraint strings) and the files it wrote.
+# A task is made again only if this hash changed or one of its files is missing, so changing the axis range of one particle only remakes the plots of that particle
+
+# paths written by Plotter.SaveAs while outputs are recorded, see recording_outputs
+_recorded = None
+
+
+@contextlib.contextmanager
+def recording_outputs():
+    """
+    Context in which the paths of the plots that are saved are collected in the list it yields
+    """
+    global _recorded
+    previous, _recorded = _recorded, []
+    try:
+        yield _recorded
+    finally:
+        _recorded = previous
+
+
+def record_output(path):
+    """
+    Called by Plotter.SaveAs for every file it writes
+    """
+    if _recorded is not None:
+        _recorded.append(path)
+
+
+def task_key(task):
+    """
+    Text identifying a plot task (output subdirectory, plot type and arguments) in the manifest
+    """
+    return json.dumps([task["outdir"], task["plotType"], task["kwargs"]], sort_keys=True)
+
+
+def dependency_hash(dependencies):
+    """
+    Hash of the dependencies of a task, see PMSSM.getDependencies
+    """
+    return ResultCache.key("build", dependencies)
+
+
+class BuildManifest:
+    """
+    Dependency hash and output files of every task of a campaign that was made, stored as JSON in the output directory.
+    Output files are stored relative to the output directory. The manifest is written under a temporary name and renamed, so an interrupted campaign keeps the tasks that were done
+    """
+    filename = ".build_manifest.json"
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.path = os.path.join(outdir, self.filename)
+        try:
+            with open(self.path) as f:
+                self.records = json.load(f)
+        except (OSError, ValueError):
+            self.records = {}
+
+    def get(self, task):
+        """
+        Returns the record {"inputs": dependency hash, "outputs": list of files} of the task when it was last made, or None
+        """
+        return self.records.get(task_key(task))
+
+    def is_current(self, task, inputs):
+        """
+        Whether the task was made with the same dependency hash and all of its files still exist
+        """
+        record = self.get(task)
+        return record is not None and record["inputs"] == inputs and all(os.path.exists(os.path.join(self.outdir, output)) for output in record["outputs"])
+
+    def update(self, task, inputs, outputs):
+        """
+        Records that the task was made with the dependency hash inputs and wrote the files outputs. Files of the previous build of the task that it did not write again are removed,
+        e.g. after a change of the plot name
+        @param outputs: list of the paths of the written files
+        """
+        outputs = sorted(set(os.path.relpath(output, self.outdir) for output in outputs))
+        previous = self.get(task)
+        if previous is not None:
+            for output in set(previous["outputs"]) - set(outputs):
+                if os.path.exists(os.path.join(self.outdir, output)):
+                    os.remove(os.path.join(self.outdir, output))
+        self.records[task_key(task)] = {"inputs": inputs, "outputs": outputs}
+
+    def save(self):
+        os.makedirs(self.outdir, exist_ok=True)
+        tmppath = self.path + "." + str(os.getpid()) + ".tmp"
+        with open(tmppath, "w") as f:
+            json.dump(self.records, f, indent=1, sort_keys=True)
+        os.replace(tmppath, self.path)
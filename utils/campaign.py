@@ -0,0 +1,173 @@
+import os
+import time
+import traceback
+import multiprocessing
+from utils.build import BuildManifest, dependency_hash
+from utils.archive import PlotArchive
+
+# a campaign is a list of plot tasks, each a dictionary with the output subdirectory ("outdir"), the PMSSM method ("plotType") and its arguments ("kwargs").
+# Tasks only contain strings and numbers, so they can be sent to worker processes
+
+
+def plot_dirname(particle):
+    """
+    Output subdirectory of the plots of a particle, as used by the plotmakers scripts
+    """
+    return particle.replace("(", "").replace(")", "").replace("-", "")
+
+
+def campaign_plots(particles, yaxisFor2D, quantiles2D=[0.5, 0.75, 0.9, 0.99], analysis="combined", deltaMasses=[], deltaMassesParticle="abs(chi10)", survival2D=False):
+    """
+    Returns the plot tasks of a campaign: for every particle the impact and quantile plots with linear and logarithmic y-axis, and the 2D quantile plots against every entry of yaxisFor2D.
+    The 2D plots of the mass differences in deltaMasses against deltaMassesParticle go into the directory DeltaMasses
+    @param particles: list of drawstrings drawn on the x-axis, e.g. plotmakers/config.py campaignParticles
+    @param yaxisFor2D: list of drawstrings drawn on the y-axis of the 2D plots
+    @param quantiles2D: list of Bayes factor quantiles of the 2D plots
+    @param analysis: analysis of the 2D plots
+    @param deltaMasses: list of mass differences drawn on the y-axis against deltaMassesParticle
+    @param survival2D: adds the 2D survival probability plots with the prior and posterior credible regions against every entry of yaxisFor2D
+    """
+    tasks = []
+    for particle in particles:
+        outdir = plot_dirname(particle)
+        for plotType in ["impact1D", "quantile1D"]:
+            tasks.append({"outdir": outdir, "plotType": plotType, "kwargs": {"drawstring": particle}})
+            tasks.append({"outdir": outdir, "plotType": plotType, "kwargs": {"drawstring": particle, "xaxisDrawConfig": {"1Dlogy": True}}})
+        for ypar in yaxisFor2D:
+            if ypar == particle:
+                continue
+            # the default legend is hard to read on the dark colours of the palette in the upper part of the plot
+            variant = "variant1" if ypar == "abs(chi10)" else "variant2"
+            # one task makes the plots of all quantiles from the same fill
+            tasks.append({"outdir": outdir, "plotType": "quantile2D",
+                          "kwargs": {"drawstring": ypar + ":" + particle, "analysis": analysis, "quantile": list(quantiles2D), "variant": variant}})
+            if survival2D:
+                tasks.append({"outdir": outdir, "plotType": "survival2D", "kwargs": {"drawstring": ypar + ":" + particle, "analysis": analysis}})
+    for ypar in deltaMasses:
+        tasks.append({"outdir": "DeltaMasses", "plotType": "quantile2D",
+                      "kwargs": {"drawstring": ypar + ":" + deltaMassesParticle, "analysis": analysis, "quantile": list(quantiles2D), "variant": "variant2",
+                                 "yaxisDrawConfig": {"nbin": 50}}})
+    return tasks
+
+
+# state of a worker process: the PMSSM object it made its plots with, created once by _init_worker
+_worker = {}
+
+
+def _open_pmssm(treefile, treename, outdir, pmssmArgs):
+    from pmssm import PMSSM
+    from utils.columns import ColumnStore
+    intree = None
+    if not pmssmArgs.get("renderOnly", False) and (pmssmArgs.get("columnCache") is None or not ColumnStore.exists(pmssmArgs["columnCache"])):
+        from ROOT import TFile
+        rootfile = TFile(treefile)
+        intree = rootfile.Get(treename)
+        _worker["file"] = rootfile  # the tree lives as long as its file
+    return PMSSM(intree=intree, outdir=outdir, **pmssmArgs)
+
+
+def _init_worker(treefile, treename, outdir, pmssmArgs, incremental=False, maxbytes=4 * 1024**3):
+    if not pmssmArgs.get("headless", False):
+        # headless workers only compute, and do not load ROOT if the tree is read from the column cache
+        from ROOT import gROOT
+        gROOT.SetBatch(True)
+    _worker["outdir"] = outdir
+    _worker["incremental"] = incremental
+    _worker["maxbytes"] = maxbytes
+    _worker["pmssm"] = _open_pmssm(treefile, treename, outdir, pmssmArgs)
+    if _worker["pmssm"].archive is not None:
+        # the archived plot data are sent to the main process, which alone writes the archive
+        _worker["pmssm"].archive.autosave = False
+
+
+def _run_tasks(tasks):
+    """
+    Makes a group of tasks with the same output directory as one batch of the worker's PMSSM object. In an incremental campaign, tasks that are up to date
+    in the build manifest are left out. Returns the tasks, a (task, dependency hash, written files) tuple per task that was made, the entries for the plot archive,
+    the time it took and the traceback if it failed
+    """
+    start = time.time()
+    try:
+        pmssm = _worker["pmssm"]
+        pmssm.outdir = os.path.join(_worker["outdir"], tasks[0]["outdir"]) + "/"
+        os.makedirs(pmssm.outdir, exist_ok=True)
+        manifest = BuildManifest(_worker["outdir"]) if _worker["incremental"] else None
+        batch = pmssm.batch(_worker["maxbytes"])
+        made = []
+        for task in tasks:
+            inputs = None
+            if manifest is not None:
+                dependencies = pmssm.getDependencies(task["plotType"], **task["kwargs"])
+                # plots of a tree that can not be identified are always made again
+                inputs = dependency_hash(dependencies) if dependencies["source"] is not None else None
+                if inputs is not None and manifest.is_current(task, inputs):
+                    continue
+            batch.add(task["plotType"], **task["kwargs"])
+            made.append((task, inputs))
+        batch.execute()
+        entries = pmssm.archive.take() if pmssm.archive is not None else {}
+        return tasks, [(task, inputs, outputs) for (task, inputs), outputs in zip(made, batch.outputs)], entries, time.time() - start, None
+    except Exception:
+        if _worker["pmssm"].archive is not None:
+            _worker["pmssm"].archive.take()  # the plots of a failed group are not archived
+        return tasks, [], {}, time.time() - start, traceback.format_exc()
+
+
+def run_campaign(tasks, treefile, treename, outdir, nworkers=None, incremental=False, maxbytes=4 * 1024**3, **pmssmArgs):
+    """
+    Makes the plots of a campaign in a pool of worker processes. Every worker opens the tree (or the column cache) once and makes groups of plots with the same
+    output directory and drawstring, each reading the tree in a single pass (see utils/batch.py). Plots are written atomically (see Plotter.SaveAs), so an
+    interrupted campaign leaves no truncated files. Workers are started with the spawn method, as ROOT does not support forking a process that has used it.
+    A failing group is reported and does not stop the others. Returns the list of failed tasks.
+    An incremental campaign only makes the tasks whose dependencies changed since they were last made (see utils/build.py), and keeps the other plots in outdir.
+    With the PMSSM argument archive, the data of all plots are stored in this one file (see utils/archive.py), and with renderOnly the plots are drawn from it without the tree.
+    With headless, the workers only compute the data of the plots for the archive or the result cache, and draw nothing
+    @param tasks: list of plot tasks, e.g. from campaign_plots
+    @param treefile: path of the ROOT file with the MCMC tree
+    @param treename: name of the tree in the file
+    @param outdir: directory in which the subdirectories of the tasks are created
+    @param nworkers: number of worker processes. Default is the number of cores
+    @param incremental: makes only the tasks that are not up to date in the build manifest of outdir, and records the made tasks in it
+    @param maxbytes: memory budget of the batches of all workers together. Every worker reads the tree for its batches with an equal share of it (see PMSSM.batch)
+    @param pmssmArgs: further arguments of PMSSM, e.g. particleConfig, friendAnalysis, columnCache, archive, renderOnly, headless
+    """
+    from utils.columns import ColumnStore
+    nworkers = nworkers or os.cpu_count()
+    columnCache = pmssmArgs.get("columnCache")
+    if columnCache is not None and not ColumnStore.exists(columnCache) and not pmssmArgs.get("renderOnly", False):
+        # the cache is written once here, and not by every worker at the same time
+        _open_pmssm(treefile, treename, outdir, pmssmArgs)
+        _worker.clear()
+
+    groups = {}
+    for task in tasks:
+        groups.setdefault((task["outdir"], task["kwargs"]["drawstring"]), []).append(task)
+    groups = sorted(groups.values(), key=len, reverse=True)  # largest groups first, so that no long group is left at the end
+
+    manifest = BuildManifest(outdir) if incremental else None
+    archive = PlotArchive(pmssmArgs["archive"]) if pmssmArgs.get("archive") is not None and not pmssmArgs.get("renderOnly", False) else None
+    failed = []
+    made = 0
+    start = time.time()
+    context = multiprocessing.get_context("spawn")
+    poolsize = min(nworkers, len(groups)) or 1
+    with context.Pool(poolsize, initializer=_init_worker, initargs=(treefile, treename, outdir, pmssmArgs, incremental, maxbytes // poolsize)) as pool:
+        for done, records, entries, seconds, error in pool.imap_unordered(_run_tasks, groups):
+            if error is not None:
+                print("Failed", len(done), "plots of", done[0]["kwargs"]["drawstring"], "in", done[0]["outdir"], ":\n" + error)
+                failed += done
+                continue
+            print("Made", len(records), "plots of", done[0]["kwargs"]["drawstring"], "in", done[0]["outdir"], "in %.1f s" % seconds,
+                  "(%d up to date)" % (len(done) - len(records)) if incremental else "")
+            made += len(records)
+            if archive is not None:
+                archive.update(entries)
+                archive.save()
+            if manifest is not None:
+                # written after every group, so an interrupted campaign does not make the finished groups again
+                for task, inputs, outputs in records:
+                    if inputs is not None:
+                        manifest.update(task, inputs, outputs)
+                manifest.save()
+    print("Campaign of", len(tasks), "plots took %.1f s with" % (time.time() - start), nworkers, "workers,", made, "made,", len(failed), "failed")
+    return failed
@@ -0,0 +1,26 @@
+# the numbers of the ROOT colors (EColor), line styles (ELineStyle) and color palettes (EColorPalette) used by the plots, so that modules can use them,
+# e.g. as default arguments, without importing ROOT. ROOT takes these numbers wherever it takes a color, line style or palette
+
+kWhite = 0
+kBlack = 1
+kGray = 920
+kRed = 632
+kGreen = 416
+kBlue = 600
+kYellow = 400
+kMagenta = 616
+kCyan = 432
+kOrange = 800
+kSpring = 820
+kTeal = 840
+kAzure = 860
+kViolet = 880
+kPink = 900
+
+kSolid = 1
+kDashed = 2
+kDotted = 3
+kDashDotted = 4
+
+kBird = 57
+kViridis = 112
@@ -0,0 +1,194 @@
+import os
+import json
+import shutil
+import numpy as np
+from utils.expressions import ExpressionCache, referenced_branches
+from utils.fill import read_columns, chunksize
+from utils.resultcache import file_identity, source_identity
+
+# leaf types that are kept at their stored precision in the cache. Everything else is stored as double, which is what TTree::Draw returns
+_dtypes = {"Float_t": np.float32, "Int_t": np.int32, "Bool_t": np.bool_}
+
+
+def _write_columns(source, cachedir, names, expressions, dtypes, manifest, chunksize):
+    """
+    Evaluates expressions on a tree or ColumnStore and writes them as the columns names of a new cache directory, which is moved in place once complete
+    """
+    entries = int(source.GetEntries())
+    tmpdir = cachedir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    os.makedirs(tmpdir)
+    columns = {}
+    for name, dtype in zip(names, dtypes):
+        columns[name] = np.lib.format.open_memmap(os.path.join(tmpdir, name + ".npy"), mode="w+", dtype=dtype, shape=(entries,))
+    start = 0 if names else entries  # e.g. no weight columns when the source has none of the branches of the analyses
+    for chunk in read_columns(source, expressions, chunksize=chunksize) if names else []:
+        for name, values in zip(names, chunk):
+            columns[name][start:start + len(values)] = values
+        start += len(chunk[0])
+    if start != entries:
+        raise Exception("Read " + str(start) + " entries from the tree, expected " + str(entries) + ". Only scalar branches can be cached")
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    manifest = dict(manifest, entries=entries, branches=list(names))
+    with open(os.path.join(tmpdir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    shutil.rmtree(cachedir, ignore_errors=True)
+    os.rename(tmpdir, cachedir)
+    return ColumnStore(cachedir)
+
+
+def build_column_cache(localtree, cachedir, expressions, metadata=None, chunksize=chunksize):
+    """
+    Extracts all branches referenced by a list of expressions from the tree and its friends into a directory of memory-mapped .npy files, one per branch. Returns the opened ColumnStore
+    @param localtree: Function needs to be passed the ROOT tree from which to operate, with its friends already attached
+    @param cachedir: directory in which the cache is written. It is written next to it first and only moved in place once complete
+    @param expressions: list of expressions (drawstrings, constraints, z-scores) whose branches should be cached. Names that are not branches of the tree or its friends are skipped
+    @param metadata: optional dictionary saved in the manifest, e.g. the tree and friend file paths the cache was made from
+    @param chunksize: maximal number of entries read per TTree::Draw call
+    """
+    branches = [branch for branch in referenced_branches(expressions) if localtree.GetLeaf(branch)]
+    dtypes = [_dtypes.get(localtree.GetLeaf(branch).GetTypeName(), np.float64) for branch in branches]
+    return _write_columns(localtree, cachedir, branches, branches, dtypes, {"metadata": metadata or {}}, chunksize)
+
+
+def build_expression_columns(source, cachedir, expressions, dtypes=None, chunksize=chunksize, metadata=None):
+    """
+    Evaluates expressions once and stores the results as a column store that can be attached to the source with ColumnStore.add_friend. Builders then read these columns instead of evaluating the expressions
+    @param source: ROOT tree or ColumnStore from which to operate
+    @param cachedir: directory in which the columns are written
+    @param expressions: dictionary mapping column names to expressions
+    @param dtypes: optional dictionary mapping column names to the numpy type they are stored as. Default is float64
+    @param chunksize: maximal number of entries evaluated at once
+    @param metadata: optional dictionary stored in the manifest with the source of the columns, e.g. the version of the code that wrote them
+    """
+    dtypes = dtypes or {}
+    names = list(expressions.keys())
+    metadata = dict(metadata or {}, source=getattr(source, "cachedir", ""))
+    return _write_columns(source, cachedir, names, [expressions[name] for name in names], [dtypes.get(name, np.float64) for name in names],
+                          {"expressions": expressions, "metadata": metadata}, chunksize)
+
+
+class ColumnStore:
+    """
+    Columnar cache of an MCMC tree with its friend trees joined, as written by build_column_cache. Columns are memory-mapped, so opening the cache reads nothing and repeated reads of the same branches come from the page cache.
+    It can be passed instead of a ROOT tree to PMSSM and to the histogram builders that read through utils/fill.py.
+    Evaluated expressions are kept in memory (up to maxbytes), so repeated plots with the same constraints reuse their weight arrays
+    """
+    def __init__(self, cachedir, maxbytes=2 * 1024**3):
+        self.cachedir = cachedir
+        with open(os.path.join(cachedir, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.branches = self.manifest["branches"]
+        # precomputed columns name the expression they hold, see utils/weights.py
+        self.expressions = {expression: name for name, expression in self.manifest.get("expressions", {}).items()}
+        self.columns = {}
+        self.friends = []
+        self.evaluated = ExpressionCache(maxbytes)
+
+    @staticmethod
+    def exists(cachedir):
+        return os.path.exists(os.path.join(cachedir, "manifest.json"))
+
+    def GetEntries(self):
+        return self.manifest["entries"]
+
+    def identity(self):
+        """
+        Identifies the data of the store for the result cache (utils/resultcache.py). The manifest is written last, so it identifies the columns written with it
+        """
+        return {"columns": file_identity(os.path.join(self.cachedir, "manifest.json")), "friends": [friend.identity() for friend in self.friends]}
+
+    def has_branch(self, branch):
+        return any(branch in store.branches for store in [self] + self.friends)
+
+    def add_friend(self, friend):
+        """
+        Attaches another ColumnStore with the same entries, e.g. the precomputed weight columns of utils/weights.py. Expressions that a friend holds are read from it instead of being evaluated
+        """
+        if friend.GetEntries() != self.GetEntries():
+            raise Exception("Friend column store " + friend.cachedir + " has " + str(friend.GetEntries()) + " entries, expected " + str(self.GetEntries()))
+        self.friends.append(friend)
+        self.evaluated.clear()
+
+    def lookup(self, expression, start=0, stop=None):
+        """
+        Returns the precomputed values of an expression from this store or its friends, or None if no store holds it
+        """
+        for store in [self] + self.friends:
+            if expression in store.expressions:
+                return store.column(store.expressions[expression])[start:stop]
+        return None
+
+    def column(self, branch):
+        if branch not in self.columns:
+            if branch not in self.branches:
+                for friend in self.friends:
+                    if branch in friend.branches:
+                        return friend.column(branch)
+                raise Exception("Branch " + branch + " is not in the column cache " + self.cachedir)
+            self.columns[branch] = np.load(os.path.join(self.cachedir, branch + ".npy"), mmap_mode="r")
+        return self.columns[branch]
+
+    def evaluate(self, expression, start=0, stop=None):
+        """
+        Evaluates a TTree::Draw expression on the entries [start, stop) of the cache
+        """
+        stop = self.GetEntries() if stop is None else min(stop, self.GetEntries())
+        getcolumn = lambda branch: np.asarray(self.column(branch)[start:stop], dtype=np.float64)
+        lookup = lambda expression: self.lookup(expression, start, stop)
+        return self.evaluated.evaluate(expression, getcolumn, stop - start, key=(start, stop), lookup=lookup)
+
+    def read_columns(self, expressions, firstentry=0, nentries=None, chunksize=chunksize):
+        """
+        Same as utils.fill.read_columns, but evaluating the expressions on the cached columns instead of the tree
+        """
+        if nentries is None:
+            nentries = self.GetEntries() - firstentry
+        lastentry = min(firstentry + nentries, self.GetEntries())
+        for start in range(firstentry, lastentry, chunksize):
+            stop = min(start + chunksize, lastentry)
+            yield [self.evaluate(expression, start, stop) for expression in expressions]
+
+
+class MemoryColumns:
+    """
+    A fixed set of expressions evaluated in one pass over a tree or ColumnStore and kept in memory, as used by utils/batch.py.
+    It can be passed to the histogram builders instead of the tree, as long as they only read these expressions, see get_required_expressions in utils/plots.py
+    """
+    def __init__(self, source, expressions, chunksize=chunksize):
+        self.expressions = list(dict.fromkeys(expressions))
+        self.source = source_identity(source)
+        self.entries = entries = int(source.GetEntries())
+        self.arrays = {expression: np.empty(entries) for expression in self.expressions}
+        start = 0
+        for chunk in read_columns(source, self.expressions, chunksize=chunksize):
+            for expression, values in zip(self.expressions, chunk):
+                self.arrays[expression][start:start + len(values)] = values
+            start += len(chunk[0])
+        if start != entries:
+            raise Exception("Read " + str(start) + " entries from the tree, expected " + str(entries))
+        for array in self.arrays.values():
+            array.flags.writeable = False
+
+    def GetEntries(self):
+        return self.entries
+
+    def identity(self):
+        return self.source
+
+    def read_columns(self, expressions, firstentry=0, nentries=None, chunksize=chunksize):
+        """
+        Same as utils.fill.read_columns, but returning the arrays read in the constructor
+        """
+        missing = [expression for expression in expressions if expression not in self.arrays]
+        if missing:
+            raise Exception("Expressions were not read into memory: " + ", ".join(missing))
+        if nentries is None:
+            nentries = self.GetEntries() - firstentry
+        lastentry = min(firstentry + nentries, self.GetEntries())
+        for start in range(firstentry, lastentry, chunksize):
+            stop = min(start + chunksize, lastentry)
+            yield [self.arrays[expression][start:stop] for expression in expressions]
@@ -0,0 +1,167 @@
+import numpy as np
+from utils.fill import split_drawstring
+
+# the selection and weight expressions of the pMSSM interpretation. This module does not need ROOT, so the statistics engines (utils/fill.py, utils/columns.py,
+# utils/weights.py, utils/mapreduce.py) can be used from batch workers and command line tools without loading it. utils/plots.py re-exports everything defined here
+
+# terms defining
+terms = {}
+terms["higgsino"] = "(Re_N_13**2+Re_N_14**2)"
+terms["bino"] = "Re_N_11**2"
+terms["wino"] = "Re_N_12**2"
+
+#constraints relating to the analyses likelihoods and others
+theconstraints = {}
+theconstraints["reason"] = "(!(xsec_tot_pb>1E3 && Zsig_combined==0))" # this excludes points with enormous weights that could not be excluded, almost certaintly due to these large weights and statistical chance
+theconstraints["reason"] = "(1)"
+
+theconstraints["reason_simplified"] = "(!(xsec_tot_pb>1E3 && Zsig_combined_simplified==0))"# this excludes points with enormous weights that could not be excluded, almost certaintly due to these large weights and statistical chance
+theconstraints["reason_simplified"] = "(1)"
+
+theconstraints["reweight"] = "(1/PickProbability)" #this reweights each point to remove the effect of over-sampling and under-sampling. Important for Bayesian interpretation of results that require a meaningful prior.
+
+#The following are Bayes factors using simplified or (where available) full combine likelihoods
+
+#Note from Sam 18 April, 2024: I am doing away with all the up and down keys and using replace() statements
+#*_100s is the likelihood assuming a signal strength of 1, *_050s assumes a signal strength of 0.5, *_150s assumes a signal strength of 1.5, and *_0s assumes no signal (SM-only likelihood)
+theconstraints["cms_sus_19_006"] = "(exp(llhd_cms_sus_19_006_100s-llhd_cms_sus_19_006_0s))"
+theconstraints["cms_sus_18_004_simplified"] = "(exp(llhd_cms_sus_18_004_100s-llhd_cms_sus_18_004_0s))"
+#At some point we switches to saving the Bayes factor directly in the tree, instead of the signal and signal-less likelihoods
+#Here, muXpYf refers to signal strength of X.Y, and f refers to "full" as in full combine likelihood. The max sometimes has to be taken because root can't handle extremely small floats.
+theconstraints["cms_sus_18_004"] = "(max(bf_cms_sus_18_004_mu1p0f,1E-5))"
+theconstraints["cms_sus_21_007"] = "(exp(llhd_cms_sus_21_007_100s-llhd_cms_sus_21_007_0s))"
+theconstraints["cms_sus_21_007_simplified"] = "(exp(llhd_cms_sus_21_007_100s-llhd_cms_sus_21_007_0s))"
+theconstraints["cms_sus_21_006_simplified"] = "(exp(llhd_cms_sus_21_006_100s-llhd_cms_sus_21_006_0s))"
+theconstraints["cms_sus_21_006"] = "(max(bf_cms_sus_21_006_mu1p0f,1E-5))"
+
+
+theconstraints["cms_sus_20_001"] = "(max(bf_cms_sus_20_001_mu1p0s,1E-5))"
+theconstraints["cms_sus_20_001_simplified"] = "(exp(llhd_cms_sus_20_001_mu1p0s-llhd_cms_sus_20_001_mu0p0s))"
+
+
+
+#this part combines the various analysis Bayes factors, once including full combine likelihoods where possible, and once using only counts-based simplified likelihoods
+#This sums up the likelihoods assuming the different signal strengths, and the SM-only likelihoods. The sum does not include the analyses where the Bayes factor is saved in the tree instead of the likelihoods
+signals       = "+".join(["llhd_cms_sus_19_006_100s","llhd_cms_sus_20_001_mu1p0s"])
+_backgrounds  = "+".join(["llhd_cms_sus_19_006_0s","llhd_cms_sus_20_001_mu0p0s"])
+#Because we switched to saving Bayes factors, this became a little more complicated
+#again, the max is taken because ROOT has problems with small floats
+
+bfs = []
+bfs.append("(max(bf_cms_sus_21_006_mu1p0f,1E-20))")
+bfs.append("(max(bf_cms_sus_18_004_mu1p0f,1E-20))")
+
+
+#We only started storing the Bayes factors for the full combine likelihoods, so the simplified version is simpler
+signals_simplified = "+".join(["llhd_cms_sus_19_006_100s","llhd_cms_sus_21_006_100s","llhd_cms_sus_18_004_100s","llhd_cms_sus_19_006_mu1p0s"])
+_backgrounds_simplified = "+".join(["llhd_cms_sus_19_006_0s","llhd_cms_sus_21_006_0s","llhd_cms_sus_18_004_0s","llhd_cms_sus_19_006_mu0p0s"])
+
+#these are the Bayes factors for the combination of all analyses. The first term handles the analyses where the log likelihood is stored, the second term handles the analyses where the Bayes factor is stored in the tree 
+theconstraints["combined"] = "(exp(("+signals+")-("+_backgrounds+"))"+(len(bfs)>0)*"*"+"*".join(bfs)+")"
+theconstraints["combined_simplified"] = "(exp(("+signals_simplified+")-("+_backgrounds_simplified+")))"
+# theconstraints["combined_with_cms_sus_20_001"] = "(exp(("+signals+"+llhd_cms_sus_20_001_mu1p0s"+")-("+_backgrounds+"+llhd_cms_sus_20_001_mu0p0s"+"))"+(len(bfs)>0)*"*"+"*".join(bfs)+")"
+
+
+#some useful constraints
+theconstraints["pure higgsino"] = "("+terms["higgsino"]+">0.95)"
+theconstraints["pure wino"] = "("+terms["wino"]+">0.95)"
+theconstraints["pure bino"] = "("+terms["bino"]+">0.95)"
+
+theconstraints["bino-wino mix"] = "(!("+"||".join([theconstraints["pure bino"],theconstraints["pure wino"],theconstraints["pure higgsino"]])+") && "+terms["bino"]+">"+terms["higgsino"]+" && "+terms["bino"]+">"+terms["wino"]+")"
+theconstraints["bino-higgsino mix"] = "(!("+"||".join([theconstraints["pure bino"],theconstraints["pure wino"],theconstraints["pure higgsino"]])+") && "+terms["bino"]+">"+terms["wino"]+" && "+terms["higgsino"]+">"+terms["wino"]+")"
+theconstraints["wino-higgsino mix"] = "(!("+"||".join([theconstraints["pure bino"],theconstraints["pure wino"],theconstraints["pure higgsino"]])+") && "+terms["bino"]+"<"+terms["wino"]+" && "+terms["bino"]+"<"+terms["higgsino"]+")"
+
+def vary_signal_strength(expression, variation):
+    """
+    Returns the constraint or z-score expression for a signal strength of 1.5 ("up") or 0.5 ("down") instead of 1. The variants are plain expression strings,
+    so like the nominal ones they are compiled and cached once by the expression layer (utils/expressions.py)
+    """
+    if variation == "up":
+        return expression.replace('mu1p0','mu1p5').replace('_100s','_150s')
+    if variation == "down":
+        return expression.replace('mu1p0','mu0p5').replace('_100s','_050s')
+    return expression
+
+zscore = {}
+for key in ['combined',"cms_sus_20_001","cms_sus_21_007","cms_sus_21_006"]:#, 'combined_simplified']:
+    value = theconstraints[key]
+    zscore[key] = "TMath::Abs(TMath::Log(%s))/(TMath::Log(%s)) * TMath::Sqrt(2 * TMath::Abs(TMath::Log(%s)))" % (value,value,value)
+
+# print(zscore)
+# print("-"*50)
+# print(theconstraints["cms_sus_20_001"])
+# print("-"*50)
+# # print(theconstraints["combined_with_cms_sus_20_001"])
+# print("-"*50)
+# print(theconstraints["combined"])
+# print("-"*50)
+
+
+#z-axis colors
+sprobcontours = np.float64([-0.01,1E-5,0.05,0.1,0.15,0.2,0.25,0.3,0.35,0.4,0.45,0.5,0.55,0.6,0.65,0.7,0.75,0.8,0.85,0.9,0.95,1-1E-5,1.01])
+
+#dictionary mapping the z-scores for the different analyses to the tree branches 
+branchnames = {}
+for analysis in ["cms_sus_19_006","cms_sus_21_006","cms_sus_18_004","combined", "combined_simplified","cms_sus_21_006_simplified","cms_sus_21_007","cms_sus_21_007_simplified"]:
+    branchnames[analysis] = {}
+    branchnames[analysis+"_up"] = {}
+    branchnames[analysis+"_down"] = {}
+    #now do the defaults
+    if analysis in ["cms_sus_18_004","cms_sus_21_006"]:
+        branchnames[analysis]["Z"] = "Zsig_"+analysis+"_mu1p0f"
+        branchnames[analysis+"_up"]["Z"] = "Zsig_"+analysis+"_mu1p5f"
+        branchnames[analysis+"_down"]["Z"] = "Zsig_"+analysis+"_mu0p5f"
+    elif analysis == "combined_simplified":
+        branchnames[analysis]["Z"] = "Zsig_"+analysis
+    else:
+        branchnames[analysis]["Z"] = "Zsig_"+analysis.replace("_simplified","")
+        branchnames[analysis+"_up"]["Z"] = "Zsig_"+analysis.replace("_simplified","")+"_15s"
+        branchnames[analysis+"_down"]["Z"] = "Zsig_"+analysis.replace("_simplified","")+"_05s"
+# print(branchnames)
+
+
+def get_constraintstrings(analysis, moreconstraints=[], moreconstraints_prior=False, bayesfactor=None):
+    """
+    Returns the selection strings of the prior and of the posterior used by the histogram builders in utils/plots.py. Reweighting is always done, in addition to removing unreasonable points
+    @param analysis: The analysis to use for LHC constraints, only used to pick the simplified or full selection
+    @param moreconstraints: list of logical expressions that constrain the posterior
+    @param moreconstraints_prior: list of logical expressions that constrain the prior
+    @param bayesfactor: optional Bayes factor expression the posterior is weighted with, e.g. theconstraints["combined"]
+    """
+    reason = theconstraints["reason_simplified"] if "simplified" in analysis else theconstraints["reason"]
+    constraintstring_prior = "*".join([theconstraints["reweight"], reason])
+    constraintstring = "*".join([theconstraints["reweight"], reason] + ([bayesfactor] if bayesfactor else []))
+    for newc in moreconstraints:
+        constraintstring += "*(" + newc + ")"
+    if moreconstraints_prior:
+        for newc_p in moreconstraints_prior:
+            constraintstring_prior += "*(" + newc_p + ")"
+    return constraintstring_prior, constraintstring
+
+
+def get_required_expressions(plottype, analysis, drawstring, moreconstraints=[], moreconstraints_prior=False):
+    """
+    Returns the list of expressions that get_impact_plots ("impact"), get_quantile_plot_1D ("quantile1D"), get_quantile_plot_2D ("quantile2D"), get_SP_plots_1D ("survival1D") or get_SP_plot_2D with
+    the prior and posterior credible regions of get_prior_CI and get_posterior_CI ("survival2D") read from the tree, for the given arguments.
+    Reading these once into memory (see utils/batch.py) is enough to make any number of such plots without going back to the tree
+    """
+    variables = split_drawstring(drawstring)
+    if plottype == "impact":
+        bayesfactor = theconstraints["combined_simplified"] if "simplified" in analysis else theconstraints["combined"]
+        constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior, bayesfactor)
+        return variables + [constraintstring_prior, constraintstring, vary_signal_strength(constraintstring, "up"), vary_signal_strength(constraintstring, "down")]
+    if plottype == "quantile1D":
+        constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints)
+        return [theconstraints[analysis]] + variables + [constraintstring]
+    if plottype == "quantile2D":
+        constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+        return variables + [theconstraints[analysis], constraintstring_prior, constraintstring]
+    if plottype == "survival1D":
+        constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+        return variables + [constraintstring_prior, constraintstring] + [vary_signal_strength(theconstraints[analysis], variation) for variation in ["", "up", "down"]]
+    if plottype == "survival2D":
+        constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+        prior_CI = get_constraintstrings("", moreconstraints)[1]
+        posterior_CI = get_constraintstrings(analysis, moreconstraints, bayesfactor=theconstraints[analysis])[1]
+        return variables + [constraintstring_prior, "*".join([constraintstring, "(" + zscore[analysis] + ">-1.64)"]), prior_CI, posterior_CI]
+    raise Exception("No expressions known for plot type " + plottype)
@@ -0,0 +1,149 @@
+import numpy as np
+
+# contour lines of a 2D array of values by marching squares, without ROOT graphics: the same lines that TH2 draws with the "cont list" option,
+# but computed from the bin contents alone, so they need neither a pad nor gROOT.GetListOfSpecials()
+
+# the two edges crossed by the contour in a cell, by case. A cell's case has bit 1 set if its bottom left corner is at or above the level,
+# 2 for the bottom right, 4 for the top right and 8 for the top left corner. Edges: 0 bottom, 1 right, 2 top, 3 left.
+# The saddles 5 and 10 are resolved with the mean of the four corners, see contour_segments
+_segments = {1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)], 6: [(0, 2)], 7: [(3, 2)], 8: [(3, 2)],
+             9: [(0, 2)], 11: [(1, 2)], 12: [(3, 1)], 13: [(0, 1)], 14: [(3, 0)]}
+# saddles, connected if the centre is at or above the level, separated otherwise
+_saddles = {5: ([(3, 2), (0, 1)], [(3, 0), (1, 2)]), 10: ([(3, 0), (1, 2)], [(0, 1), (3, 2)])}
+
+# smoothing kernel of TH2::Smooth with its default option "k5a"
+_k5a = np.array([[0, 0, 1, 0, 0],
+                 [0, 2, 2, 2, 0],
+                 [1, 2, 5, 2, 1],
+                 [0, 2, 2, 2, 0],
+                 [0, 0, 1, 0, 0]], dtype=np.float64)
+
+
+def smooth(values, kernel=_k5a):
+    """
+    Returns the values smoothed as TH2::Smooth does once: every bin becomes the kernel weighted mean of the bins around it, where only bins inside the grid are counted
+    @param values: array of shape (ny, nx), e.g. hist_array(h)[1:-1, 1:-1] of a TH2
+    @param kernel: array of weights of odd shape, centred on the bin
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ny, nx = values.shape
+    ky, kx = kernel.shape
+    padded = np.zeros((ny + ky - 1, nx + kx - 1))
+    padded[ky // 2:ky // 2 + ny, kx // 2:kx // 2 + nx] = values
+    inside = np.zeros(padded.shape)
+    inside[ky // 2:ky // 2 + ny, kx // 2:kx // 2 + nx] = 1
+    content = np.zeros(values.shape)
+    norm = np.zeros(values.shape)
+    for m in range(ky):
+        for n in range(kx):
+            if kernel[m, n] != 0:
+                content += kernel[m, n] * padded[m:m + ny, n:n + nx]
+                norm += kernel[m, n] * inside[m:m + ny, n:n + nx]
+    return content / norm
+
+
+def contour_segments(values, level):
+    """
+    Returns the segments of the contour at level as two arrays of edge point keys, one entry per segment. Key k < (ny*(nx-1)) is the point on the horizontal
+    grid edge between (j, i) and (j, i+1), with k = j*(nx-1) + i, larger keys are on the vertical edges between (j, i) and (j+1, i), k = ny*(nx-1) + j*nx + i
+    @param values: array of shape (ny, nx), values[j, i] at the grid point (x_i, y_j)
+    @param level: value of the contour
+    """
+    ny, nx = values.shape
+    above = values >= level
+    case = above[:-1, :-1] * 1 + above[:-1, 1:] * 2 + above[1:, 1:] * 4 + above[1:, :-1] * 8
+    j, i = np.indices(case.shape)
+    nh = ny * (nx - 1)
+    # keys of the bottom, right, top and left edges of every cell
+    edges = np.stack([j * (nx - 1) + i, nh + j * nx + i + 1, (j + 1) * (nx - 1) + i, nh + j * nx + i])
+    centre = (values[:-1, :-1] + values[:-1, 1:] + values[1:, 1:] + values[1:, :-1]) / 4 >= level
+
+    starts, ends = [], []
+    for c, pairs in _segments.items():
+        cells = case == c
+        for a, b in pairs:
+            starts.append(edges[a][cells])
+            ends.append(edges[b][cells])
+    for c, (connected, separated) in _saddles.items():
+        for pairs, selected in [(connected, (case == c) & centre), (separated, (case == c) & ~centre)]:
+            for a, b in pairs:
+                starts.append(edges[a][selected])
+                ends.append(edges[b][selected])
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def edge_points(values, x, y, level, keys):
+    """
+    Returns the coordinates of the edge points keys (see contour_segments), interpolated linearly between the grid points
+    """
+    ny, nx = values.shape
+    nh = ny * (nx - 1)
+    horizontal = keys < nh
+    j = np.where(horizontal, keys // (nx - 1), (keys - nh) // nx)
+    i = np.where(horizontal, keys % (nx - 1), (keys - nh) % nx)
+    j1 = np.where(horizontal, j, np.minimum(j + 1, ny - 1))
+    i1 = np.where(horizontal, np.minimum(i + 1, nx - 1), i)
+    z0, z1 = values[j, i], values[j1, i1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(z1 != z0, (level - z0) / (z1 - z0), 0.5)
+    return x[i] + t * (x[i1] - x[i]), y[j] + t * (y[j1] - y[j])
+
+
+def contour_lines(values, x, y, level, closed=False):
+    """
+    Returns the contour lines of values at level, as a list of arrays of shape (n, 2) holding the x and y of the points of a line in order.
+    Closed lines end with their first point, lines that run into the border of the grid are open
+    @param values: array of shape (ny, nx), e.g. hist_array(h)[1:-1, 1:-1] of a TH2
+    @param x: array of the nx grid point x coordinates, e.g. the bin centres
+    @param y: array of the ny grid point y coordinates
+    @param level: value of the contour
+    @param closed: closes the lines that run into the border along the border, so that every line encloses a region
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if closed:
+        # a ring of grid points below the level, on the border itself, so that the lines follow the border instead of ending there
+        below = min(values.min(), level) - 1
+        values = np.pad(values, 1, constant_values=below)
+        x = np.concatenate([[x[0]], x, [x[-1]]])
+        y = np.concatenate([[y[0]], y, [y[-1]]])
+    if min(values.shape) < 2:
+        return []
+    starts, ends = contour_segments(values, level)
+    if len(starts) == 0:
+        return []
+    # every edge point belongs to at most two segments, those of the two cells sharing the edge
+    neighbours = {}
+    for a, b in zip(starts.tolist(), ends.tolist()):
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+
+    lines = []
+    visited = set()
+
+    def walk(start):
+        line = [start]
+        visited.add(start)
+        previous, current = None, start
+        while True:
+            following = [n for n in neighbours[current] if n != previous and (n not in visited or (n == start and len(line) > 2))]
+            if not following:
+                return line
+            previous, current = current, following[0]
+            line.append(current)
+            if current == start:
+                return line
+            visited.add(current)
+
+    # open lines start at the border, where a point has a single neighbour, then the closed lines are what is left
+    for key in [key for key, n in neighbours.items() if len(n) == 1]:
+        if key not in visited:
+            lines.append(walk(key))
+    for key in neighbours:
+        if key not in visited:
+            lines.append(walk(key))
+
+    result = []
+    for line in lines:
+        px, py = edge_points(values, x, y, level, np.array(line))
+        result.append(np.column_stack([px, py]))
+    return result
@@ -0,0 +1,45 @@
+import numpy as np
+from utils.contours import contour_lines, smooth
+
+# highest density credible regions of a binned density: the smallest set of bins that holds a given fraction of the total weight.
+# A region is the set of bins whose content is at least the threshold of its fraction, so it is drawn as the contour of the density at that threshold
+
+
+def containment_thresholds(values, intervals):
+    """
+    Returns the bin content thresholds of the credible regions, one per interval, sorted from low to high, i.e. from the largest to the smallest region.
+    The bins are sorted once and the threshold of an interval is the content of the bin at which the cumulative sum first reaches interval times the total
+    @param values: array of bin contents of any shape, e.g. hist_array(h)[1:-1, 1:-1]. Negative contents are ignored
+    @param intervals: list of credibility intervals, e.g. [0.1, 0.67, 0.95]
+    """
+    contents = np.sort(values[values >= 0].ravel())[::-1]
+    if len(contents) == 0:
+        return np.zeros(len(intervals))
+    cumulative = np.cumsum(contents)
+    index = np.searchsorted(cumulative, np.asarray(intervals, dtype=np.float64) * cumulative[-1], side="left")
+    return np.sort(contents[np.minimum(index, len(contents) - 1)])
+
+
+def credible_contours(values, x, y, intervals, smoothed=True, minpoints=5, closed=False):
+    """
+    Returns the contours of the highest density credible regions of a binned density, as a dictionary mapping every interval to a list of lines.
+    A line is a tuple of the arrays of the x and of the y of its points, as TGraph(len(x), x, y) takes them. The intervals are the keys from the largest to the smallest region.
+    Only numpy is used, no pad and no global list of ROOT, so the contours can be computed in threads or in worker processes without graphics and sent back from them
+    @param values: array of bin contents of shape (ny, nx), e.g. hist_array(h)[1:-1, 1:-1]
+    @param x: array of the nx bin centres on the x-axis
+    @param y: array of the ny bin centres on the y-axis
+    @param intervals: list of credibility intervals in increasing order, e.g. [0.1, 0.67, 0.95]
+    @param smoothed: draws the contours of the smoothed density (see utils/contours.py smooth), as the exact boundary is not important and this makes the regions look nicer.
+    The thresholds are always taken from the density itself
+    @param minpoints: lines with fewer points are dropped
+    @param closed: closes the regions that reach the border of the grid along the border
+    """
+    values = np.asarray(values, dtype=np.float64)
+    thresholds = containment_thresholds(values, intervals)
+    drawn = smooth(values) if smoothed else values
+    regions = {}
+    # the lowest threshold belongs to the largest interval
+    for ix, threshold in enumerate(thresholds):
+        lines = contour_lines(drawn, x, y, threshold, closed=closed)
+        regions[intervals[len(intervals) - ix - 1]] = [(np.ascontiguousarray(line[:, 0]), np.ascontiguousarray(line[:, 1])) for line in lines if len(line) >= minpoints]
+    return regions
@@ -0,0 +1,278 @@
+import re
+import functools
+from collections import OrderedDict
+import numpy as np
+
+# translates the TTree::Draw expressions used in utils/plots.py (theconstraints, zscore, drawstrings) into numpy code
+# that can be evaluated on columns of the tree, see utils/columns.py
+
+_tokens = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*(?:::\w+)*)|(\*\*|&&|\|\||==|!=|<=|>=|[-+*/%^<>!(),]))")
+
+# The built-in functions of TTreeFormula guard their domain: log and log10 of a value that is not positive are 0, sqrt takes the absolute value.
+# The TMath:: functions are called as they are, e.g. TMath::Log(0) is -inf, as by TTreeFormula
+functions = {
+    "exp": "np.exp", "TMath::Exp": "np.exp",
+    "log": "_log", "TMath::Log": "np.log",
+    "log10": "_log10", "TMath::Log10": "np.log10",
+    "sqrt": "_sqrt", "TMath::Sqrt": "np.sqrt",
+    "abs": "np.abs", "fabs": "np.abs", "TMath::Abs": "np.abs",
+    "max": "np.maximum", "TMath::Max": "np.maximum",
+    "min": "np.minimum", "TMath::Min": "np.minimum",
+    "pow": "np.power", "TMath::Power": "np.power",
+    "sin": "np.sin", "cos": "np.cos", "tan": "np.tan", "atan2": "np.arctan2",
+}
+
+
+def _divide(a, b):
+    # a division by 0 is 0 in TTreeFormula, e.g. the z-score abs(log B)/log B * sqrt(2 abs(log B)) of a Bayes factor of 1
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    return np.divide(a, b, out=np.zeros(a.shape), where=b != 0)
+
+
+def _log(a):
+    a = np.asarray(a, dtype=np.float64)
+    return np.log(a, out=np.zeros(a.shape), where=a > 0)
+
+
+def _log10(a):
+    a = np.asarray(a, dtype=np.float64)
+    return np.log10(a, out=np.zeros(a.shape), where=a > 0)
+
+
+def _sqrt(a):
+    return np.sqrt(np.abs(a))
+
+
+# names the compiled code is evaluated with
+_globals = {"np": np, "_divide": _divide, "_log": _log, "_log10": _log10, "_sqrt": _sqrt}
+
+# operators by increasing precedence, as in C++
+_binary = [
+    ["||"],
+    ["&&"],
+    ["==", "!="],
+    ["<", ">", "<=", ">="],
+    ["+", "-"],
+    ["*", "/", "%"],
+]
+
+
+def tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = _tokens.match(expression, pos)
+        if match is None or match.end() == pos:
+            raise Exception("Cannot parse expression at '" + expression[pos:] + "' in " + expression)
+        number, name, operator = match.groups()
+        if number is not None:
+            tokens.append(("number", number, match.start(1)))
+        elif name is not None:
+            tokens.append(("name", name, match.start(2)))
+        else:
+            tokens.append(("op", operator, match.start(3)))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = [token[:2] for token in tokenize(expression)]
+        self.pos = 0
+        self.branches = []
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self, value=None):
+        token = self.peek()
+        if value is not None and token[1] != value:
+            raise Exception("Expected '" + value + "' in " + self.expression)
+        self.pos += 1
+        return token
+
+    def parse(self):
+        code = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise Exception("Unexpected '" + str(self.peek()[1]) + "' in " + self.expression)
+        return code
+
+    def binary(self, level):
+        if level == len(_binary):
+            return self.unary()
+        left = self.binary(level + 1)
+        while self.peek()[0] == "op" and self.peek()[1] in _binary[level]:
+            operator = self.take()[1]
+            right = self.binary(level + 1)
+            # booleans are turned back into 1.0/0.0, as TTreeFormula does
+            if operator == "||":
+                left = "(1.0*np.logical_or(%s, %s))" % (left, right)
+            elif operator == "&&":
+                left = "(1.0*np.logical_and(%s, %s))" % (left, right)
+            elif operator in ["==", "!=", "<", ">", "<=", ">="]:
+                left = "(1.0*(%s %s %s))" % (left, operator, right)
+            elif operator == "%":
+                left = "np.fmod(%s, %s)" % (left, right)
+            elif operator == "/":
+                left = "_divide(%s, %s)" % (left, right)
+            else:
+                left = "(%s %s %s)" % (left, operator, right)
+        return left
+
+    def unary(self):
+        token = self.peek()
+        if token == ("op", "!"):
+            self.take()
+            return "(1.0*np.logical_not(%s))" % self.unary()
+        if token == ("op", "-"):
+            self.take()
+            return "(-%s)" % self.unary()
+        if token == ("op", "+"):
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.peek() in [("op", "**"), ("op", "^")]:
+            self.take()
+            return "np.power(%s, %s)" % (base, self.unary())
+        return base
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "number":
+            return "(" + str(float(value)) + ")"
+        if kind == "name":
+            if self.peek() == ("op", "("):
+                if value not in functions:
+                    raise Exception("Unknown function " + value + " in " + self.expression)
+                self.take("(")
+                args = [self.binary(0)]
+                while self.peek() == ("op", ","):
+                    self.take()
+                    args.append(self.binary(0))
+                self.take(")")
+                return functions[value] + "(" + ", ".join(args) + ")"
+            if value not in self.branches:
+                self.branches.append(value)
+            return "c[%r]" % value
+        if (kind, value) == ("op", "("):
+            code = self.binary(0)
+            self.take(")")
+            return code
+        raise Exception("Unexpected '" + str(value) + "' in " + self.expression)
+
+
+class CompiledExpression:
+    """
+    A TTree::Draw expression compiled into numpy code. Evaluating it on a dictionary of branch columns gives the same values as TTreeFormula would, as float64,
+    also where TTreeFormula protects the operations: a division by 0 is 0, log and log10 of a value that is not positive are 0 and sqrt takes the absolute value
+    """
+    def __init__(self, expression):
+        parser = _Parser(expression)
+        self.expression = expression
+        self.source = parser.parse()
+        self.branches = parser.branches
+        self.code = compile(self.source, "<" + expression + ">", "eval")
+
+    def evaluate(self, columns, n):
+        """
+        @param columns: dictionary mapping every branch in self.branches to a numpy array
+        @param n: number of entries. Needed to broadcast expressions that do not depend on any branch, such as "(1)"
+        """
+        with np.errstate(all="ignore"):
+            result = eval(self.code, _globals, {"c": columns})
+        return np.broadcast_to(np.asarray(result, dtype=np.float64), (n,))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_expression(expression):
+    """
+    Parses and compiles an expression once. Later calls with the same expression string return the same CompiledExpression
+    """
+    return CompiledExpression(expression)
+
+
+def product_factors(expression):
+    """
+    Splits an expression that is a product at its outermost level, such as the constraint strings "(1/PickProbability)*(1)*(exp(...))", into its factors. Returns [expression] if it is not a product
+    """
+    tokens = tokenize(expression)
+    expression = expression.strip()
+    depth = 0
+    splits = []
+    for kind, value, start in tokens:
+        if (kind, value) == ("op", "("):
+            depth += 1
+        elif (kind, value) == ("op", ")"):
+            depth -= 1
+        elif kind == "op" and depth == 0:
+            if value != "*" or start == 0:
+                return [expression]  # something else than a product, e.g. a sum or a comparison
+            splits.append(start)
+    if not splits:
+        return [expression]
+    bounds = [-1] + splits + [len(expression)]
+    return [expression[bounds[i] + 1:bounds[i + 1]].strip() for i in range(len(bounds) - 1)]
+
+
+class ExpressionCache:
+    """
+    Evaluated expression arrays, keyed by the expression and by the entry range they were evaluated on. Products are split into their factors and every factor is cached on its own, so the weights shared by many plots,
+    such as the reweighting and the Bayes factor of an analysis, are only evaluated once no matter which other constraints they are multiplied with.
+    The least recently used arrays are dropped once maxbytes is exceeded. Returned arrays are read-only
+    """
+    def __init__(self, maxbytes=2 * 1024**3):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.arrays = OrderedDict()
+
+    def evaluate(self, expression, getcolumn, n, key=None, lookup=None):
+        """
+        @param expression: TTree::Draw expression
+        @param getcolumn: function returning the float64 array of a branch
+        @param n: number of entries
+        @param key: identifies the entry range, e.g. (start, stop)
+        @param lookup: optional function returning the precomputed array of an expression, or None if it was not precomputed (see utils/weights.py)
+        """
+        if (expression, key) in self.arrays:
+            self.arrays.move_to_end((expression, key))
+            return self.arrays[(expression, key)]
+        factors = product_factors(expression)
+        result = lookup(expression) if lookup is not None else None
+        if result is not None:
+            result = np.array(result, dtype=np.float64)
+        elif len(factors) > 1:
+            result = self.evaluate(factors[0], getcolumn, n, key, lookup)
+            for factor in factors[1:]:
+                result = result * self.evaluate(factor, getcolumn, n, key, lookup)
+        else:
+            compiled = compile_expression(expression)
+            result = compiled.evaluate({branch: getcolumn(branch) for branch in compiled.branches}, n)
+        result.flags.writeable = False
+        self.arrays[(expression, key)] = result
+        self.nbytes += result.nbytes
+        while self.nbytes > self.maxbytes and len(self.arrays) > 1:
+            self.nbytes -= self.arrays.popitem(last=False)[1].nbytes
+        return result
+
+    def clear(self):
+        self.arrays.clear()
+        self.nbytes = 0
+
+
+def referenced_branches(expressions):
+    """
+    Returns the list of branch names referenced by a list of expressions, without duplicates
+    """
+    branches = []
+    for expression in expressions:
+        for branch in compile_expression(expression).branches:
+            if branch not in branches:
+                branches.append(branch)
+    return branches
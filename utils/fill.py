@@ -0,0 +1,160 @@
+import re
+import time
+import numpy as np
+from utils.expressions import ExpressionCache, compile_expression, referenced_branches
+from utils.histarrays import get_hist_state, set_hist_state
+from utils.resultcache import get_result_cache, source_identity
+from utils.instrument import timed_chunks, count
+
+# number of tree entries evaluated per TTree::Draw call. This bounds the size of the column buffers that are kept in memory
+chunksize = 1000000
+
+
+def split_drawstring(drawstring):
+    """
+    Splits a draw string of the form Y:X into its expressions, in the order they appear. Scoped names such as TMath::Abs are kept intact
+    @param drawstring: Draw string as passed to root .Draw() function
+    """
+    return re.split(r"(?<!:):(?!:)", drawstring)
+
+
+def read_columns(localtree, expressions, firstentry=0, nentries=None, chunksize=chunksize):
+    """
+    Evaluates a list of expressions on the tree and yields them chunk by chunk as numpy arrays, one array per expression. Every chunk is a single TTree::Draw call reading all branches the expressions need, so all expressions are read in the same pass over the tree and its friends. The returned arrays are read-only
+    @param localtree: Function needs to be passed the ROOT tree from which to operate, or a ColumnStore from utils/columns.py
+    @param expressions: list of expressions to evaluate. Accepts tree branches and mathematical operations acted on them, as in TTree::Draw
+    @param firstentry: first tree entry to read
+    @param nentries: number of entries to read. Default is to read until the end of the tree
+    @param chunksize: maximal number of entries evaluated per TTree::Draw call
+    """
+    # with instrumentation on, the entries read and the time spent reading them are counted, see utils/instrument.py
+    return timed_chunks(_read_columns(localtree, expressions, firstentry, nentries, chunksize))
+
+
+def _read_columns(localtree, expressions, firstentry, nentries, chunksize):
+    if hasattr(localtree, "read_columns"):  # column caches evaluate the expressions themselves, see utils/columns.py
+        yield from localtree.read_columns(expressions, firstentry, nentries, chunksize)
+        return
+    if nentries is None:
+        nentries = localtree.GetEntries() - firstentry
+    lastentry = firstentry + nentries
+
+    # only the branches are read with TTree::Draw, the expressions are evaluated with their compiled numpy versions (see utils/expressions.py).
+    # Expressions that cannot be compiled, e.g. because they use functions that are not translated, are still evaluated by TTree::Draw
+    compiled, passthrough = [], []
+    for expression in expressions:
+        try:
+            compile_expression(expression)
+            compiled.append(expression)
+        except Exception:
+            passthrough.append(expression)
+    drawn = list(dict.fromkeys(referenced_branches(compiled) + passthrough)) or ["Entry$"]
+
+    estimate = localtree.GetEstimate()
+    localtree.SetEstimate(chunksize + 1)  # otherwise TTree::Draw only keeps the first fEstimate rows of the buffers
+    try:
+        for start in range(firstentry, lastentry, chunksize):
+            drawstart = time.perf_counter()
+            n = localtree.Draw(":".join(drawn), "", "goff", min(chunksize, lastentry - start), start)
+            count("draw_seconds", time.perf_counter() - drawstart)
+            if n < 0:
+                raise Exception("TTree::Draw failed for " + ":".join(drawn))
+            if n == 0:
+                continue
+            # the buffers are reused by the next Draw call, so they need to be copied
+            raw = {expression: np.ndarray((n,), dtype=np.float64, buffer=localtree.GetVal(i)).copy() for i, expression in enumerate(drawn)}
+            evaluated = ExpressionCache()  # shares the factors common to the expressions of this chunk
+            yield [raw[expression] if expression in passthrough else evaluated.evaluate(expression, raw.__getitem__, n) for expression in expressions]
+    finally:
+        localtree.SetEstimate(estimate)
+
+
+def axis_edges(axis):
+    """
+    Returns the bin edges of a ROOT axis (or of a NumpyHist axis) as a numpy array
+    """
+    if hasattr(axis, "binning"):
+        return axis.binning.edges
+    return np.array([axis.GetBinLowEdge(i) for i in range(1, axis.GetNbins() + 2)])
+
+
+def find_bins(edges, values):
+    """
+    Vectorised TAxis::FindBin. Returns the ROOT bin number of every value: 0 for the underflow, len(edges) for the overflow
+    """
+    return np.searchsorted(edges, values, side="right")
+
+
+def fill_arrays(hist, coords, w):
+    """
+    Fills a histogram from numpy arrays with TH1::FillN. Like TTree::Draw, entries with zero weight are not filled
+    @param hist: 1D or 2D histogram
+    @param coords: list of coordinate arrays in the order x, y
+    @param w: weight array
+    """
+    selected = w != 0
+    hist.FillN(int(selected.sum()), *[np.ascontiguousarray(c[selected]) for c in coords], np.ascontiguousarray(w[selected]))
+
+
+def fill_histograms(localtree, drawstring, weights, hists, chunksize=chunksize):
+    """
+    Fills several histograms that share a draw string but carry different weights in a single pass over the tree. Returns the list of the summed weights over all tree entries, one per weight, which are the normalisation integrals of the histograms
+    @param localtree: Function needs to be passed the ROOT tree from which to operate, a ColumnStore from utils/columns.py or a ChunkedSource from utils/mapreduce.py
+    @param drawstring: Draw string of the form Y:X, where Y is drawn on the y-axis and X is drawn on the x-axis, or X for 1D histograms
+    @param weights: list of weight expressions, as would be passed as the selection of TTree::Draw. Identical expressions are only evaluated once
+    @param hists: list of histograms to fill, one per weight. An entry can be None if only the summed weight is needed
+    @param chunksize: maximal number of entries evaluated per TTree::Draw call
+    """
+    return cached_histograms(localtree, ["fill_histograms", drawstring, weights], hists,
+                             lambda: _fill_histograms(localtree, drawstring, weights, hists, chunksize))
+
+
+def _fill_histograms(localtree, drawstring, weights, hists, chunksize):
+    if hasattr(localtree, "fill_histograms"):  # sources split into chunks fill them in parallel, see utils/mapreduce.py
+        return localtree.fill_histograms(drawstring, weights, hists, chunksize)
+    variables = split_drawstring(drawstring)[::-1]  # TTree::Draw takes Y:X, TH2::FillN takes x, y
+    unique = list(dict.fromkeys(weights))
+    sums = dict.fromkeys(unique, 0.)
+    for columns in read_columns(localtree, variables + unique, chunksize=chunksize):
+        coords = columns[:len(variables)]
+        wcolumns = dict(zip(unique, columns[len(variables):]))
+        for wexpr, w in wcolumns.items():
+            sums[wexpr] += w.sum()
+        for wexpr, hist in zip(weights, hists):
+            if hist is not None:
+                fill_arrays(hist, coords, wcolumns[wexpr])
+    return [sums[wexpr] for wexpr in weights]
+
+
+def cached_histograms(localtree, parts, hists, compute):
+    """
+    Restores histograms and a list of numbers from the result cache (see utils/resultcache.py) if they were computed from the same data before.
+    Otherwise calls compute, which fills the histograms and returns the numbers, and stores both. Without a result cache, or for data that can not be identified, this is just compute()
+    @param localtree: tree, ColumnStore or ChunkedSource the results are computed from
+    @param parts: list of everything else the results depend on, e.g. the draw string and the weights. The binning of the histograms is added to it
+    @param hists: list of histograms filled by compute. Entries can be None
+    @param compute: function without arguments
+    """
+    cache = get_result_cache()
+    identity = source_identity(localtree) if cache is not None else None
+    if identity is None:
+        return compute()
+    axes = [lambda h: h.GetXaxis(), lambda h: h.GetYaxis(), lambda h: h.GetZaxis()]
+    binnings = [[hist.ClassName()] + [axis_edges(axes[i](hist)) for i in range(hist.GetDimension())] if hist is not None else None for hist in hists]
+    key = cache.key(identity, parts, binnings)
+    stored = cache.load(key)
+    if stored is not None:
+        count("cache_hits", 1)
+        for i, hist in enumerate(hists):
+            if hist is not None:
+                set_hist_state(hist, stored["contents%d" % i], stored.get("sumw2%d" % i), stored["entries%d" % i])
+        return stored["values"].tolist()
+    values = compute()
+    arrays = {"values": np.asarray(values, dtype=np.float64)}
+    for i, hist in enumerate(hists):
+        if hist is not None:
+            arrays["contents%d" % i], sumw2, arrays["entries%d" % i] = get_hist_state(hist)
+            if sumw2 is not None:
+                arrays["sumw2%d" % i] = sumw2
+    cache.save(key, arrays)
+    return values
@@ -0,0 +1,79 @@
+import numpy as np
+from utils.numpyhist import NumpyHist
+
+# numpy types of the bin content buffers of the ROOT histogram classes, keyed by the TArray they inherit from
+_buffertypes = {"TArrayD": np.float64, "TArrayF": np.float32, "TArrayI": np.int32, "TArrayS": np.int16, "TArrayC": np.int8}
+
+
+def hist_array(hist):
+    """
+    Returns a numpy view on the bin contents of a ROOT histogram, including the underflow and overflow bins. Writing to the view changes the histogram.
+    The shape is (nx+2,) for 1D, (ny+2, nx+2) for 2D and (nz+2, ny+2, nx+2) for 3D histograms, so that hist_array(h)[j, i] is bin (i, j) of a TH2 and [1:-1, 1:-1] are the bins inside the axis ranges
+    @param hist: ROOT TH1, TH2 or TH3, or a NumpyHist
+    """
+    if isinstance(hist, NumpyHist):
+        return hist.sumw
+    dtype = next(dtype for name, dtype in _buffertypes.items() if hist.InheritsFrom(name))
+    shape = [hist.GetNbinsX() + 2]
+    if hist.GetDimension() > 1:
+        shape.insert(0, hist.GetNbinsY() + 2)
+    if hist.GetDimension() > 2:
+        shape.insert(0, hist.GetNbinsZ() + 2)
+    return np.ndarray(tuple(shape), dtype=dtype, buffer=hist.GetArray())
+
+
+def survival_sentinels(values, denominator, cutoff=1E-3):
+    """
+    Applies the conventions of the survival probability and quantile maps to an array of bin values, in place:
+    empty bins keep 0 if the denominator (the prior) is populated and become -1 if it is not, and non-zero values below the cutoff are raised to the cutoff so they are not drawn as excluded.
+    Returns the array
+    @param values: array of bin values, e.g. hist_array(h)[1:-1, 1:-1]
+    @param denominator: array of the prior bin contents, same shape as values
+    @param cutoff: smallest non-zero value that is kept
+    """
+    empty = values == 0
+    values[empty & (denominator == 0)] = -1
+    values[~empty & (values < cutoff) & (denominator > 0)] = cutoff
+    return values
+
+
+def apply_survival_sentinels(hist, hdenom, cutoff=1E-3):
+    """
+    survival_sentinels on the bins of a 2D histogram inside the axis ranges, with the denominator taken from a histogram with the same binning. Returns the largest bin value afterwards
+    """
+    values = survival_sentinels(hist_array(hist)[1:-1, 1:-1], hist_array(hdenom)[1:-1, 1:-1], cutoff)
+    return values.max()
+
+
+def get_hist_state(hist):
+    """
+    Returns the bin contents, the squared weights (None if the histogram does not store them) and the number of entries of a ROOT histogram, as numpy arrays that can be saved and restored with set_hist_state
+    """
+    if isinstance(hist, NumpyHist):
+        return hist.sumw.copy(), hist.sumw2.copy(), hist.entries
+    contents = hist_array(hist)
+    sumw2 = np.ndarray(contents.shape, dtype=np.float64, buffer=hist.GetSumw2().GetArray()).copy() if hist.GetSumw2N() > 0 else None
+    return contents.copy(), sumw2, hist.GetEntries()
+
+
+def set_hist_state(hist, contents, sumw2=None, entries=None):
+    """
+    Sets the bin contents (including underflow and overflow), and optionally the squared weights and the number of entries, of a ROOT histogram as if it had been filled entry by entry.
+    Giving the squared weights enables Sumw2 on the histogram. The statistics are recomputed from the bins
+    """
+    if isinstance(hist, NumpyHist):
+        hist.sumw[...] = contents
+        if sumw2 is not None:
+            hist.sumw2[...] = sumw2
+        if entries is not None:
+            hist.entries = entries
+        return hist
+    hist_array(hist)[...] = contents
+    if sumw2 is not None:
+        if hist.GetSumw2N() == 0:
+            hist.Sumw2()  # the squared weights are kept even if the histogram was made without them, as filling with weights would
+        np.ndarray(hist_array(hist).shape, dtype=np.float64, buffer=hist.GetSumw2().GetArray())[...] = sumw2
+    hist.ResetStats()
+    if entries is not None:
+        hist.SetEntries(entries)
+    return hist
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import inspect
+import resource
+import functools
+import contextlib
+
+# optional instrumentation of the plot methods and histogram builders. Every stage (a plot, a builder, a quantile computation, the writing of a file) that is
+# left appends one JSON line to the instrumentation file, with its wall and CPU time, the peak memory of the process, the number of tree entries read during
+# the stage and the time spent reading them. Stages nest: the name of a stage is the path of the stages it is part of, e.g. "quantile2D/get_quantile_plots_2D/quantiles".
+# Switched off (the default), a stage costs a function call
+
+# file the records are appended to, see set_instrumentation. None switches the instrumentation off
+_path = None
+# stages that are currently open, innermost last
+_stack = []
+# depth of nested chunk reads, so that sources reading through other sources count their entries once
+_reading = 0
+
+
+def set_instrumentation(path):
+    """
+    Appends the records of all stages to the JSON lines file path, or switches the instrumentation off if path is None. Several processes can write to the same file,
+    the records carry their process id
+    """
+    global _path
+    _path = path
+    if path is not None and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+@contextlib.contextmanager
+def using_instrumentation(path):
+    """
+    Context in which the records are appended to path, or the instrumentation is off if path is None, and after which the previous file is restored.
+    Objects with an instrumentation file of their own (see PMSSM.settingsContext) run their stages in it
+    """
+    global _path
+    previous = _path
+    set_instrumentation(path)
+    try:
+        yield
+    finally:
+        _path = previous
+
+
+def enabled():
+    return _path is not None
+
+
+def _peak_rss():
+    # maximum resident set size of this process in bytes. Linux reports kilobytes, macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = dict(fields)
+        self.counters = {}
+
+    def __enter__(self):
+        self.path = "/".join([stage.name for stage in _stack] + [self.name])
+        self.start = time.perf_counter()
+        self.cpustart = time.process_time()
+        self.peakstart = _peak_rss()
+        _stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _stack.remove(self)
+        peak = _peak_rss()
+        fields = {}
+        for stage in _stack:
+            fields.update(stage.fields)
+        fields.update(self.fields)
+        record = {"stage": self.path, "wall_seconds": time.perf_counter() - self.start, "cpu_seconds": time.process_time() - self.cpustart,
+                  "peak_rss": peak, "peak_rss_growth": peak - self.peakstart, **self.counters, **fields, "failed": exc_type is not None,
+                  "pid": os.getpid(), "time": time.time()}
+        if _path is not None:
+            with open(_path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_nostage = _NoStage()
+
+
+def stage(name, **fields):
+    """
+    Context manager measuring a stage. The fields (e.g. the plot name) are added to its record and to the records of the stages inside it
+    """
+    if _path is None:
+        return _nostage
+    return _Stage(name, fields)
+
+
+def annotate(**fields):
+    """
+    Adds fields to the record of the innermost open stage, e.g. the plot name once it is known
+    """
+    if _stack:
+        _stack[-1].fields.update(fields)
+
+
+def count(name, value):
+    """
+    Adds value to the counter name (e.g. "entries") of every open stage
+    """
+    for stage in _stack:
+        stage.counters[name] = stage.counters.get(name, 0) + value
+
+
+def instrumented(name, *argnames):
+    """
+    Decorator making every call of a function a stage. The arguments argnames of the call, e.g. the drawstring, are recorded as fields
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _path is None:
+                return function(*args, **kwargs)
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            with _Stage(name, {argname: arguments[argname] for argname in argnames if argname in arguments}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_chunks(chunks, counter="read_seconds"):
+    """
+    Yields the chunks of columns of a reader (see utils/fill.py read_columns) and counts the entries and the time spent producing them, not the time the caller spends on them.
+    Readers that read through other readers are counted once
+    """
+    global _reading
+    if _path is None or _reading:
+        yield from chunks
+        return
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            _reading += 1
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _reading -= 1
+                count(counter, time.perf_counter() - start)
+            count("entries", len(chunk[0]) if len(chunk) else 0)
+            yield chunk
+    finally:
+        # a reader that is left early restores its tree, as with yield from
+        if hasattr(iterator, "close"):
+            iterator.close()
@@ -0,0 +1,229 @@
+import os
+import multiprocessing
+import numpy as np
+from utils.fill import read_columns, split_drawstring, axis_edges, find_bins, chunksize
+from utils.quantiles import weighted_quantiles
+from utils.histarrays import set_hist_state
+from utils.resultcache import chain_identity
+
+# partial results of a histogram or quantile map that can be filled chunk by chunk, in different processes, and merged exactly afterwards.
+# Cells are numbered like the ROOT global bins, including underflow and overflow: cell = ix + (nx+2)*iy
+
+
+class HistogramAccumulator:
+    """
+    Sum of weights (and of squared weights) per cell of a 1D or 2D binning
+    """
+    def __init__(self, variables, edges, weight):
+        """
+        @param variables: list of the expressions on the axes, in the order x, y
+        @param edges: list of the bin edge arrays of the axes, in the same order
+        @param weight: weight expression, as would be passed as the selection of TTree::Draw
+        """
+        self.variables = list(variables)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.weight = weight
+        self.shape = tuple(len(e) + 1 for e in self.edges[::-1])  # as hist_array: (ny+2, nx+2)
+        self.sumw = np.zeros(int(np.prod(self.shape)))
+        self.sumw2 = np.zeros(int(np.prod(self.shape)))
+        self.entries = 0
+        self.total = 0.
+
+    def expressions(self):
+        return self.variables + [self.weight]
+
+    def cells(self, coords):
+        cells = np.zeros(len(coords[0]), dtype=np.int64)
+        stride = 1
+        for edges, values in zip(self.edges, coords):
+            cells += stride * find_bins(edges, values)
+            stride *= len(edges) + 1
+        return cells
+
+    def fill(self, columns):
+        """
+        @param columns: dictionary mapping the expressions of this accumulator to arrays of the same length
+        """
+        w = columns[self.weight]
+        self.total += w.sum()
+        selected = w != 0
+        w = w[selected]
+        cells = self.cells([columns[v][selected] for v in self.variables])
+        self.sumw += np.bincount(cells, w, minlength=len(self.sumw))
+        self.sumw2 += np.bincount(cells, w * w, minlength=len(self.sumw2))
+        self.entries += len(w)
+
+    def merge(self, other):
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        self.entries += other.entries
+        self.total += other.total
+        return self
+
+    def fill_hist(self, hist):
+        """
+        Sets the bin contents of a ROOT histogram with the same binning to the accumulated sums, as if it had been filled entry by entry
+        """
+        return set_hist_state(hist, self.sumw.reshape(self.shape), self.sumw2.reshape(self.shape), self.entries)
+
+
+class QuantileAccumulator(HistogramAccumulator):
+    """
+    Cell, value and weight of every selected point, from which exact weighted quantiles of the value per cell are computed. Merging concatenates the points, so it is exact
+    """
+    def __init__(self, variables, edges, value, weight):
+        HistogramAccumulator.__init__(self, variables, edges, weight)
+        self.value = value
+        self.points = []
+
+    def expressions(self):
+        return self.variables + [self.value, self.weight]
+
+    def fill(self, columns):
+        w = columns[self.weight]
+        selected = w != 0
+        self.points.append((self.cells([columns[v][selected] for v in self.variables]), np.asarray(columns[self.value][selected], dtype=np.float64), w[selected]))
+
+    def merge(self, other):
+        self.points += other.points
+        return self
+
+    def quantiles(self, probs):
+        """
+        Returns the weighted quantiles of the value in every cell, of shape (ncells, len(probs)), NaN for cells without points, see utils/quantiles.py
+        """
+        if not self.points:
+            return np.full((len(self.sumw), len(probs)), np.nan)
+        cells, values, weights = [np.concatenate(p) for p in zip(*self.points)]
+        return weighted_quantiles(cells, values, weights, len(self.sumw), probs)
+
+
+def accumulate(localtree, accumulators, chunksize=chunksize):
+    """
+    Fills a list of accumulators in one pass over the tree, reading every expression they need once. Sources that are split into chunks (ChunkedSource) fill them in parallel. Returns the filled accumulators
+    @param localtree: ROOT tree, ColumnStore or ChunkedSource from which to operate
+    @param accumulators: list of empty accumulators
+    """
+    if hasattr(localtree, "accumulate"):
+        return localtree.accumulate(accumulators)
+    return _fill(localtree, accumulators, 0, None, chunksize)
+
+
+def _fill(localtree, accumulators, firstentry, nentries, chunksize):
+    expressions = list(dict.fromkeys(e for acc in accumulators for e in acc.expressions()))
+    for acc in accumulators:
+        if hasattr(acc, "seek"):  # accumulators that number the entries they are filled with, see utils/bootstrap.py
+            acc.seek(firstentry)
+    for chunk in read_columns(localtree, expressions, firstentry, nentries, chunksize):
+        columns = dict(zip(expressions, chunk))
+        for acc in accumulators:
+            acc.fill(columns)
+    return accumulators
+
+
+def histogram_accumulators(drawstring, weights, hists):
+    """
+    Returns one HistogramAccumulator per weight for the draw string, with the binning of the corresponding histogram
+    """
+    variables = split_drawstring(drawstring)[::-1]  # TTree::Draw takes Y:X
+    axes = [lambda h: h.GetXaxis(), lambda h: h.GetYaxis()]
+    reference = next(hist for hist in hists if hist is not None)
+    edges = [axis_edges(axes[i](reference)) for i in range(len(variables))]
+    return [HistogramAccumulator(variables, edges, weight) for weight in weights]
+
+
+# state of a worker process of a ChunkedSource: its chain of the tree files with the friends attached, opened once by _init_worker
+_worker = {}
+
+
+def _open_chain(files, treename, friendAnalysis):
+    from ROOT import TChain
+    chain = TChain(treename)
+    for f in files:
+        chain.Add(f)
+    friends = []
+    for friend in friendAnalysis:
+        friendchain = TChain(friend["treeName"])
+        for path in friend.get("paths", [friend.get("path")]):
+            friendchain.Add(path)
+        chain.AddFriend(friendchain)
+        friends.append(friendchain)
+    return chain, friends
+
+
+def _init_worker(files, treename, friendAnalysis):
+    from ROOT import gROOT
+    gROOT.SetBatch(True)
+    _worker["chain"], _worker["friends"] = _open_chain(files, treename, friendAnalysis)
+
+
+def _fill_chunk(args):
+    accumulators, firstentry, nentries, chunksize = args
+    return _fill(_worker["chain"], accumulators, firstentry, nentries, chunksize)
+
+
+class ChunkedSource:
+    """
+    A tree stored in several ROOT files, with its friend trees, whose entries are split into chunks that are filled in separate processes and merged afterwards.
+    It can be passed instead of a tree to PMSSM (with friendAnalysis=[]) and to the builders in utils/plots.py: fill_histograms and the quantile maps run through accumulate
+    and are parallel, anything else reads the chain chunk by chunk in this process
+    """
+    def __init__(self, files, treename, friendAnalysis=[], nworkers=None, chunkentries=None, chunksize=chunksize):
+        """
+        @param files: list of ROOT file paths (or wildcards, as understood by TChain::Add) holding the tree
+        @param treename: name of the tree
+        @param friendAnalysis: list of friend trees as in PMSSM, {"treeName": ..., "path": ...}, or with "paths", a list of files in the same order as files
+        @param nworkers: number of processes. Default is the number of cores
+        @param chunkentries: number of entries filled per task. Default splits the entries into four tasks per process, so that the processes finish at about the same time
+        @param chunksize: maximal number of entries read at once within a task
+        """
+        self.files = list(files)
+        self.treename = treename
+        self.friendAnalysis = friendAnalysis
+        self.nworkers = nworkers or os.cpu_count()
+        self.chunksize = chunksize
+        self.chain, self.friends = _open_chain(self.files, treename, friendAnalysis)
+        self.entries = int(self.chain.GetEntries())
+        self.chunkentries = chunkentries or max(1, -(-self.entries // (4 * self.nworkers)))
+        self.pool = None
+
+    def GetEntries(self):
+        return self.entries
+
+    def identity(self):
+        return chain_identity(self.files, self.treename, self.friendAnalysis)
+
+    def chunks(self):
+        return [(start, min(self.chunkentries, self.entries - start)) for start in range(0, self.entries, self.chunkentries)]
+
+    def read_columns(self, expressions, firstentry=0, nentries=None, chunksize=chunksize):
+        yield from read_columns(self.chain, expressions, firstentry, nentries, chunksize)
+
+    def accumulate(self, accumulators):
+        """
+        Fills copies of the empty accumulators on every chunk in the worker processes and merges them, in the order of the entries
+        """
+        if self.pool is None:
+            # started on first use and kept, so every worker opens the files only once
+            context = multiprocessing.get_context("spawn")
+            self.pool = context.Pool(self.nworkers, initializer=_init_worker, initargs=(self.files, self.treename, self.friendAnalysis))
+        merged = None
+        for partial in self.pool.imap(_fill_chunk, [(accumulators, start, n, self.chunksize) for start, n in self.chunks()]):
+            merged = partial if merged is None else [acc.merge(other) for acc, other in zip(merged, partial)]
+        return merged if merged is not None else accumulators
+
+    def fill_histograms(self, drawstring, weights, hists, chunksize=chunksize):
+        """
+        Same as utils.fill.fill_histograms, with the chunks filled in parallel
+        """
+        accumulators = accumulate(self, histogram_accumulators(drawstring, weights, hists))
+        for acc, hist in zip(accumulators, hists):
+            if hist is not None:
+                acc.fill_hist(hist)
+        return [acc.total for acc in accumulators]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,206 @@
+import copy
+import contextlib
+import numpy as np
+
+# numpy histograms for the builders in utils/plots.py. A NumpyHist holds the summed weights and squared weights of its bins in numpy arrays and answers the part of
+# the TH1 interface the builders use (FillN, Scale, Divide, Clone, GetMaximum, the axes and the style setters), so the builders are the same for both backends.
+# Style and axis settings are recorded and replayed on the ROOT histogram that to_root makes when the plot is drawn (see Plotter.toROOT).
+# With the numpy backend no ROOT histogram is created or filled while the statistics are computed
+
+# "root" makes TH1F/TH2F/TH3F, "numpy" makes NumpyHist, see set_histogram_backend
+backends = ["root", "numpy"]
+_backend = "root"
+
+
+def set_histogram_backend(backend):
+    """
+    Selects the histograms the builders of utils/plots.py make: "root" for ROOT histograms, "numpy" for NumpyHist, which are converted to ROOT only when they are drawn
+    """
+    global _backend
+    if backend not in backends:
+        raise Exception("Unknown histogram backend " + str(backend) + ", possible backends are " + " and ".join(backends))
+    _backend = backend
+
+
+def histogram_backend():
+    return _backend
+
+
+@contextlib.contextmanager
+def using_histogram_backend(backend):
+    """
+    Context in which the builders make the histograms of backend, and after which the previous backend is restored.
+    Objects with a backend of their own (see PMSSM.settingsContext) run their builders in it
+    """
+    previous = _backend
+    set_histogram_backend(backend)
+    try:
+        yield
+    finally:
+        set_histogram_backend(previous)
+
+
+class NumpyAxis:
+    """
+    Axis of a NumpyHist: its binning (see utils/binning.py) and the settings made on it
+    """
+    def __init__(self, binning):
+        self.binning = binning
+        self.calls = []
+
+    def GetNbins(self):
+        return self.binning.nbins
+
+    def GetBinLowEdge(self, i):
+        return self.binning.edges[min(max(i, 1), self.binning.nbins + 1) - 1]
+
+    def GetXmin(self):
+        return self.binning.low
+
+    def GetXmax(self):
+        return self.binning.up
+
+    def __getattr__(self, name):
+        # SetTitle, SetRangeUser, SetTitleOffset, ... are applied to the ROOT axis in to_root
+        if name.startswith("Set"):
+            return lambda *args: self.calls.append((name, args))
+        raise AttributeError("NumpyAxis has no attribute " + name)
+
+
+class NumpyHist:
+    """
+    Weighted 1D, 2D or 3D histogram in numpy arrays. The arrays include the underflow and overflow bins and have the shape of hist_array of the ROOT histogram
+    (see utils/histarrays.py): (nx+2,), (ny+2, nx+2) or (nz+2, ny+2, nx+2)
+    """
+    def __init__(self, name, title, binnings):
+        """
+        @param name: name of the ROOT histogram it becomes
+        @param title: title of the ROOT histogram
+        @param binnings: list of the Binning of the x, y and z axes
+        """
+        self.name = name
+        self.title = title
+        self.axes = [NumpyAxis(binning) for binning in binnings]
+        shape = tuple(binning.nbins + 2 for binning in binnings[::-1])
+        self.sumw = np.zeros(shape)
+        self.sumw2 = np.zeros(shape)
+        self.entries = 0.
+        self.calls = []
+
+    def GetName(self):
+        return self.name
+
+    def SetTitle(self, title):
+        self.title = title
+
+    def ClassName(self):
+        # the class of the ROOT histogram it becomes, so that the result cache keys are the same for both backends
+        return "TH%dF" % len(self.axes)
+
+    def GetDimension(self):
+        return len(self.axes)
+
+    def GetXaxis(self):
+        return self.axes[0]
+
+    def GetYaxis(self):
+        # as in ROOT, the y and z axes of a histogram of lower dimension exist and only take the settings
+        return self.axes[1] if len(self.axes) > 1 else self._extra_axis(1)
+
+    def GetZaxis(self):
+        return self.axes[2] if len(self.axes) > 2 else self._extra_axis(2)
+
+    def _extra_axis(self, index):
+        if not hasattr(self, "extra_axes"):
+            self.extra_axes = {}
+        return self.extra_axes.setdefault(index, NumpyAxis(None))
+
+    def GetNbinsX(self):
+        return self.axes[0].GetNbins()
+
+    def GetNbinsY(self):
+        return self.axes[1].GetNbins() if len(self.axes) > 1 else 1
+
+    def GetNbinsZ(self):
+        return self.axes[2].GetNbins() if len(self.axes) > 2 else 1
+
+    def GetEntries(self):
+        return self.entries
+
+    def SetEntries(self, entries):
+        self.entries = entries
+
+    def Sumw2(self, flag=True):
+        # the squared weights are always kept
+        pass
+
+    def FillN(self, n, *args):
+        """
+        Same as TH1::FillN with weights: the coordinate arrays x (, y, z) followed by the weight array
+        """
+        coords, w = args[:-1], np.asarray(args[-1], dtype=np.float64)[:n]
+        cells = np.zeros(n, dtype=np.int64)
+        stride = 1
+        for axis, values in zip(self.axes, coords):
+            cells += stride * axis.binning.find_bins(np.asarray(values)[:n])
+            stride *= axis.binning.nbins + 2
+        self.sumw += np.bincount(cells, w, minlength=self.sumw.size).reshape(self.sumw.shape)
+        self.sumw2 += np.bincount(cells, w * w, minlength=self.sumw.size).reshape(self.sumw.shape)
+        self.entries += n
+
+    def Scale(self, factor):
+        self.sumw *= factor
+        self.sumw2 *= factor * factor
+
+    def Divide(self, other):
+        """
+        Divides bin by bin by a histogram of the same binning as TH1::Divide does: bins of other without content become 0, the errors are propagated as for independent histograms
+        """
+        filled = other.sumw != 0
+        denominator = np.where(filled, other.sumw, 1.)
+        sumw2 = (self.sumw2 * other.sumw ** 2 + other.sumw2 * self.sumw ** 2) / denominator ** 4
+        self.sumw = np.where(filled, self.sumw / denominator, 0.)
+        self.sumw2 = np.where(filled, sumw2, 0.)
+
+    def Clone(self, name=None):
+        clone = copy.deepcopy(self)
+        if name is not None:
+            clone.name = name
+        return clone
+
+    def inside(self):
+        """
+        Returns a view of the bins inside the axis ranges, without underflow and overflow
+        """
+        return self.sumw[tuple(slice(1, -1) for _ in self.axes)]
+
+    def GetMaximum(self):
+        maximum = [args[0] for name, args in self.calls if name == "SetMaximum"]
+        return maximum[-1] if maximum else self.inside().max()
+
+    def GetMinimum(self):
+        minimum = [args[0] for name, args in self.calls if name == "SetMinimum"]
+        return minimum[-1] if minimum else self.inside().min()
+
+    def __getattr__(self, name):
+        # SetLineColor, SetContour, SetMaximum, ... are applied to the ROOT histogram in to_root
+        if name.startswith("Set"):
+            return lambda *args: self.calls.append((name, args))
+        raise AttributeError("NumpyHist has no attribute " + name)
+
+    def to_root(self):
+        """
+        Returns the ROOT histogram with the same bins, contents, squared weights, entries, titles and settings
+        """
+        from utils.utils import mkhist
+        from utils.histarrays import set_hist_state
+        hist = mkhist(self.name, self.title, *[axis.binning for axis in self.axes], backend="root")
+        hist.Sumw2()
+        set_hist_state(hist, self.sumw, self.sumw2, self.entries)
+        for name, args in self.calls:
+            getattr(hist, name)(*args)
+        axes = [hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()]
+        for index, axis in list(enumerate(self.axes)) + list(getattr(self, "extra_axes", {}).items()):
+            for name, args in axis.calls:
+                getattr(axes[index], name)(*args)
+        return hist
@@ -1,131 +1,72 @@
 
-from ROOT import *
 import os,sys
 from utils.utils import *
+from utils.colors import kBlack, kGray, kBlue, kRed, kMagenta, kSolid, kDashed
+from utils.fill import fill_histograms, cached_histograms, split_drawstring
+from utils.mapreduce import accumulate, HistogramAccumulator, QuantileAccumulator
+from utils.tdigest import TDigestAccumulator
+from utils.sparsequantiles import SparseQuantileAccumulator
+from utils.bootstrap import fill_bands
+from utils.survival import SurvivalAccumulator
+from utils.histarrays import hist_array, apply_survival_sentinels
+from utils.instrument import stage, instrumented
+from utils.credible import containment_thresholds, credible_contours
 import argparse
 import numpy as np
-# terms defining
-terms = {}
-terms["higgsino"] = "(Re_N_13**2+Re_N_14**2)"
-terms["bino"] = "Re_N_11**2"
-terms["wino"] = "Re_N_12**2"
-
-#constraints relating to the analyses likelihoods and others
-theconstraints = {}
-theconstraints["reason"] = "(!(xsec_tot_pb>1E3 && Zsig_combined==0))" # this excludes points with enormous weights that could not be excluded, almost certaintly due to these large weights and statistical chance
-theconstraints["reason"] = "(1)"
-
-theconstraints["reason_simplified"] = "(!(xsec_tot_pb>1E3 && Zsig_combined_simplified==0))"# this excludes points with enormous weights that could not be excluded, almost certaintly due to these large weights and statistical chance
-theconstraints["reason_simplified"] = "(1)"
-
-theconstraints["reweight"] = "(1/PickProbability)" #this reweights each point to remove the effect of over-sampling and under-sampling. Important for Bayesian interpretation of results that require a meaningful prior.
-
-#The following are Bayes factors using simplified or (where available) full combine likelihoods
-
-#Note from Sam 18 April, 2024: I am doing away with all the up and down keys and using replace() statements
-#*_100s is the likelihood assuming a signal strength of 1, *_050s assumes a signal strength of 0.5, *_150s assumes a signal strength of 1.5, and *_0s assumes no signal (SM-only likelihood)
-theconstraints["cms_sus_19_006"] = "(exp(llhd_cms_sus_19_006_100s-llhd_cms_sus_19_006_0s))"
-theconstraints["cms_sus_18_004_simplified"] = "(exp(llhd_cms_sus_18_004_100s-llhd_cms_sus_18_004_0s))"
-#At some point we switches to saving the Bayes factor directly in the tree, instead of the signal and signal-less likelihoods
-#Here, muXpYf refers to signal strength of X.Y, and f refers to "full" as in full combine likelihood. The max sometimes has to be taken because root can't handle extremely small floats.
-theconstraints["cms_sus_18_004"] = "(max(bf_cms_sus_18_004_mu1p0f,1E-5))"
-theconstraints["cms_sus_21_007"] = "(exp(llhd_cms_sus_21_007_100s-llhd_cms_sus_21_007_0s))"
-theconstraints["cms_sus_21_007_simplified"] = "(exp(llhd_cms_sus_21_007_100s-llhd_cms_sus_21_007_0s))"
-theconstraints["cms_sus_21_006_simplified"] = "(exp(llhd_cms_sus_21_006_100s-llhd_cms_sus_21_006_0s))"
-theconstraints["cms_sus_21_006"] = "(max(bf_cms_sus_21_006_mu1p0f,1E-5))"
-
-
-theconstraints["cms_sus_20_001"] = "(max(bf_cms_sus_20_001_mu1p0s,1E-5))"
-theconstraints["cms_sus_20_001_simplified"] = "(exp(llhd_cms_sus_20_001_mu1p0s-llhd_cms_sus_20_001_mu0p0s))"
-
-
-
-#this part combines the various analysis Bayes factors, once including full combine likelihoods where possible, and once using only counts-based simplified likelihoods
-#This sums up the likelihoods assuming the different signal strengths, and the SM-only likelihoods. The sum does not include the analyses where the Bayes factor is saved in the tree instead of the likelihoods
-signals       = "+".join(["llhd_cms_sus_19_006_100s","llhd_cms_sus_20_001_mu1p0s"])
-_backgrounds  = "+".join(["llhd_cms_sus_19_006_0s","llhd_cms_sus_20_001_mu0p0s"])
-#Because we switched to saving Bayes factors, this became a little more complicated
-#again, the max is taken because ROOT has problems with small floats
-
-bfs = []
-bfs.append("(max(bf_cms_sus_21_006_mu1p0f,1E-20))")
-bfs.append("(max(bf_cms_sus_18_004_mu1p0f,1E-20))")
-
-
-#We only started storing the Bayes factors for the full combine likelihoods, so the simplified version is simpler
-signals_simplified = "+".join(["llhd_cms_sus_19_006_100s","llhd_cms_sus_21_006_100s","llhd_cms_sus_18_004_100s","llhd_cms_sus_19_006_mu1p0s"])
-_backgrounds_simplified = "+".join(["llhd_cms_sus_19_006_0s","llhd_cms_sus_21_006_0s","llhd_cms_sus_18_004_0s","llhd_cms_sus_19_006_mu0p0s"])
-
-#these are the Bayes factors for the combination of all analyses. The first term handles the analyses where the log likelihood is stored, the second term handles the analyses where the Bayes factor is stored in the tree 
-theconstraints["combined"] = "(exp(("+signals+")-("+_backgrounds+"))"+(len(bfs)>0)*"*"+"*".join(bfs)+")"
-theconstraints["combined_simplified"] = "(exp(("+signals_simplified+")-("+_backgrounds_simplified+")))"
-# theconstraints["combined_with_cms_sus_20_001"] = "(exp(("+signals+"+llhd_cms_sus_20_001_mu1p0s"+")-("+_backgrounds+"+llhd_cms_sus_20_001_mu0p0s"+"))"+(len(bfs)>0)*"*"+"*".join(bfs)+")"
-
-
-#some useful constraints
-theconstraints["pure higgsino"] = "("+terms["higgsino"]+">0.95)"
-theconstraints["pure wino"] = "("+terms["wino"]+">0.95)"
-theconstraints["pure bino"] = "("+terms["bino"]+">0.95)"
-
-theconstraints["bino-wino mix"] = "(!("+"||".join([theconstraints["pure bino"],theconstraints["pure wino"],theconstraints["pure higgsino"]])+") && "+terms["bino"]+">"+terms["higgsino"]+" && "+terms["bino"]+">"+terms["wino"]+")"
-theconstraints["bino-higgsino mix"] = "(!("+"||".join([theconstraints["pure bino"],theconstraints["pure wino"],theconstraints["pure higgsino"]])+") && "+terms["bino"]+">"+terms["wino"]+" && "+terms["higgsino"]+">"+terms["wino"]+")"
-theconstraints["wino-higgsino mix"] = "(!("+"||".join([theconstraints["pure bino"],theconstraints["pure wino"],theconstraints["pure higgsino"]])+") && "+terms["bino"]+"<"+terms["wino"]+" && "+terms["bino"]+"<"+terms["higgsino"]+")"
-
-zscore = {}
-for key in ['combined',"cms_sus_20_001","cms_sus_21_007","cms_sus_21_006"]:#, 'combined_simplified']:
-    value = theconstraints[key]
-    zscore[key] = "TMath::Abs(TMath::Log(%s))/(TMath::Log(%s)) * TMath::Sqrt(2 * TMath::Abs(TMath::Log(%s)))" % (value,value,value)
-
-# print(zscore)
-# print("-"*50)
-# print(theconstraints["cms_sus_20_001"])
-# print("-"*50)
-# # print(theconstraints["combined_with_cms_sus_20_001"])
-# print("-"*50)
-# print(theconstraints["combined"])
-# print("-"*50)
-
-
-#z-axis colors
-sprobcontours = np.float64([-0.01,1E-5,0.05,0.1,0.15,0.2,0.25,0.3,0.35,0.4,0.45,0.5,0.55,0.6,0.65,0.7,0.75,0.8,0.85,0.9,0.95,1-1E-5,1.01])
-custompalette = []
-cols = TColor.GetNumberOfColors()# This gets the colors of the Palette currently set in ROOT
-#This part sets bins with a survival probability of zero (less than second entry of sprobcontours list to be exact) to Black color. Bins with a survival probability of exactly 1 (greater than second last entry of sprobcontours list) to Grey.
-for i in range(cols):
-    if i<19: # The exact i was found by trial and error. Sorry.
-        col = kBlack
-    elif i > 253:
-        col = kGray
-    else:
-        col = TColor.GetColorPalette(i) # This part keeps the color from the currently set palette
-        
-    custompalette.append(col)
-custompalette = np.intc(custompalette)
-
-#dictionary mapping the z-scores for the different analyses to the tree branches 
-branchnames = {}
-for analysis in ["cms_sus_19_006","cms_sus_21_006","cms_sus_18_004","combined", "combined_simplified","cms_sus_21_006_simplified","cms_sus_21_007","cms_sus_21_007_simplified"]:
-    branchnames[analysis] = {}
-    branchnames[analysis+"_up"] = {}
-    branchnames[analysis+"_down"] = {}
-    #now do the defaults
-    if analysis in ["cms_sus_18_004","cms_sus_21_006"]:
-        branchnames[analysis]["Z"] = "Zsig_"+analysis+"_mu1p0f"
-        branchnames[analysis+"_up"]["Z"] = "Zsig_"+analysis+"_mu1p5f"
-        branchnames[analysis+"_down"]["Z"] = "Zsig_"+analysis+"_mu0p5f"
-    elif analysis == "combined_simplified":
-        branchnames[analysis]["Z"] = "Zsig_"+analysis
-    else:
-        branchnames[analysis]["Z"] = "Zsig_"+analysis.replace("_simplified","")
-        branchnames[analysis+"_up"]["Z"] = "Zsig_"+analysis.replace("_simplified","")+"_15s"
-        branchnames[analysis+"_down"]["Z"] = "Zsig_"+analysis.replace("_simplified","")+"_05s"
-# print(branchnames)
+from utils.constraints import terms, theconstraints, signals, _backgrounds, bfs, signals_simplified, _backgrounds_simplified, vary_signal_strength, zscore, sprobcontours, branchnames, get_constraintstrings, get_required_expressions
+
+_custompalette = None
+
+
+def get_custompalette():
+    """
+    Returns the survival probability palette: the palette currently set in ROOT, with the bins of a survival probability of zero
+    (less than the second entry of sprobcontours to be exact) in black and of exactly 1 (greater than the second last entry) in grey.
+    It is built on first use and not at import, as it needs the ROOT graphics
+    """
+    global _custompalette
+    if _custompalette is None:
+        from ROOT import TColor
+        custompalette = []
+        cols = TColor.GetNumberOfColors()# This gets the colors of the Palette currently set in ROOT
+        for i in range(cols):
+            if i<19: # The exact i was found by trial and error. Sorry.
+                col = kBlack
+            elif i > 253:
+                col = kGray
+            else:
+                col = TColor.GetColorPalette(i) # This part keeps the color from the currently set palette
+            custompalette.append(col)
+        _custompalette = np.intc(custompalette)
+    return _custompalette
+
+
+def __getattr__(name):
+    # keeps "from utils.plots import custompalette" working without building the palette at import
+    if name == "custompalette":
+        return get_custompalette()
+    raise AttributeError("module " + __name__ + " has no attribute " + name)
+
+
+def _quantile_accumulator(variables, edges, value, weight, compression=None, resolution=None):
+    """
+    Exact quantiles of the value per cell if compression and resolution are None, t-digests of that compression, or sparse value histograms of that resolution otherwise
+    """
+    if compression is not None and resolution is not None:
+        raise Exception("Quantiles are either computed from t-digests (compression) or from sparse value histograms (resolution), not both")
+    if resolution is not None:
+        return SparseQuantileAccumulator(variables, edges, value, weight, resolution)
+    if compression is None:
+        return QuantileAccumulator(variables, edges, value, weight)
+    return TDigestAccumulator(variables, edges, value, weight, compression)
 
 
+@instrumented("get_impact_plots", "drawstring", "analysis")
 def get_impact_plots(localtree, analysis, hname, xtitle, xbins, xlow, xup, _logx, drawstring, moreconstraints=[],
-                     moreconstraints_prior=False):
+                     moreconstraints_prior=False, bootstrap=0):
     """
     This creates an impact plot. Returns dictionary with four histograms: the prior, posterior, as well as the +-50% cross section versions of the posterior.
+    With bootstrap replicas, the dictionary also holds the "posterior_band", the central 68% of the normalised posterior in Poisson bootstrap replicas of the points, see utils/bootstrap.py
     @param localtree: Function needs to be passed the ROOT tree from which to operate
     @param analysis: The analysis to use for LHC constraints. Can be any string for which a dictionary entry and corresponding ROOT branch exists in "branchnames". Currently does not allow for arbitrary combinations of analyses
     @param hname: Name of the returned histogram
@@ -137,50 +78,30 @@ def get_impact_plots(localtree, analysis, hname, xtitle, xbins, xlow, xup, _logx
     @param drawstring: Draw string passed to root .Draw() function, of the form Y:X, where Y is drawn on the y-axis and X is drawn on the x-axis. Accepts tree branches and mathematical operations acted on them, such as for example log(Y):10*X.
     @param moreconstraints: list of logical expressions that constrain the tree. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
     @param moreconstraints_prior: list of logical expressions that should apply to the prior. Default is to NOT apply constraints on the prior. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
+    @param bootstrap: number of bootstrap replicas of the posterior uncertainty band, filled in the same pass over the tree. 0 makes no band
     """
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])    
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"], theconstraints["combined_simplified"]])
-    else:
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason"]]) 
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"], theconstraints["combined"]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
-    if moreconstraints_prior:
-        for newc_p in moreconstraints_prior:
-            constraintstring_prior += "*(" + newc_p + ")"
-
-    # get the scales to normalize all histograms to one
-    htest = TH1F("scale", "", 1000, -1000, 1000)
-    # print('constraintstring_prior', constraintstring_prior)    
-    localtree.Draw("PickProbability>>" + htest.GetName(), constraintstring_prior)
-    prior_scalar = 1. / htest.Integral(-1, 9999999)
-    htest.Delete()
-    htest = TH1F("scale", "", 1000, -1000, 1000)
-    # print('constraintstring posterior', constraintstring)
-    localtree.Draw("PickProbability>>" + htest.GetName(),constraintstring)
-    # print("\n\n")
-    posterior_scalar = 1. / htest.Integral(-1, 9999999)
-    htest.Delete()
-    htest = TH1F("scale", "", 1000, -1000, 1000)
-    localtree.Draw("PickProbability>>" + htest.GetName(),constraintstring.replace('mu1p0','mu1p5').replace('_100s','_150s'))#UP
-    posterior_scalar_up = 1. / htest.Integral(-1, 9999999)
-    htest.Delete()
-    htest = TH1F("scale", "", 1000, -1000, 1000)
-    localtree.Draw("PickProbability>>" + htest.GetName(),constraintstring.replace('mu1p0','mu0p5').replace('_100s','_050s'))#Down
-    posterior_scalar_down = 1. / htest.Integral(-1, 9999999)
-    htest.Delete()
+    bayesfactor = theconstraints["combined_simplified"] if "simplified" in analysis else theconstraints["combined"]
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior, bayesfactor)
+
+    constraintstring_up = vary_signal_strength(constraintstring, "up")
+    constraintstring_down = vary_signal_strength(constraintstring, "down")
 
     # debug me!
     maxy = -1
-    prior = mkhistlogx("prior", "", xbins, xlow, xup, logx=_logx)
-    posterior = mkhistlogx(hname, "", xbins, xlow, xup, logx=_logx)  # prior.Clone(hname)
-    posterior_up = mkhistlogx(hname + "_up", "", xbins, xlow, xup, logx=_logx)  # prior.Clone(hname+"_up")
-    posterior_down = mkhistlogx(hname + "_down", "", xbins, xlow, xup, logx=_logx)  # prior.Clone(hname+"_down")
-    localtree.Draw(drawstring + ">>" + prior.GetName(), constraintstring_prior)
-    localtree.Draw(drawstring + ">>" + posterior.GetName(), constraintstring)
-    localtree.Draw(drawstring + ">>" + posterior_up.GetName(), constraintstring.replace('mu1p0','mu1p5').replace('_100s','_150s'))#UP
-    localtree.Draw(drawstring + ">>" + posterior_down.GetName(), constraintstring.replace('mu1p0','mu0p5').replace('_100s','_050s'))#Down
+    # the four histograms share one binning, whose edges are computed once
+    xbinning = binning(xbins, xlow, xup, _logx)
+    prior = mkhist("prior", "", xbinning)
+    posterior = mkhist(hname, "", xbinning)
+    posterior_up = mkhist(hname + "_up", "", xbinning)
+    posterior_down = mkhist(hname + "_down", "", xbinning)
+    # fill all four histograms in one pass over the tree. The summed weights are used to normalize all histograms to one
+    weights = [constraintstring_prior, constraintstring, constraintstring_up, constraintstring_down]
+    if bootstrap:
+        posterior_band = mkhist(hname + "_band", "", xbinning)
+        sums = fill_bands(localtree, drawstring, weights, [prior, posterior, posterior_up, posterior_down], [(posterior_band, 1, None)], replicas=bootstrap)
+    else:
+        sums = fill_histograms(localtree, drawstring, weights, [prior, posterior, posterior_up, posterior_down])
+    prior_scalar, posterior_scalar, posterior_scalar_up, posterior_scalar_down = [1. / s for s in sums]
 
     histoStyler(prior, kBlue - 9, fill=True)
     histoStyler(posterior, kBlack)
@@ -204,13 +125,22 @@ def get_impact_plots(localtree, analysis, hname, xtitle, xbins, xlow, xup, _logx
     posterior_up.GetYaxis().SetTitle("pMSSM density")
     posterior_down.GetYaxis().SetTitle("pMSSM density")
 
-    return {"prior": prior, "posterior": posterior, "posterior_up": posterior_up, "posterior_down": posterior_down}
+    impact_plots = {"prior": prior, "posterior": posterior, "posterior_up": posterior_up, "posterior_down": posterior_down}
+    if bootstrap:
+        histoStyler(posterior_band, kGray + 1, fill=True, fillstyle=1001)
+        posterior_band.SetMarkerSize(0)
+        posterior_band.GetXaxis().SetTitle(xtitle)
+        posterior_band.GetYaxis().SetTitle("pMSSM density")
+        impact_plots["posterior_band"] = posterior_band
+    return impact_plots
 
 
+@instrumented("get_quantile_plot_1D", "drawstring", "analysis")
 def get_quantile_plot_1D(localtree, analysis, hname, xtitle, xbins, xlow, xup, _logx, drawstring, moreconstraints=[],
-                         quantiles=[0.],_logy=False):
+                         quantiles=[0.],_logy=False,compression=None):
     """
-    This creates a 1D survival probability plot. Returns dictionary with N Bayes factor quantile histograms, one for each of the N quantiles given.
+    This creates a 1D Bayes factor quantile plot. Returns dictionary with N Bayes factor quantile histograms, one for each of the N quantiles given.
+    The quantiles are weighted quantiles of the Bayes factors of the points in each x bin, whatever their value, see utils/quantiles.py
     @param localtree: Function needs to be passed the ROOT tree from which to operate
 
     @param analysis: The analysis to use for LHC constraints. Can be any string for which a dictionary entry and corresponding ROOT branch exists in "branchnames". Currently does not allow for arbitrary combinations of analyses
@@ -224,14 +154,10 @@ def get_quantile_plot_1D(localtree, analysis, hname, xtitle, xbins, xlow, xup, _
     @param moreconstraints: list of logical expressions that constrain the tree. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
     @param moreconstraints_prior: list of logical expressions that should apply to the prior. Default is to NOT apply constraints on the prior. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
     @param quantiles: list of quantiles to produce. Also accepts a single integer of float.
+    @param _logy: unused, the Bayes factors are not binned anymore. Kept for compatibility
+    @param compression: None computes exact quantiles, keeping every point in memory. A number instead keeps a t-digest of this compression per bin (see utils/tdigest.py), of bounded memory, with approximate quantiles
     """
-    _drawstring = theconstraints[analysis] + ":" + drawstring
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-    else:
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints)
     _quantiles = []
     if type(quantiles) in [list, tuple]:
         for qt in quantiles:
@@ -254,29 +180,23 @@ def get_quantile_plot_1D(localtree, analysis, hname, xtitle, xbins, xlow, xup, _
     else:
         print("invalid type of quantile given, please provide either an int or float, or a list of ints or floats")
         exit()
-    probs = list(np.array([x]) for x in _quantiles)
-    qs = list(np.array([0.]) for x in _quantiles)
 
+    xbinning = binning(xbins, xlow, xup, _logx)
     hists = {}
-    qhist = mkhistlogxy("qhist", "", xbins, xlow, xup, 3000, 0, 30, logy=_logy, logx=_logx)
-    localtree.Draw(_drawstring + ">>" + qhist.GetName(), constraintstring, "")
-    htemplate = qhist.ProfileX('OF UF')
-    xax = htemplate.GetXaxis()
-    for prob in probs:
-        hists["quantile_" + str(int(100 * prob))] = htemplate.ProjectionX().Clone("quantile_" + str(int(100 * prob)))
-        hists["quantile_" + str(int(100 * prob))].Reset()
-    for ibinx in range(1, xax.GetNbins() + 1):
-        hz = qhist.ProjectionY('hz', ibinx, ibinx)
-        try:
-            hz.Scale(1.0 / hz.Integral(-1, 99999))
-        except:
-            for hname, hist in hists.items():
-                hist.SetBinContent(ibinx, 0)
-            continue
-        quantiles = []
-        for ix, prob in enumerate(probs):
-            quantiles.append(hz.GetQuantiles(1, qs[ix], prob))
-            hists["quantile_" + str(int(100 * prob))].SetBinContent(ibinx, qs[ix][0])
+    for prob in _quantiles:
+        hists["quantile_" + str(int(100 * prob))] = mkhist("quantile_" + str(int(100 * prob)), "", xbinning)
+    def compute():
+        # one pass over the tree collects the Bayes factor and weight of every point, keyed by its x bin. Empty bins get a quantile of 0
+        edges = [xbinning.edges]
+        with stage("fill"):
+            quantile_acc, = accumulate(localtree, [_quantile_accumulator([drawstring], edges, theconstraints[analysis], constraintstring, compression)])
+        with stage("quantiles"):
+            quantiles = np.nan_to_num(quantile_acc.quantiles(_quantiles), nan=0.)
+        for ix, prob in enumerate(_quantiles):
+            hist_array(hists["quantile_" + str(int(100 * prob))])[1:-1] = quantiles[1:-1, ix]
+        return []
+
+    cached_histograms(localtree, ["quantile1D", drawstring, theconstraints[analysis], constraintstring, _quantiles, compression], list(hists.values()), compute)
 
     for histname, hist in hists.items():
         histoStyler(hist)
@@ -287,10 +207,84 @@ def get_quantile_plot_1D(localtree, analysis, hname, xtitle, xbins, xlow, xup, _
     return hists
 
 
+def _style_SP_plots(posterior, posterior_up, posterior_down, xtitle, posterior_band=None):
+    """
+    Styles the survival probability histograms of a 1D survival probability plot and returns them as the dictionary of get_SP_plot_1D
+    """
+    histoStyler(posterior, kBlack)
+    histoStyler(posterior_up, kMagenta, linestyle=kDashed)
+    histoStyler(posterior_down, kRed, linestyle=kDashed)
+
+    maxy = max([posterior.GetMaximum(), posterior_up.GetMaximum(), posterior_down.GetMaximum()])
+    posterior.GetYaxis().SetRangeUser(0, maxy + 0.1)
+    posterior.GetXaxis().SetTitle(xtitle)
+    posterior_up.GetYaxis().SetRangeUser(0, maxy + 0.1)
+    posterior_up.GetXaxis().SetTitle(xtitle)
+    posterior_down.GetYaxis().SetRangeUser(0, maxy + 0.1)
+    posterior_down.GetXaxis().SetTitle(xtitle)
+    posterior.GetYaxis().SetTitle("survival probability")
+    sp_plots = {"posterior": posterior, "posterior_up": posterior_up, "posterior_down": posterior_down}
+    if posterior_band is not None:
+        histoStyler(posterior_band, kGray + 1, fill=True, fillstyle=1001)
+        posterior_band.SetMarkerSize(0)
+        posterior_band.GetYaxis().SetRangeUser(0, maxy + 0.1)
+        posterior_band.GetXaxis().SetTitle(xtitle)
+        posterior_band.GetYaxis().SetTitle("survival probability")
+        sp_plots["posterior_band"] = posterior_band
+    return sp_plots
+
+
+@instrumented("get_SP_plots_1D", "drawstrings", "analysis")
+def get_SP_plots_1D(localtree, analysis, hnames, xtitles, xbins, xlows, xups, _logxs, drawstrings, moreconstraints=[],
+                    moreconstraints_prior=False):
+    """
+    This creates the 1D survival probability plots of several x variables from a single pass over the tree. Returns a list with one dictionary per drawstring, in the same order,
+    each as returned by get_SP_plot_1D. The Bayes factors of the nominal and the +-50% signal cross sections are read once per point and their z-scores are computed once,
+    for all variables together, see utils/survival.py
+    @param localtree: Function needs to be passed the ROOT tree from which to operate
+    @param analysis: The analysis to use for LHC constraints. Can be any string for which a dictionary entry exists in the zscore dictionary. Currently does not allow for arbitrary combinations of analyses
+    @param hnames: list of the names of the returned histograms, one per drawstring
+    @param xtitles: list of the x-axis labels, one per drawstring
+    @param xbins: list of the numbers of x-axis bins, one per drawstring
+    @param xlows: list of the lower edges of zero'th bin, one per drawstring
+    @param xups: list of the upper edges of the last bin, one per drawstring
+    @param _logxs: list of flags setting the x-axis to logarithmic (base 10), one per drawstring. If you use this, use linear X in drawstring, not log(X)
+    @param drawstrings: list of the expressions drawn on the x-axis, e.g. tree branches or mathematical operations acted on them
+    @param moreconstraints: list of logical expressions that constrain the tree. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
+    @param moreconstraints_prior: list of logical expressions that should apply to the prior. Default is to NOT apply constraints on the prior. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
+    """
+    if analysis not in zscore:
+        raise Exception("No z-score known for analysis " + str(analysis) + ", possible analyses are " + ", ".join(zscore))
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+    bayesfactors = [vary_signal_strength(theconstraints[analysis], variation) for variation in ["", "up", "down"]]
+
+    xbinnings = [binning(*args) for args in zip(xbins, xlows, xups, _logxs)]
+    priors = [mkhist(hname + "_prior", "", xbinning) for hname, xbinning in zip(hnames, xbinnings)]
+    posteriors = [[mkhist(hname + suffix, "", xbinning) for suffix in ["", "_up", "_down"]] for hname, xbinning in zip(hnames, xbinnings)]
+    def compute():
+        with stage("fill"):
+            survival_acc, = accumulate(localtree, [SurvivalAccumulator(drawstrings, [xbinning.edges for xbinning in xbinnings], constraintstring_prior, constraintstring, bayesfactors)])
+        for index, (prior, hists) in enumerate(zip(priors, posteriors)):
+            survival_acc.fill_hists(index, [prior] + hists)
+        return []
+
+    cached_histograms(localtree, ["survival1D", drawstrings, constraintstring_prior, constraintstring, bayesfactors], priors + [hist for hists in posteriors for hist in hists], compute)
+    sp_plots = []
+    for xtitle, prior, (posterior, posterior_up, posterior_down) in zip(xtitles, priors, posteriors):
+        posterior.Divide(prior)
+        posterior_up.Divide(prior)
+        posterior_down.Divide(prior)
+        sp_plots.append(_style_SP_plots(posterior, posterior_up, posterior_down, xtitle))
+    return sp_plots
+
+
+@instrumented("get_SP_plot_1D", "drawstring", "analysis")
 def get_SP_plot_1D(localtree, analysis, hname, xtitle, xbins, xlow, xup, _logx, drawstring, moreconstraints=[],
-                   moreconstraints_prior=False):
+                   moreconstraints_prior=False, bootstrap=0):
     """
     This creates a 1D survival probability plot. Returns dictionary with three survival probability histograms, assuming the nominal signal cross sections, as well as the +-50% signal cross sections.
+    With bootstrap replicas, the dictionary also holds the "posterior_band", the central 68% of the nominal survival probability in Poisson bootstrap replicas of the points, see utils/bootstrap.py.
+    Without, this is get_SP_plots_1D for a single drawstring
     @param localtree: Function needs to be passed the ROOT tree from which to operate
     @param analysis: The analysis to use for LHC constraints. Can be any string for which a dictionary entry and corresponding ROOT branch exists in "branchnames". Currently does not allow for arbitrary combinations of analyses
     @param hname: Name of the returned histogram
@@ -302,55 +296,30 @@ def get_SP_plot_1D(localtree, analysis, hname, xtitle, xbins, xlow, xup, _logx,
     @param drawstring: Draw string passed to root .Draw() function, of the form Y:X, where Y is drawn on the y-axis and X is drawn on the x-axis. Accepts tree branches and mathematical operations acted on them, such as for example log(Y):10*X.
     @param moreconstraints: list of logical expressions that constrain the tree. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
     @param moreconstraints_prior: list of logical expressions that should apply to the prior. Default is to NOT apply constraints on the prior. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
+    @param bootstrap: number of bootstrap replicas of the survival probability uncertainty band, filled in the same pass over the tree. 0 makes no band
     """
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-    else:
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
-    if moreconstraints_prior:
-        for newc_p in moreconstraints_prior:
-            constraintstring_prior += "*(" + newc_p + ")"
-
-    maxy = -1
-    prior = mkhistlogx("prior", "", xbins, xlow, xup, logx=_logx)
-    posterior = mkhistlogx(hname, "", xbins, xlow, xup, logx=_logx)
-    posterior_up = mkhistlogx(hname + "_up", "", xbins, xlow, xup, logx=_logx)
-    posterior_down = mkhistlogx(hname + "_down", "", xbins, xlow, xup, logx=_logx)
-
-    localtree.Draw(drawstring + ">>" + prior.GetName(), constraintstring_prior, "")
-    # print('constraint denominator', constraintstring)
-    z = zscore[analysis]    
-    # print('constraint numerator',  "*".join([constraintstring, "(" + z + ">-1.64)"]))    
-    localtree.Draw(drawstring + ">>" + posterior.GetName(),
-                   "*".join([constraintstring, "(" + z + ">-1.64)"]), "")
-    z = zscore[analysis].replace('mu1p0','mu1p5').replace('_100s','_150s')
-    localtree.Draw(drawstring + ">>" + posterior_up.GetName(),
-                   "*".join([constraintstring, "(" + z + ">-1.64)"]), "")#Up
-    z = zscore[analysis].replace('mu1p0','mu0p5').replace('_100s','_050s')
-    localtree.Draw(drawstring + ">>" + posterior_down.GetName(),
-                   "*".join([constraintstring, "(" + z + ">-1.64)"]), "")#Down
-    histoStyler(posterior, kBlack)
-    histoStyler(posterior_up, kMagenta, linestyle=kDashed)
-    histoStyler(posterior_down, kRed, linestyle=kDashed)
+    if not bootstrap:
+        return get_SP_plots_1D(localtree, analysis, [hname], [xtitle], [xbins], [xlow], [xup], [_logx], [drawstring], moreconstraints, moreconstraints_prior)[0]
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+
+    xbinning = binning(xbins, xlow, xup, _logx)
+    prior = mkhist("prior", "", xbinning)
+    posterior = mkhist(hname, "", xbinning)
+    posterior_up = mkhist(hname + "_up", "", xbinning)
+    posterior_down = mkhist(hname + "_down", "", xbinning)
+    posterior_band = mkhist(hname + "_band", "", xbinning)
+
+    # the prior and the surviving points for the nominal, +50% and -50% signal cross sections, in one pass over the tree.
+    # The prior and the surviving points of a replica are weighted with the same multiplicities, so the band is that of the ratio
+    survived = ["*".join([constraintstring, "(" + vary_signal_strength(zscore[analysis], variation) + ">-1.64)"]) for variation in ["", "up", "down"]]
+    fill_bands(localtree, drawstring, [constraintstring_prior] + survived, [prior, posterior, posterior_up, posterior_down], [(posterior_band, 1, 0)], replicas=bootstrap)
     posterior.Divide(prior)
     posterior_up.Divide(prior)
     posterior_down.Divide(prior)
-
-    maxy = max([posterior.GetMaximum(), posterior_up.GetMaximum(), posterior_down.GetMaximum()])
-    posterior.GetYaxis().SetRangeUser(0, maxy + 0.1)
-    posterior.GetXaxis().SetTitle(xtitle)
-    posterior_up.GetYaxis().SetRangeUser(0, maxy + 0.1)
-    posterior_up.GetXaxis().SetTitle(xtitle)
-    posterior_down.GetYaxis().SetRangeUser(0, maxy + 0.1)
-    posterior_down.GetXaxis().SetTitle(xtitle)
-    posterior.GetYaxis().SetTitle("survival probability")
-    return {"posterior": posterior, "posterior_up": posterior_up, "posterior_down": posterior_down}
+    return _style_SP_plots(posterior, posterior_up, posterior_down, xtitle, posterior_band)
 
 
+@instrumented("get_SP_plot_2D", "drawstring", "analysis")
 def get_SP_plot_2D(localtree, analysis, hname, xtitle, xbins, xlow, xup, ytitle, ybins, ylow, yup, _logx, _logy,
                    drawstring, moreconstraints=[], moreconstraints_prior=False):
     """
@@ -376,33 +345,15 @@ def get_SP_plot_2D(localtree, analysis, hname, xtitle, xbins, xlow, xup, ytitle,
     hret = hdenom.Clone(
         hname)  # this makes sure that the denominator and the numerator histograms are identically set up
     hret.SetContour(len(sprobcontours) - 1, sprobcontours)  # this defines the z-axis color palette and tick length
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-    else:
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
-    if moreconstraints_prior:
-        for newc_p in moreconstraints_prior:
-            constraintstring_prior += "*(" + newc_p + ")"
-
-    localtree.Draw(drawstring + ">>" + hdenom.GetName(), constraintstring_prior, "colz")
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+
     z = zscore[analysis]
-    localtree.Draw(drawstring + ">>" + hret.GetName(), "*".join([constraintstring, "(" + z + ">-1.64)"]), "colz")
+    fill_histograms(localtree, drawstring, [constraintstring_prior, "*".join([constraintstring, "(" + z + ">-1.64)"])], [hdenom, hret])
     hret.GetZaxis().SetRangeUser(-0.001, 1)
     cutoff = 1E-3
     hret.GetZaxis().SetTitle("survival probability")
     hret.Divide(hdenom)
-    for i in range(1, hret.GetNbinsX() + 1):
-        for j in range(1, hret.GetNbinsY() + 1):
-            if hret.GetBinContent(i, j) == 0 and hdenom.GetBinContent(i, j) > 0:
-                hret.SetBinContent(i, j, 0)
-            elif hret.GetBinContent(i, j) == 0 and hdenom.GetBinContent(i, j) == 0:
-                hret.SetBinContent(i, j, -1)
-            elif hret.GetBinContent(i, j) < cutoff and hdenom.GetBinContent(i, j) > 0:
-                hret.SetBinContent(i, j, cutoff)
+    apply_survival_sentinels(hret, hdenom, cutoff)
 
 
     # always run gStyle.SetPalette(len(custompalette),custompalette) when drawing SP, otherwise gStyle.SetPalette(kBird) or other preferred Palette
@@ -416,14 +367,16 @@ def get_SP_plot_2D(localtree, analysis, hname, xtitle, xbins, xlow, xup, ytitle,
     return hret
 
 
-def get_quantile_plot_2D(localtree, quantile, analysis, hname, xtitle, xbins, xlow, xup, ytitle, ybins, ylow, yup,
-                         _logx, _logy, drawstring, moreconstraints=[], moreconstraints_prior=False):
+@instrumented("get_quantile_plots_2D", "drawstring", "analysis", "quantiles")
+def get_quantile_plots_2D(localtree, quantiles, analysis, hnames, xtitle, xbins, xlow, xup, ytitle, ybins, ylow, yup,
+                          _logx, _logy, drawstring, moreconstraints=[], moreconstraints_prior=False, compression=None, resolution=None):
     """
-    This creates a Bayes factor quantile plot
+    This creates Bayes factor quantile plots for several quantiles at once, from a single pass over the tree. Returns a list with one histogram per quantile, in the same order.
+    The quantiles are exact weighted quantiles of the Bayes factors of the points in each (x,y) bin, see utils/quantiles.py, or approximate ones from a t-digest per bin if compression is given
     @param localtree: Function needs to be passed the ROOT tree from which to operate
-    @param quantile: The quantile of the Bayes factor to use
+    @param quantiles: list of the quantiles of the Bayes factor to use
     @param analysis: The analysis to use for LHC constraints. Can be any string for which a dictionary entry exists in theconstraints dictionary. Currently does not allow for arbitrary combinations of analyses
-    @param hname: Name of the returned histogram
+    @param hnames: list of the names of the returned histograms, one per quantile
     @param xtitle: x-axis label
     @param xbins: number of x-axis bins
     @param xlow: lower edge of zero'th bin
@@ -437,111 +390,122 @@ def get_quantile_plot_2D(localtree, quantile, analysis, hname, xtitle, xbins, xl
     @param drawstring: Draw string passed to root .Draw() function, of the form Y:X, where Y is drawn on the y-axis and X is drawn on the x-axis. Accepts tree branches and mathematical operations acted on them, such as for example log(Y):10*X.
     @param moreconstraints: list of logical expressions that constrain the tree. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
     @param moreconstraints_prior: list of logical expressions that should apply to the prior. Default is to NOT apply constraints on the prior. Can use tree branches and mathematical operations. Each constrain in the list is logically multiplied
+    @param compression: None computes exact quantiles, keeping every point in memory. A number instead keeps a t-digest of this compression per bin (see utils/tdigest.py), of bounded memory
+    @param resolution: a number keeps, for the occupied (x,y) bins only, a histogram of the Bayes factor with this many bins per decade (see utils/sparsequantiles.py).
+    Its memory grows with the occupied bins, not with the points or the size of the grid, so fine grids stay small
     """
 
     # quantile is percentile/100
-    if quantile > 1:
-        _quantile = quantile / 100.
-    elif quantile > 0:
-        _quantile = quantile
-    else:
-        print("Invalid quantile provided, please use positive values")
-        exit()
-
-    _drawstring = theconstraints[analysis] + ":" + drawstring
-    prob = np.array([quantile])
-    q = np.array([0.])
-    htemp = mkhistlogxyz("htemp", '', xbins, xlow, xup, ybins, ylow, yup, 3000, 0, 30, logx=_logx, logy=_logy,
-                         logz=False)
+    _quantiles = []
+    for quantile in quantiles:
+        if quantile > 1:
+            _quantiles.append(quantile / 100.)
+        elif quantile > 0:
+            _quantiles.append(quantile)
+        else:
+            print("Invalid quantile provided, please use positive values")
+            exit()
 
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-    else:
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-        constraintstring_prior = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
-    if moreconstraints_prior:
-        for newc_p in moreconstraints_prior:
-            constraintstring_prior += "*(" + newc_p + ")"
-
-    prior = mkhistlogxy("prior", '', xbins, xlow, xup, ybins, ylow, yup, logx=_logx, logy=_logy)
-    localtree.Draw(drawstring + ">>" + prior.GetName(), constraintstring_prior, "")
-    localtree.Draw(_drawstring + ">>" + htemp.GetName(), constraintstring, "")
-
-    # create hist, fill it?
-    htemplate = htemp.Project3DProfile('yx UF OF')
-    xax, yax = htemplate.GetXaxis(), htemplate.GetYaxis()
-    returnhist = htemplate.ProjectionXY().Clone(hname)
-    returnhist.Reset()
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, moreconstraints_prior)
+
+    xbinning, ybinning = binning(xbins, xlow, xup, _logx), binning(ybins, ylow, yup, _logy)
+    prior = mkhist("prior", '', xbinning, ybinning)
+    returnhists = [mkhist(hname, '', xbinning, ybinning) for hname in hnames]
+    def compute():
+        # one pass over the tree fills the prior and collects the Bayes factor and weight of every point, keyed by its (x,y) cell. All quantiles are read from the same points
+        yexpr, xexpr = split_drawstring(drawstring)
+        edges = [xbinning.edges, ybinning.edges]
+        with stage("fill"):
+            prior_acc, quantile_acc = accumulate(localtree, [HistogramAccumulator([xexpr, yexpr], edges, constraintstring_prior),
+                                                             _quantile_accumulator([xexpr, yexpr], edges, theconstraints[analysis], constraintstring, compression, resolution)])
+            prior_acc.fill_hist(prior)
+        with stage("quantiles"):
+            quantiles = np.nan_to_num(quantile_acc.quantiles(_quantiles), nan=0.)  # cells without any point
+        for ix, returnhist in enumerate(returnhists):
+            hist_array(returnhist)[1:-1, 1:-1] = quantiles[:, ix].reshape(quantile_acc.shape)[1:-1, 1:-1]
+        return []
+
+    cached_histograms(localtree, ["quantile2D", drawstring, theconstraints[analysis], constraintstring_prior, constraintstring, _quantiles, compression] + ([resolution] if resolution is not None else []),
+                      [prior] + returnhists, compute)
     cutoff = 1E-3
+    for quantile, returnhist in zip(quantiles, returnhists):
+        zaxis_max = apply_survival_sentinels(returnhist, prior, cutoff)
+        returnhist.GetZaxis().SetRangeUser(-0.001, max(1, zaxis_max + 0.1))
+        # gStyle.SetNumberContours(999)
+        returnhist.SetTitle("")
+        returnhist.GetXaxis().SetTitle(xtitle)
+        returnhist.GetYaxis().SetTitle(ytitle)
+        returnhist.GetZaxis().SetTitle(str(int(100 * quantile)) + "th percentile Bayes factor")
+        # histoStyler(returnhist)
+    return returnhists
 
-    for ibinx in range(1, xax.GetNbins() + 1):
-        for ibiny in range(1, yax.GetNbins() + 1):
-            hz = htemp.ProjectionZ('hz', ibinx, ibinx, ibiny, ibiny)
-            try:
-                hz.Scale(1.0 / hz.Integral())
-            except:
-                returnhist.SetBinContent(ibinx, ibiny, 0)
-                continue
-            quant = hz.GetQuantiles(1, q, prob)
-            returnhist.SetBinContent(ibinx, ibiny, q[0])
-    zaxis_max = -1
-    for i in range(1, returnhist.GetNbinsX() + 1):
-        for j in range(1, returnhist.GetNbinsY() + 1):
-            if returnhist.GetBinContent(i, j) == 0 and prior.GetBinContent(i, j) > 0:
-                returnhist.SetBinContent(i, j, 0)
-            elif returnhist.GetBinContent(i, j) == 0 and prior.GetBinContent(i, j) == 0:
-                returnhist.SetBinContent(i, j, -1)
-            elif returnhist.GetBinContent(i, j) < cutoff and prior.GetBinContent(i, j) > 0:
-                returnhist.SetBinContent(i, j, cutoff)
-            zaxis_max = max(zaxis_max, returnhist.GetBinContent(i, j))
-    returnhist.GetZaxis().SetRangeUser(-0.001, max(1, zaxis_max + 0.1))
-    # gStyle.SetNumberContours(999)
-    returnhist.SetTitle("")
-    returnhist.GetXaxis().SetTitle(xtitle)
-    returnhist.GetYaxis().SetTitle(ytitle)
-    returnhist.GetZaxis().SetTitle(str(int(100 * quantile)) + "th percentile Bayes factor")
-    # histoStyler(returnhist)
-    return returnhist
+
+def get_quantile_plot_2D(localtree, quantile, analysis, hname, xtitle, xbins, xlow, xup, ytitle, ybins, ylow, yup,
+                         _logx, _logy, drawstring, moreconstraints=[], moreconstraints_prior=False, compression=None, resolution=None):
+    """
+    This creates a Bayes factor quantile plot for a single quantile, see get_quantile_plots_2D for the parameters
+    @param quantile: The quantile of the Bayes factor to use
+    @param hname: Name of the returned histogram
+    """
+    return get_quantile_plots_2D(localtree, [quantile], analysis, [hname], xtitle, xbins, xlow, xup, ytitle, ybins, ylow, yup,
+                                 _logx, _logy, drawstring, moreconstraints, moreconstraints_prior, compression, resolution)[0]
 
 
 def getThresholdForContainment(hist, intervals):
     """
-    Returns the thresholds for the given credibility intervals
+    Returns the thresholds for the given credibility intervals, sorted from low to high, see utils/credible.py
     @param hist: Histogram from which to generate the thresholds
     @param intervals: list of credibility intervals for which to generate the thresholds
     """
-    # interval needs to be sorted from low to high
-    contents = []
-    thresholds = []  # returned thresholds corresponding to asked containment intervals
-    total = 0
-    # sort the bin contentss in descending order
-    for xbin in range(hist.GetNbinsX() + 1):
-        for ybin in range(hist.GetNbinsY() + 1):
-            val = hist.GetBinContent(xbin, ybin)
-            if val >= 0:
-                contents.append(val)
-                total += val
-    contents.sort(reverse=True)
-
-    threshold = 0
-    intervalix = 0
-    for ix, val in enumerate(contents):
-        threshold += val
-        if threshold >= intervals[intervalix] * total:
-            thresholds.append(val)
-            intervalix += 1
-            if intervalix == len(intervals):
-                break
-    thresholds.sort()
-    return thresholds
+    return list(containment_thresholds(hist_array(hist)[1:-1, 1:-1], intervals))
+
+
+def get_credible_regions(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring, intervals):
+    """
+    Fills the density of drawstring weighted with constraintstring once, and returns the contours of its highest density credible regions as point lists,
+    a dictionary mapping every interval to a list of (x, y) arrays, see utils/credible.py. Nothing is drawn, so this needs no pad, runs in processes
+    without graphics and its result can be sent back from worker processes. contour_graphs makes the TGraphs when they are drawn. The parameters are those of get_prior_CI
+    """
+    xbinning, ybinning = binning(xbins, xlow, xup, _logx), binning(ybins, ylow, yup, _logy)
+    density = mkhist(hname, '', xbinning, ybinning)
+    fill_histograms(localtree, drawstring, [constraintstring], [density])
+    with stage("contours"):
+        return credible_contours(hist_array(density)[1:-1, 1:-1], xbinning.centres(), ybinning.centres(), intervals)
+
+
+def contour_graphs(regions, contourcolors, contourstyle, xscale=1.0, yscale=1.0):
+    """
+    Returns the TGraphs of the point lists of get_credible_regions, with the same keys. The colors and styles are taken in the order of the keys, i.e. from the largest region on
+    @param xscale: the x of the points are divided by xscale, e.g. 1000 to draw GeV in TeV
+    @param yscale: the y of the points are divided by yscale
+    """
+    from ROOT import TGraph
+    the_contours = {}
+    for ix, interval in enumerate(regions):
+        the_contours[interval] = []
+        for x, y in regions[interval]:
+            cont = TGraph(len(x), np.ascontiguousarray(x / xscale), np.ascontiguousarray(y / yscale))
+            cont.SetLineColor(contourcolors[ix])
+            cont.SetMarkerColor(contourcolors[ix])
+            cont.SetLineStyle(contourstyle[ix])
+            cont.SetLineWidth(3)
+            the_contours[interval].append(cont)
+    return the_contours
+
+
+def get_credible_contours(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring,
+                          intervals, contourcolors, contourstyle):
+    """
+    get_credible_regions as a dictionary mapping every interval to a list of TGraphs
+    """
+    regions = get_credible_regions(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring, intervals)
+    return contour_graphs(regions, contourcolors, contourstyle)
 
 
+@instrumented("get_prior_CI", "drawstring")
 def get_prior_CI(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, moreconstraints=[],
                  intervals=[0.1, 0.67, 0.95], contourcolors=[kRed, kRed + 2, kMagenta],
-                 contourstyle=[kSolid, kSolid, kSolid]):
+                 contourstyle=[kSolid, kSolid, kSolid], graphs=True):
     """
     Produce credibility intervals for the prior, defined here as the smallest number of bins that contain X% of the prior density.
     Returns the contours for the given intervals
@@ -560,42 +524,21 @@ def get_prior_CI(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _l
     @param intervals: List of X% prior credibility intervals to produce if possible
     @param contourcolors: Specifies the colors for the contours. Must be a list of the same length as the intervals.
     @param contourstyle: Specifies the line style for the contours. Must be a list of the same length as the intervals.
+    @param graphs: if False, the contours are returned as point lists instead of TGraphs (see get_credible_regions), which can be computed in worker processes and drawn later with contour_graphs
     
     """
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason_simplified"]])
-    else:
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
-
-    contours = mkhistlogxy(hname, '', xbins, xlow, xup, ybins, ylow, yup, logx=_logx, logy=_logy)
-    localtree.Draw(drawstring + ">>" + contours.GetName(), constraintstring, "cont2")
-    contarrays = np.array(getThresholdForContainment(contours, intervals))
-    # redraw the histogram with cont list option
-    localtree.Draw(drawstring + ">>" + contours.GetName(), constraintstring, "cont list")
-    # optionally smooth the histogram, as the exact boundary is not important and this makes the intervals look nicer
-    contours.Smooth()
-    contours.SetContour(len(contarrays),
-                        contarrays)  # this produces the contours for the thresholds given in contarrays
-    the_contours = {}
-    gPad.Update()
-    conts = gROOT.GetListOfSpecials().FindObject("contours")
-    for ix, contlist in enumerate(conts):
-        the_contours[intervals[len(intervals) - ix - 1]] = []
-        for cont in contlist:
-            if cont.GetN() < 5: continue  # optionally only consider contours that are somewhat large
-            cont.SetLineColor(contourcolors[ix])
-            cont.SetMarkerColor(contourcolors[ix])
-            cont.SetLineStyle(contourstyle[ix])
-            cont.SetLineWidth(3)
-            the_contours[intervals[len(intervals) - ix - 1]].append(cont.Clone())
-    return the_contours
+    # reweighting is always done, in addition to removing unreasonable points
+    constraintstring_prior, constraintstring = get_constraintstrings("", moreconstraints)
+    if not graphs:
+        return get_credible_regions(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring, intervals)
+    return get_credible_contours(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring,
+                                 intervals, contourcolors, contourstyle)
 
 
+@instrumented("get_posterior_CI", "drawstring", "analysis")
 def get_posterior_CI(localtree, analysis, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring,
                      moreconstraints=[], intervals=[0.1, 0.67, 0.95], contourcolors=[kRed, kRed + 2, kMagenta],
-                     contourstyle=[kDashed, kDashed, kDashed]):
+                     contourstyle=[kDashed, kDashed, kDashed], graphs=True):
     """
     Produce credibility intervals for the prior, defined here as the smallest number of bins that contain X% of the prior density.
     Returns the contours for the given intervals
@@ -615,35 +558,12 @@ def get_posterior_CI(localtree, analysis, hname, xbins, xlow, xup, ybins, ylow,
     @param intervals: List of X% prior credibility intervals to produce if possible
     @param contourcolors: Specifies the colors for the contours. Must be a list of the same length as the intervals.
     @param contourstyle: Specifies the line style for the contours. Must be a list of the same length as the intervals.
+    @param graphs: if False, the contours are returned as point lists instead of TGraphs (see get_credible_regions), which can be computed in worker processes and drawn later with contour_graphs
     
     """
-    if "simplified" in analysis:  # reweighting is always done, in addition to removing unreasonable points
-        constraintstring = "*".join(
-            [theconstraints["reweight"], theconstraints["reason_simplified"], theconstraints[analysis]])
-    else:
-        constraintstring = "*".join([theconstraints["reweight"], theconstraints["reason"], theconstraints[analysis]])
-    for newc in moreconstraints:
-        constraintstring += "*(" + newc + ")"
-
-    contours = mkhistlogxy(hname, '', xbins, xlow, xup, ybins, ylow, yup, logx=_logx, logy=_logy)
-    localtree.Draw(drawstring + ">>" + contours.GetName(), constraintstring, "cont2")
-    contarrays = np.array(getThresholdForContainment(contours, intervals))
-    # redraw the histogram with cont list option
-    localtree.Draw(drawstring + ">>" + contours.GetName(), constraintstring, "cont list")
-    # optionally smooth the histogram, as the exact boundary is not important and this makes the intervals look nicer
-    contours.Smooth()
-    contours.SetContour(len(contarrays),
-                        contarrays)  # this produces the contours for the thresholds given in contarrays
-    the_contours = {}
-    gPad.Update()
-    conts = gROOT.GetListOfSpecials().FindObject("contours")
-    for ix, contlist in enumerate(conts):
-        the_contours[intervals[len(intervals) - ix - 1]] = []
-        for cont in contlist:
-            if cont.GetN() < 5: continue  # optionally only consider contours that are somewhat large
-            cont.SetLineColor(contourcolors[ix])
-            cont.SetMarkerColor(contourcolors[ix])
-            cont.SetLineStyle(contourstyle[ix])
-            cont.SetLineWidth(3)
-            the_contours[intervals[len(intervals) - ix - 1]].append(cont.Clone())
-    return the_contours
+    # reweighting is always done, in addition to removing unreasonable points
+    constraintstring_prior, constraintstring = get_constraintstrings(analysis, moreconstraints, bayesfactor=theconstraints[analysis])
+    if not graphs:
+        return get_credible_regions(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring, intervals)
+    return get_credible_contours(localtree, hname, xbins, xlow, xup, ybins, ylow, yup, _logx, _logy, drawstring, constraintstring,
+                                 intervals, contourcolors, contourstyle)
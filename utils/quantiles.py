@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def normalised_weights(cells, weights):
+    """
+    Weights of points sorted by cell, divided by the total weight of their cell. A cumulative sum of the raw weights over all cells loses the precision of the cells that follow a cell of large weight,
+    e.g. with 1/PickProbability weights that differ by many orders of magnitude between cells. The cumulative sum of the normalised weights grows by 1 per cell, so every cell keeps its precision
+    @param cells: cell index of every point, sorted, not empty
+    @param weights: positive weight of every point
+    """
+    first = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    totals = np.add.reduceat(weights, first)
+    return weights / np.repeat(totals, np.diff(np.r_[first, len(cells)]))
+
+
+def weighted_quantiles(cells, values, weights, ncells, probs):
+    """
+    Exact weighted quantiles of the values in every cell, for all requested quantiles at once. The points are sorted once by (cell, value), after which every quantile of every cell is a binary search in the cumulative weights.
+    The q-quantile of a cell is the smallest value in the cell whose cumulative weight reaches q times the total weight of the cell. Values are not binned, so there is neither a quantisation nor a range outside of which values are lost.
+    Returns an array of shape (ncells, len(probs)). Cells without any weight are NaN
+    @param cells: integer cell index of every point, between 0 and ncells-1
+    @param values: value of every point, e.g. the Bayes factor
+    @param weights: weight of every point. Points with zero weight are ignored, like entries failing the selection of TTree::Draw
+    @param ncells: total number of cells
+    @param probs: list of quantiles, between 0 and 1
+    """
+    cells, values, weights = np.asarray(cells), np.asarray(values, dtype=np.float64), np.asarray(weights, dtype=np.float64)
+    selected = weights > 0
+    cells, values, weights = cells[selected], values[selected], weights[selected]
+    if len(weights) == 0:
+        return np.full((ncells, len(probs)), np.nan)  # e.g. constraints that select no point
+    order = np.lexsort((values, cells))
+    cells, values, weights = cells[order], values[order], weights[order]
+
+    cumweights = np.cumsum(normalised_weights(cells, weights))
+    starts = np.searchsorted(cells, np.arange(ncells), side="left")
+    ends = np.searchsorted(cells, np.arange(ncells), side="right")
+    filled = ends > starts
+    before = np.where(starts > 0, cumweights[np.maximum(starts - 1, 0)], 0.)
+    total = np.where(filled, cumweights[np.maximum(ends - 1, 0)] - before, 0.)
+
+    result = np.full((ncells, len(probs)), np.nan)
+    for ix, prob in enumerate(probs):
+        index = np.searchsorted(cumweights, before + prob * total, side="left")
+        index = np.clip(index, starts, np.maximum(ends - 1, starts))  # guards against rounding in the cumulative sum
+        result[filled, ix] = values[index[filled]]
+    return result
@@ -0,0 +1,124 @@
+import os
+import glob
+import json
+import hashlib
+import contextlib
+import numpy as np
+
+# bump when the layout of the stored results changes, so that old entries are not read anymore
+version = 3  # 2: divisions by 0 and logarithms evaluated as by TTreeFormula, see utils/expressions.py. 3: z-score 0 for a Bayes factor of 1 in utils/survival.py
+
+
+def file_identity(path):
+    """
+    Identifies the content of a file by its absolute path, modification time and size. Returns None for files that are not on the local disk, which are then never cached
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"path": os.path.abspath(path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def source_identity(localtree):
+    """
+    Identifies the data a tree, ColumnStore or ChunkedSource reads: its files with their modification times, the tree name and the friend trees.
+    Returns None if the data can not be identified, e.g. for trees that only live in memory
+    """
+    if hasattr(localtree, "identity"):
+        return localtree.identity()
+    if localtree.InheritsFrom("TChain"):
+        paths = [element.GetTitle() for element in localtree.GetListOfFiles()]
+    elif localtree.GetCurrentFile():
+        paths = [localtree.GetCurrentFile().GetName()]
+    else:
+        return None
+    identity = {"tree": localtree.GetName(), "entries": int(localtree.GetEntries()), "files": [file_identity(path) for path in paths], "friends": []}
+    for friend in (localtree.GetListOfFriends() or []):
+        identity["friends"].append(source_identity(friend.GetTree()))
+    if None in identity["files"] or None in identity["friends"]:
+        return None
+    return identity
+
+
+def chain_identity(files, treename, friendAnalysis=[]):
+    """
+    source_identity of a chain of files, as opened by ChunkedSource, without opening them
+    """
+    def paths(patterns):
+        return [file_identity(path) for pattern in patterns for path in sorted(glob.glob(pattern))]
+    identity = {"tree": treename, "files": paths(files),
+                "friends": [{"tree": friend["treeName"], "files": paths(friend.get("paths", [friend.get("path")]))} for friend in friendAnalysis]}
+    if not identity["files"] or None in identity["files"] or any(None in friend["files"] for friend in identity["friends"]):
+        return None
+    return identity
+
+
+class ResultCache:
+    """
+    Persistent cache of computed results (histogram contents, quantile maps, summed weights), addressed by a hash of everything they were computed from:
+    the identity of the tree files, the draw string, the binning and the constraint strings. Nothing is ever invalidated, a changed input simply gives a new key.
+    Entries are .npz files, written under a temporary name and renamed, so parallel processes can share a cache directory
+    """
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        os.makedirs(cachedir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        Hash of a list of JSON serialisable parts. Numpy arrays, such as bin edges, are converted to lists
+        """
+        text = json.dumps([version] + list(parts), sort_keys=True, default=lambda o: o.tolist() if isinstance(o, np.ndarray) else str(o))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + ".npz")
+
+    def load(self, key):
+        """
+        Returns the dictionary of arrays stored under key, or None
+        """
+        try:
+            with np.load(self.path(key)) as stored:
+                return {name: stored[name] for name in stored.files}
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, arrays):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmppath = path + "." + str(os.getpid()) + ".tmp.npz"
+        np.savez(tmppath, **arrays)
+        os.replace(tmppath, path)
+
+
+# the cache used by the histogram builders, see set_result_cache. None disables caching
+_cache = None
+
+
+def set_result_cache(cachedir):
+    """
+    Makes the builders in utils/plots.py store their results in cachedir and reuse them whenever they are asked for the same plot of the same data again.
+    None switches the cache off
+    """
+    global _cache
+    _cache = ResultCache(cachedir) if cachedir is not None else None
+
+
+def get_result_cache():
+    return _cache
+
+
+@contextlib.contextmanager
+def using_result_cache(cache):
+    """
+    Context in which the builders use cache, a ResultCache or None, and after which the previous cache is restored.
+    Objects with a cache of their own (see PMSSM.settingsContext) run their builders in it, so that they do not change the cache of each other
+    """
+    global _cache
+    previous, _cache = _cache, cache
+    try:
+        yield cache
+    finally:
+        _cache = previous
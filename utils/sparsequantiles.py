@@ -0,0 +1,112 @@
+import numpy as np
+from utils.mapreduce import HistogramAccumulator
+from utils.quantiles import normalised_weights
+
+# binned quantiles of the values in every cell, stored sparsely: the summed weight of every occupied (cell, value bin) pair, where the value bins have equal width in log10 of the value.
+# This is the z-axis of the former TH3F of the 2D quantile plots (mkhistlogxyz with 3000 bins), but only for the cells and value bins that hold points, and without a range.
+# The pMSSM scan is concentrated in small mass regions, so most cells of a fine (x,y) grid are empty, and the memory grows with the occupied cells instead of with the grid or the points
+
+# keys are cell << 32 | (value bin + _offset), so that sorting the keys sorts by cell and then by value
+_offset = 2**31
+# value bin of the values that are not positive, whose logarithm is not defined. Its quantile is 0
+_nonpositive = -_offset
+
+
+def value_bins(values, resolution):
+    """
+    Returns the value bin of every value: floor(resolution * log10(value)) for positive values, _nonpositive for the others
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bins = np.clip(np.floor(resolution * np.log10(values)), _nonpositive + 1, _offset - 1)  # infinite values go to the last bin
+    return np.where(values > 0, bins, _nonpositive).astype(np.int64)
+
+
+def sparse_quantiles(keys, weights, ncells, resolution, probs):
+    """
+    Quantiles of the binned values of every cell. The q-quantile falls into the first value bin of the cell at which the cumulative weight reaches q times the total weight of the cell,
+    and is interpolated linearly in log10 of the value within this bin. Returns an array of shape (ncells, len(probs)), NaN for cells without points
+    @param keys: sorted unique keys of the occupied (cell, value bin) pairs
+    @param weights: summed weight of every key
+    @param resolution: number of value bins per decade
+    """
+    result = np.full((ncells, len(probs)), np.nan)
+    if len(keys) == 0:
+        return result
+    cells = keys >> 32
+    bins = (keys & 0xFFFFFFFF) - _offset
+    weights = normalised_weights(cells, weights)
+    cumweights = np.cumsum(weights)
+    first = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])  # first key of every occupied cell
+    last = np.r_[first[1:], len(keys)] - 1
+    before = cumweights[first] - weights[first]
+    total = cumweights[last] - before
+    for ix, prob in enumerate(probs):
+        target = before + prob * total
+        index = np.clip(np.searchsorted(cumweights, target, side="left"), first, last)  # guards against rounding in the cumulative sum
+        fraction = np.clip((target - cumweights[index] + weights[index]) / weights[index], 0, 1)
+        result[cells[first], ix] = np.where(bins[index] == _nonpositive, 0., 10 ** ((bins[index] + fraction) / resolution))
+    return result
+
+
+class SparseQuantileAccumulator(HistogramAccumulator):
+    """
+    Alternative to QuantileAccumulator (utils/mapreduce.py) and TDigestAccumulator (utils/tdigest.py) that keeps the summed weight of every occupied (cell, value bin) pair.
+    Its memory is bounded by the number of occupied cells times the value bins their points span, plus a buffer of points, whatever the number of points or the size of the grid.
+    Accumulators filled on different chunks or files merge exactly. The quantiles have a relative precision of about 2.3/resolution
+    """
+    def __init__(self, variables, edges, value, weight, resolution=1000, buffersize=1000000):
+        """
+        @param variables: list of the expressions on the axes, in the order x, y
+        @param edges: list of the bin edge arrays of the axes
+        @param value: expression whose quantiles are computed, e.g. the Bayes factor
+        @param weight: weight expression, e.g. the prior weight 1/PickProbability times the selection
+        @param resolution: number of value bins per decade of the value
+        @param buffersize: number of points collected before they are merged into the occupied pairs
+        """
+        HistogramAccumulator.__init__(self, variables, edges, weight)
+        self.value = value
+        self.resolution = resolution
+        self.buffersize = buffersize
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros(0)
+        self.buffer = []
+        self.buffered = 0
+
+    def expressions(self):
+        return self.variables + [self.value, self.weight]
+
+    def fill(self, columns):
+        w = columns[self.weight]
+        values = np.asarray(columns[self.value], dtype=np.float64)
+        selected = (w > 0) & ~np.isnan(values)
+        cells = self.cells([columns[v][selected] for v in self.variables])
+        self.buffer.append(((cells << 32) | (value_bins(values[selected], self.resolution) + _offset), w[selected]))
+        self.buffered += int(selected.sum())
+        if self.buffered > self.buffersize:
+            self.compress()
+
+    def compress(self):
+        if not self.buffer:
+            return
+        keys, weights = [np.concatenate(c) for c in zip((self.keys, self.weights), *self.buffer)]
+        self.buffer, self.buffered = [], 0
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.weights = np.bincount(inverse, weights, minlength=len(self.keys))
+
+    def __getstate__(self):
+        # only the occupied pairs are sent between processes, not the buffered points
+        self.compress()
+        return self.__dict__
+
+    def merge(self, other):
+        other.compress()
+        self.buffer.append((other.keys, other.weights))
+        self.compress()
+        return self
+
+    def quantiles(self, probs):
+        """
+        Returns the binned weighted quantiles of the value in every cell, of shape (ncells, len(probs)), NaN for cells without points
+        """
+        self.compress()
+        return sparse_quantiles(self.keys, self.weights, len(self.sumw), self.resolution, probs)
@@ -0,0 +1,90 @@
+import numpy as np
+from utils.fill import find_bins
+from utils.histarrays import set_hist_state
+
+# 1D survival probabilities of several x variables and signal strength variations from one pass over the tree.
+# The zscore expressions of utils/constraints.py evaluate TMath::Log of the Bayes factor three times per point and are drawn once per variation and per variable.
+# Here only the Bayes factors are read, one per variation, and the z-score of every point is computed once from them in numpy,
+# so the logarithm is taken once per point and variation and the survival cuts are shared by the histograms of all variables
+
+# a point survives if its z-score is above this value, as in the "(zscore>-1.64)" cuts of the survival probability plots
+zcut = -1.64
+
+
+def zscores(bayesfactors):
+    """
+    Returns the z-scores of an array of Bayes factors, the same values as the zscore expressions of utils/constraints.py: |log B|/log B * sqrt(2|log B|).
+    As TTreeFormula divides 0 by 0 into 0, a Bayes factor of 1 has a z-score of 0 and survives the cut
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logb = np.log(np.asarray(bayesfactors, dtype=np.float64))
+        sign = np.divide(np.abs(logb), logb, out=np.zeros(logb.shape), where=logb != 0)
+        return sign * np.sqrt(2 * np.abs(logb))
+
+
+class SurvivalAccumulator:
+    """
+    Sums of the prior weights and of the surviving posterior weights, per bin of the 1D binnings of several variables. The surviving weights are those of the points
+    whose z-score for a Bayes factor variation is above zcut, one set per variation. Fills and merges like the accumulators of utils/mapreduce.py
+    """
+    def __init__(self, variables, edges, prior, weight, bayesfactors):
+        """
+        @param variables: list of the expressions on the x-axes, one histogram set per variable
+        @param edges: list of the bin edge arrays, one per variable
+        @param prior: weight expression of the prior
+        @param weight: weight expression of the posterior, without the survival cut
+        @param bayesfactors: list of the Bayes factor expressions, one per variation, e.g. the nominal, +50% and -50% signal cross sections
+        """
+        self.variables = list(variables)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.prior = prior
+        self.weight = weight
+        self.bayesfactors = list(bayesfactors)
+        nweights = 1 + len(self.bayesfactors)
+        # per variable: the prior in row 0, then one row per variation, each with the underflow and overflow bins as hist_array
+        self.sumw = [np.zeros((nweights, len(e) + 1)) for e in self.edges]
+        self.sumw2 = [np.zeros((nweights, len(e) + 1)) for e in self.edges]
+        self.entries = np.zeros(nweights, dtype=np.int64)
+        self.total = np.zeros(nweights)
+
+    def expressions(self):
+        return self.variables + [self.prior, self.weight] + self.bayesfactors
+
+    def fill(self, columns):
+        """
+        @param columns: dictionary mapping the expressions of this accumulator to arrays of the same length
+        """
+        prior = columns[self.prior]
+        w = columns[self.weight]
+        weights = np.zeros((1 + len(self.bayesfactors), len(w)))
+        weights[0] = prior
+        # z-scores only of the points with a posterior weight, once per variation
+        posterior = np.flatnonzero(w != 0)
+        for row, bayesfactor in enumerate(self.bayesfactors, 1):
+            weights[row, posterior] = w[posterior] * (zscores(columns[bayesfactor][posterior]) > zcut)
+        self.total += weights.sum(axis=1)
+        self.entries += np.count_nonzero(weights, axis=1)
+        selected = np.any(weights != 0, axis=0)
+        weights = weights[:, selected]
+        rows = np.arange(len(weights))[:, None]
+        for index, (variable, edges) in enumerate(zip(self.variables, self.edges)):
+            ncells = len(edges) + 1
+            cells = (rows * ncells + find_bins(edges, columns[variable][selected])[None, :]).ravel()
+            self.sumw[index] += np.bincount(cells, weights.ravel(), minlength=len(weights) * ncells).reshape(len(weights), ncells)
+            self.sumw2[index] += np.bincount(cells, (weights * weights).ravel(), minlength=len(weights) * ncells).reshape(len(weights), ncells)
+
+    def merge(self, other):
+        for index in range(len(self.variables)):
+            self.sumw[index] += other.sumw[index]
+            self.sumw2[index] += other.sumw2[index]
+        self.entries += other.entries
+        self.total += other.total
+        return self
+
+    def fill_hists(self, index, hists):
+        """
+        Sets the bin contents and squared weights of the histograms of variable index to the accumulated sums, as if they had been filled entry by entry. Sumw2 is enabled on them
+        @param hists: list of the prior histogram followed by one histogram per variation, of the binning of the variable
+        """
+        for row, hist in enumerate(hists):
+            set_hist_state(hist, self.sumw[index][row], self.sumw2[index][row], int(self.entries[row]))
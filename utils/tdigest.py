@@ -0,0 +1,139 @@
+import numpy as np
+from utils.mapreduce import HistogramAccumulator
+from utils.quantiles import normalised_weights
+
+# t-digests (Dunning, "Computing extremely accurate quantiles using t-digests") of the values in every cell of a histogram, all cells at once.
+# A digest is a list of centroids (mean, weight) sorted by mean, small near the tails and large in the middle of the distribution. Their number per cell
+# is bounded by about compression/2, independent of the number of points, and two digests are merged by compressing their centroids together
+
+
+def compress(cells, means, weights, compression):
+    """
+    Merges the centroids of every cell into t-digest centroids. Centroids whose cumulative weight midpoints fall into the same unit of the
+    scale function k(q) = compression/(2 pi) * asin(2q-1) are merged. Returns the cells, means and weights of the merged centroids, sorted by cell and mean
+    @param cells: cell index of every centroid
+    @param means: mean of every centroid. Single points are centroids of their own
+    @param weights: weight of every centroid, positive
+    @param compression: the larger, the more centroids are kept and the more precise the quantiles
+    """
+    order = np.lexsort((means, cells))
+    cells, means, weights = cells[order], means[order], weights[order]
+    if len(cells) == 0:
+        return cells, means, weights
+    fractions = normalised_weights(cells, weights)
+    cumweights = np.cumsum(fractions)
+    first = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])  # first centroid of every cell
+    last = np.r_[first[1:], len(cells)] - 1
+    before = np.repeat(cumweights[first] - fractions[first], last - first + 1)
+    total = np.repeat(cumweights[last], last - first + 1) - before
+    q = (cumweights - fractions / 2 - before) / total
+    k = np.floor(compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+    group = np.cumsum(np.r_[True, (cells[1:] != cells[:-1]) | (k[1:] != k[:-1])]) - 1
+    merged = np.bincount(group, weights)
+    return cells[np.r_[True, group[1:] != group[:-1]]], np.bincount(group, weights * means) / merged, merged
+
+
+def digest_quantiles(cells, means, weights, mins, maxs, ncells, probs):
+    """
+    Quantiles of the digests of every cell, interpolating linearly between the centroid centres and towards the smallest and largest value of the cell.
+    Returns an array of shape (ncells, len(probs)), NaN for cells without centroids
+    @param cells, means, weights: centroids as returned by compress
+    @param mins, maxs: smallest and largest value of every cell
+    """
+    if len(weights) == 0:
+        return np.full((ncells, len(probs)), np.nan)  # e.g. constraints that select no point
+    fractions = normalised_weights(cells, weights)
+    cumweights = np.cumsum(fractions)
+    centers = cumweights - fractions / 2
+    starts = np.searchsorted(cells, np.arange(ncells), side="left")
+    ends = np.searchsorted(cells, np.arange(ncells), side="right")
+    filled = ends > starts
+    before = np.where(starts > 0, cumweights[np.maximum(starts - 1, 0)], 0.)
+    total = np.where(filled, cumweights[np.maximum(ends - 1, 0)] - before, 0.)
+    s, e = np.minimum(starts, len(means) - 1), np.maximum(ends - 1, 0)
+
+    result = np.full((ncells, len(probs)), np.nan)
+    for ix, prob in enumerate(probs):
+        target = before + prob * total
+        index = np.clip(np.searchsorted(centers, target, side="left"), starts, ends)  # first centroid centre at or above the target
+        lo, hi = np.maximum(index - 1, s), np.minimum(index, e)
+        x0 = np.where(index == starts, before, centers[lo])
+        x1 = np.where(index == ends, before + total, centers[hi])
+        y0 = np.where(index == starts, mins, means[lo])
+        y1 = np.where(index == ends, maxs, means[hi])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            value = np.where(x1 > x0, y0 + (y1 - y0) * (target - x0) / (x1 - x0), y0)
+        result[filled, ix] = value[filled]
+    return result
+
+
+class TDigestAccumulator(HistogramAccumulator):
+    """
+    Alternative to QuantileAccumulator (utils/mapreduce.py) that keeps a t-digest of the values per cell instead of every point. Its memory is bounded by the number of cells
+    times the compression, plus a buffer of points, whatever the number of points, and digests filled on different chunks or files merge. The quantiles are approximate,
+    with the best relative precision in the tails (e.g. the 99th percentile)
+    """
+    def __init__(self, variables, edges, value, weight, compression=100, buffersize=1000000):
+        """
+        @param variables: list of the expressions on the axes, in the order x, y
+        @param edges: list of the bin edge arrays of the axes
+        @param value: expression whose quantiles are computed, e.g. the Bayes factor
+        @param weight: weight expression, e.g. the prior weight 1/PickProbability times the selection
+        @param compression: t-digest compression, about twice the number of centroids kept per cell
+        @param buffersize: number of points collected before they are merged into the digests
+        """
+        HistogramAccumulator.__init__(self, variables, edges, weight)
+        self.value = value
+        self.compression = compression
+        self.buffersize = buffersize
+        ncells = len(self.sumw)
+        self.mins = np.full(ncells, np.inf)
+        self.maxs = np.full(ncells, -np.inf)
+        self.centroids = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+        self.buffer = []
+        self.buffered = 0
+
+    def expressions(self):
+        return self.variables + [self.value, self.weight]
+
+    def fill(self, columns):
+        w = columns[self.weight]
+        selected = w > 0
+        self.buffer.append((self.cells([columns[v][selected] for v in self.variables]), np.asarray(columns[self.value][selected], dtype=np.float64), w[selected]))
+        self.buffered += int(selected.sum())
+        if self.buffered > self.buffersize:
+            self.compress()
+
+    def compress(self):
+        if not self.buffer:
+            return
+        cells, means, weights = [np.concatenate(c) for c in zip(self.centroids, *self.buffer)]
+        self.buffer, self.buffered = [], 0
+        self.centroids = compress(cells, means, weights, self.compression)
+        # the first and last centroid of a cell are either new points or centroids of older points, whose extremes are already in mins and maxs
+        cells, means = self.centroids[0], self.centroids[1]
+        if len(cells):
+            first = np.r_[True, cells[1:] != cells[:-1]]
+            last = np.r_[cells[1:] != cells[:-1], True]
+            self.mins[cells[first]] = np.minimum(self.mins[cells[first]], means[first])
+            self.maxs[cells[last]] = np.maximum(self.maxs[cells[last]], means[last])
+
+    def __getstate__(self):
+        # only the digests are sent between processes, not the buffered points
+        self.compress()
+        return self.__dict__
+
+    def merge(self, other):
+        other.compress()
+        self.mins = np.minimum(self.mins, other.mins)
+        self.maxs = np.maximum(self.maxs, other.maxs)
+        self.buffer.append(other.centroids)
+        self.compress()
+        return self
+
+    def quantiles(self, probs):
+        """
+        Returns the approximate weighted quantiles of the value in every cell, of shape (ncells, len(probs)), NaN for cells without points
+        """
+        self.compress()
+        return digest_quantiles(*self.centroids, self.mins, self.maxs, len(self.sumw), probs)
@@ -1,8 +1,10 @@
-from ROOT import *
 from array import array
+from utils.binning import Binning, binning
+from utils.numpyhist import NumpyHist, histogram_backend
+from utils.colors import kWhite, kBlue
+
+# ROOT is imported by the functions that make ROOT objects, and not at import, so that the numpy histogram backend and the statistics engines run without it
 
-tl = TLatex()
-tl.SetNDC()
 cmsTextFont = 61
 extraTextFont = 52
 lumiTextSize = 0.6
@@ -10,143 +12,49 @@ lumiTextOffset = 0.2
 cmsTextSize = 0.75
 cmsTextOffset = 0.1
 regularfont = 42
-originalfont = tl.GetTextFont()
 epsi = "#scale[1.3]{#font[122]{e}}"
 
+_tl = None
+
+
+def get_latex():
+    """
+    Returns the shared TLatex in NDC coordinates. It is created on first use, so importing this module does not initialise the ROOT graphics
+    """
+    global _tl
+    if _tl is None:
+        from ROOT import TLatex
+        _tl = TLatex()
+        _tl.SetNDC()
+    return _tl
+
 
+def __getattr__(name):
+    # tl and originalfont used to be created at import
+    if name == "tl":
+        return get_latex()
+    if name == "originalfont":
+        return get_latex().GetTextFont()
+    raise AttributeError("module " + __name__ + " has no attribute " + name)
+
+
+def mkhist(name, title, *binnings, backend=None):
+    """
+    Returns a TH1F, TH2F or TH3F with the binnings (see utils/binning.py) of its x, y and z axes, or a NumpyHist if the histogram backend is "numpy" (see utils/numpyhist.py)
+    """
+    if (backend or histogram_backend()) == "numpy":
+        return NumpyHist(name, title, list(binnings))
+    from ROOT import TH1F, TH2F, TH3F
+    axes = []
+    for axis in binnings:
+        axes += [axis.nbins, axis.edges.copy()]  # the shared edges are read-only, ROOT copies them anyway
+    return {1: TH1F, 2: TH2F, 3: TH3F}[len(binnings)](name, title, *axes)
 def mkhistlogx(name, title, nbins, xmin, xmax,logx=True):
-    if logx:
-    
-        if xmin == 0:
-            logxmin = 0
-        else:                
-            logxmin = TMath.Log10(xmin)
-        if xmax == 0:
-            logxmax = 0
-        else:
-            logxmax = TMath.Log10(xmax)
-    else:
-        logxmin=xmin
-        logxmax=xmax
-    binwidth = (logxmax-logxmin)/nbins
-    xbins = array('d',[0]*(nbins+1))##might need to be defined out as 0's
-    #xbins[0] = TMath.Power(10,logxmin)#xmin
-    for i in range(0,nbins+1):
-        if logx:
-            xbins[i] =  TMath.Power(10,logxmin+i*binwidth)
-        else:
-            xbins[i]= xmin + i*binwidth
-
-#    print ('xbins', xbins )       
-    h = TH1F(name,title,nbins,xbins)
-    return h
+    return mkhist(name, title, binning(nbins, xmin, xmax, logx))
 def mkhistlogxy(name, title, nbinsx, xmin, xmax,nbinsy,ymin,ymax,logx=True,logy=True):
-    if logx:
-        if xmin == 0:
-            logxmin = 0
-        else:                
-            logxmin = TMath.Log10(xmin)
-        if xmax == 0:
-            logxmax = 0
-        else:
-            logxmax = TMath.Log10(xmax)
-    else:
-        logxmin=xmin
-        logxmax=xmax
-    if logy:
-        if ymin == 0:
-            logymin = 0
-        else:                
-            logymin = TMath.Log10(ymin)
-        if ymax == 0:
-            logymax = 0
-        else:
-            logymax = TMath.Log10(ymax)
-    else:
-        logymin=ymin
-        logymax=ymax
-    binwidthx = float(logxmax-logxmin)/nbinsx
-    binwidthy = float(logymax-logymin)/nbinsy
-    xbins = array('d',[0]*(nbinsx+1))##might need to be defined out as 0's
-    ybins = array('d',[0]*(nbinsy+1))##might need to be defined out as 0's
-    #xbins[0] = TMath.Power(10,logxmin)#xmin
-    for i in range(0,nbinsx+1):
-        if logx:
-            xbins[i] = 0 + TMath.Power(10,logxmin+i*binwidthx)
-        else:
-            xbins[i]= xmin + i*binwidthx
-    for i in range(0,nbinsy+1):
-        if logy:
-            ybins[i] = 0 + TMath.Power(10,logymin+i*binwidthy)
-        else:
-            ybins[i] = ymin + i*binwidthy
-#    print 'xbins', xbins[0],xbins[-1]
-#    print 'ybins', ybins
-    h = TH2F(name,title,nbinsx,xbins,nbinsy,ybins)
-    return h
+    return mkhist(name, title, binning(nbinsx, xmin, xmax, logx), binning(nbinsy, ymin, ymax, logy))
 def mkhistlogxyz(name, title, nbinsx, xmin, xmax,nbinsy,ymin,ymax,nbinsz,zmin,zmax,logx=True,logy=True,logz=True):
-    if logx:
-        if xmin == 0:
-            logxmin = 0
-        else:                
-            logxmin = TMath.Log10(xmin)
-        if xmax == 0:
-            logxmax = 0
-        else:
-            logxmax = TMath.Log10(xmax)
-    else:
-        logxmin=xmin
-        logxmax=xmax
-    if logy:
-        if ymin == 0:
-            logymin = 0
-        else:                
-            logymin = TMath.Log10(ymin)
-        if ymax == 0:
-            logymax = 0
-        else:
-            logymax = TMath.Log10(ymax)
-    else:
-        logymin=ymin
-        logymax=ymax
-    if logz:
-        if zmin == 0:
-            logzmin = 0
-        else:                
-            logzmin = TMath.Log10(zmin)
-        if zmax == 0:
-            logzmax = 0
-        else:
-            logzmax = TMath.Log10(zmax)
-    else:
-        logzmin=zmin
-        logzmax=zmax
-    binwidthx = float(logxmax-logxmin)/nbinsx
-    binwidthy = float(logymax-logymin)/nbinsy
-    binwidthz = float(logzmax-logzmin)/nbinsz
-    xbins = array('d',[0]*(nbinsx+1))##might need to be defined out as 0's
-    ybins = array('d',[0]*(nbinsy+1))##might need to be defined out as 0's
-    zbins = array('d',[0]*(nbinsz+1))##might need to be defined out as 0's
-    #xbins[0] = TMath.Power(10,logxmin)#xmin
-    for i in range(0,nbinsx+1):
-        if logx:
-            xbins[i] = TMath.Power(10,logxmin+i*binwidthx)
-        else:
-            xbins[i]= xmin + i*binwidthx
-    for i in range(0,nbinsy+1):
-        if logy:
-            ybins[i] =  TMath.Power(10,logymin+i*binwidthy)
-        else:
-            ybins[i] = ymin + i*binwidthy
-    for i in range(0,nbinsz+1):
-        if logz:
-            zbins[i] =  TMath.Power(10,logzmin+i*binwidthz)
-        else:
-            zbins[i] = zmin + i*binwidthz
-#    print 'xbins', xbins[0],xbins[-1]
-#    print 'ybins', ybins        
-    h = TH3F(name,title,nbinsx,xbins,nbinsy,ybins,nbinsz,zbins)
-    return h
+    return mkhist(name, title, binning(nbinsx, xmin, xmax, logx), binning(nbinsy, ymin, ymax, logy), binning(nbinsz, zmin, zmax, logz))
 
 def histoStyler(h,color = kBlue,fill = False,linestyle = 1,linewidth = 3,fillstyle = 3009,markerstyle = 1,markersize = 1):
     h.SetLineWidth(linewidth)
@@ -200,6 +108,7 @@ def graphStyler(g,color,width = 2,mstyle = 8):
     g.GetYaxis().SetTitleOffset(1.05)
     
 def mkcanvas(name,left=0.14,right=False,top=0.22,bottom=0.15):
+    from ROOT import TCanvas
     c1 = TCanvas(name,name,700,630)
     
     c1.SetBottomMargin(bottom)
@@ -213,6 +122,7 @@ def mkcanvas(name,left=0.14,right=False,top=0.22,bottom=0.15):
     return c1
 
 def mkcanvas_wide(name):
+    from ROOT import TCanvas
     c1 = TCanvas(name,name,1200,700)
     c1.Divide(2,1)
     c1.GetPad(1).SetBottomMargin(.14)
@@ -228,6 +138,7 @@ def mkcanvas_wide(name):
     return c1
 
 def mklegend(x1=.27, y1=.72, x2=.74, y2=.88, color=kWhite):
+    from ROOT import TLegend
     lg = TLegend(x1, y1, x2, y2)
     lg.SetFillColor(color)
     lg.SetTextFont(42)
@@ -250,6 +161,7 @@ def namewizard(name):
 
 
 def mkEfficiencies(hPassList, hAllList):
+    from ROOT import TGraphAsymmErrors
     gEffList = []
     for i in range(len(hPassList)):
         hPassList[i].Sumw2()
@@ -261,6 +173,7 @@ def mkEfficiencies(hPassList, hAllList):
     return gEffList
 
 def mkEfficiencyRatio(hPassList, hAllList,hName = 'hRatio'):#for weighted MC, you need TEfficiency!
+    from ROOT import TGraphAsymmErrors, TCanvas
     hEffList = []
     for i in range(len(hPassList)):
         hPassList[i].Sumw2()
@@ -307,6 +220,7 @@ def pause(str_='push enter key when ready'):
 
 datamc = 'MC'
 def stamp(lumi = 35.9):    
+    tl = get_latex()
     tl.SetTextFont(cmsTextFont)
     tl.SetTextSize(1.2*tl.GetTextSize())
     tl.DrawLatex(0.155,0.93, 'CMS')
@@ -329,7 +243,7 @@ def mkcdf(hist, minbin=1):
     return c
 
 def mkroc(name, hsig, hbkg, lcolor=kBlue, lwidth=2, ndivx=505, ndivy=505):
-    from array import array
+    from ROOT import TGraph
     csig = mkcdf(hsig)
     cbkg = mkcdf(hbkg)
     npts = len(csig)
@@ -356,6 +270,7 @@ def mkroc(name, hsig, hbkg, lcolor=kBlue, lwidth=2, ndivx=505, ndivy=505):
 
     
 def calcTrackIso(trk, tracks):
+    from ROOT import TMath
     ptsum =  -trk.pt()
     for track in tracks:
         dR = TMath.Sqrt( (trk.eta()-track.eta())**2 + (trk.phi()-track.phi())**2)
@@ -363,12 +278,14 @@ def calcTrackIso(trk, tracks):
     return ptsum/trk.pt()
 
 def calcTrackJetIso(trk, jets):
+    from ROOT import TMath
     for jet in jets:
         if not jet.pt()>30: continue
         if  TMath.Sqrt( (trk.eta()-jet.eta())**2 + (trk.phi()-jet.phi())**2)<0.5: return False
     return True
 
 def calcMiniIso(trk, tracks):
+    from ROOT import TMath
     pt = trk.pt()
     ptsum = -pt
     if pt<=50: R = 0.2
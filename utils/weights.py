@@ -0,0 +1,75 @@
+import warnings
+import numpy as np
+from utils.constraints import theconstraints, zscore, vary_signal_strength, get_constraintstrings
+from utils.columns import ColumnStore, build_expression_columns, chunksize
+from utils.expressions import referenced_branches
+
+# analyses for which weight columns are precomputed by default: every entry of theconstraints that is a Bayes factor
+analyses = [key for key in theconstraints if key.startswith("cms_") or key.startswith("combined")]
+
+# weights and z-scores are stored in double precision, so that plots from the columns are the same as from the expressions (a Bayes factor exp(llhd difference)
+# overflows single precision above 3.4E38, and rounding moves points across the z-score cut). The prior is stored once for all analyses, so single precision would save little. The survival flags are stored as bytes
+_dtypes = {"prior": np.float64, "bayesfactor": np.float64, "posterior": np.float64, "zscore": np.float64, "survived": np.uint8}
+
+# stored in the manifest of the weight columns. Stores of an older version are rebuilt by PMSSM.addWeightColumns.
+# 2: double precision, and the z-scores and survival flags of Bayes factors of 1 evaluated as by TTreeFormula (z-score 0, survived), see utils/expressions.py
+version = 2
+
+
+def weight_expressions(analysis):
+    """
+    Returns the per-point weight expressions of an analysis, with the exact strings the builders in utils/plots.py construct, keyed by
+    prior, bayesfactor, posterior, zscore and survived (z-score above -1.64), each of the last four also with an _up and _down variant for signal strengths of 1.5 and 0.5.
+    The z-score entries only exist for analyses in zscore
+    @param analysis: key of theconstraints
+    """
+    prior, posterior = get_constraintstrings(analysis, bayesfactor=theconstraints[analysis])
+    expressions = {"prior": prior}
+    for variation in ["", "up", "down"]:
+        suffix = "_" + variation if variation else ""
+        expressions["bayesfactor" + suffix] = vary_signal_strength(theconstraints[analysis], variation)
+        expressions["posterior" + suffix] = vary_signal_strength(posterior, variation)
+        if analysis in zscore:
+            z = vary_signal_strength(zscore[analysis], variation)
+            expressions["zscore" + suffix] = z
+            expressions["survived" + suffix] = "(" + z + ">-1.64)"
+    return expressions
+
+
+def build_weight_columns(source, cachedir, analyses=analyses, chunksize=chunksize):
+    """
+    Precomputes the weight columns of weight_expressions for a list of analyses in one pass, and stores them as a column store next to the tree columns.
+    Attached with ColumnStore.add_friend, every builder in utils/plots.py reads these columns whenever it asks for one of these expressions, instead of recomputing the Bayes factors per point.
+    Columns are named <analysis>__<weight>. Expressions shared by several analyses, such as the prior, are stored once. Analyses whose likelihood branches are not in the source are skipped with a warning. Returns the opened ColumnStore
+    @param source: ROOT tree or ColumnStore from which to operate
+    @param cachedir: directory in which the columns are written
+    @param analyses: list of keys of theconstraints
+    @param chunksize: maximal number of entries evaluated at once
+    """
+    expressions, dtypes, stored = {}, {}, set()
+    for analysis in analyses:
+        branches = referenced_branches(weight_expressions(analysis).values())
+        if isinstance(source, ColumnStore):
+            missing = [branch for branch in branches if not source.has_branch(branch)]
+        else:
+            missing = [branch for branch in branches if not source.GetLeaf(branch)]
+        if missing:
+            warnings.warn("No weight columns for " + analysis + ", missing branches: " + ", ".join(missing))
+            continue
+        for kind, expression in weight_expressions(analysis).items():
+            if expression in stored:
+                continue
+            stored.add(expression)
+            name = analysis + "__" + kind
+            expressions[name] = expression
+            dtypes[name] = _dtypes[kind.split("_")[0]]
+    return build_expression_columns(source, cachedir, expressions, dtypes, chunksize, metadata={"weights": version})
+
+
+def outdated(store):
+    """
+    Whether a column store of weight columns was written by an earlier version of build_weight_columns, e.g. in single precision or with the survival flags of Bayes factors of 1 unset.
+    Such stores are rebuilt by PMSSM.addWeightColumns
+    @param store: ColumnStore written by build_weight_columns
+    """
+    return store.manifest.get("metadata", {}).get("weights", 1) < version